@@ -1,40 +1,48 @@
 import os
-from typing import Generator
+from typing import AsyncGenerator
 from fastapi import Depends, HTTPException, status, Header
 from fastapi.security import OAuth2PasswordBearer,HTTPBearer,HTTPAuthorizationCredentials
 from jose import jwt, JWTError
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from app.core.config import settings
+from app.core.metrics import instrument_engine
+from app.core.principal_cache import Principal, principal_cache
+from app.core.token_store import token_store
 from app.models.schemas import TokenData
 from sqlalchemy.exc import OperationalError
 # Cấu hình kết nối DB
 # Sử dụng getattr để tránh lỗi nếu settings chưa load xong
+# [NÂNG CẤP] Async Engine (psycopg 3 async): truy vấn không chặn Event Loop
 db_url = getattr(settings, "DATABASE_URL", None)
 engine = None
 if db_url:
-    engine = create_engine(
+    engine = create_async_engine(
         db_url,
-        connect_args={"connect_timeout": 1}, # Timeout 2s là đủ
-        pool_size=10,
-        max_overflow=20,
+        connect_args={
+            "connect_timeout": settings.DB_CONNECT_TIMEOUT,
+            # Chặn các truy vấn chạy quá lâu giữ connection của pool
+            "options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}",
+        },
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT, # Chờ tối đa N giây để lấy connection từ pool
+        pool_recycle=settings.DB_POOL_RECYCLE,
         pool_pre_ping=True # Tự động ping lại nếu kết nối rớt
     )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    instrument_engine(engine) # [MỚI] Latency từng câu lệnh SQL -> /metrics
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 security = HTTPBearer()
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v2/auth/login")
-def get_db() -> Generator:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     if not engine:
         raise HTTPException(500, "Database URL chưa được cấu hình.")
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 # --- 1. XÁC THỰC NGƯỜI DÙNG (AUTHENTICATION) ---
 # --- 1. XÁC THỰC NGƯỜI DÙNG ---
-async def get_current_user(token_obj: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def get_current_user(token_obj: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)):
     # Định nghĩa lỗi chung để tái sử dụng
     auth_error = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -49,6 +57,9 @@ async def get_current_user(token_obj: HTTPAuthorizationCredentials = Depends(sec
         
         if username is None:
             raise auth_error
+        # Chỉ Access Token được dùng làm Bearer (Refresh / Reset token sống lâu hơn nhiều)
+        if payload.get("type") != "access":
+            raise auth_error
         
         # Chỉ map dữ liệu, không cần validate lại bằng Pydantic nếu không cần thiết
         # để tăng tốc độ
@@ -56,28 +67,38 @@ async def get_current_user(token_obj: HTTPAuthorizationCredentials = Depends(sec
     except JWTError:
         raise auth_error
 
-    # Query DB
-    # Không cần try-except ở đây nữa, nếu DB lỗi thì Global Handler ở main.py sẽ bắt
-    # result = db.execute(
-    #     text("SELECT role, is_active FROM users WHERE username = :u"), 
-    #     {"u": username}
-    # ).mappings().fetchone()
-    # Query DB
-    # Lấy đủ thông tin để khớp với UserResponse schema
-    result = db.execute(
-        text("SELECT * FROM users WHERE username = :u"), 
-        {"u": username}
-    ).mappings().fetchone()
+    # [MỚI] Phiên đăng nhập đã bị thu hồi (logout / logout-all / reset mật khẩu) -> chặn Access Token còn hạn
+    sid = payload.get("sid") or payload.get("jti")
+    if sid:
+        try:
+            if await token_store.is_revoked(sid):
+                raise auth_error
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"⚠️ [Token Store Error] {e}")
+
+    # [NÂNG CẤP] Principal cache (RAM -> Redis) -> phần lớn request không chạm tới DB
+    principal = await principal_cache.get(username)
+    if principal is None:
+        snapshot = await principal_cache.snapshot(username)  # Trước khi đọc DB (xem principal_cache.set)
+        # Query DB
+        # Không cần try-except ở đây nữa, nếu DB lỗi thì Global Handler ở main.py sẽ bắt
+        result = (await db.execute(
+            text("SELECT id, username, role, is_active FROM users WHERE username = :u"), 
+            {"u": username}
+        )).mappings().fetchone()
 
-    if result is None:
-        raise auth_error # User không tồn tại
+        if result is None:
+            raise auth_error # User không tồn tại
+        principal = Principal.from_row(result)
+        await principal_cache.set(principal, snapshot)
     
-    if not result['is_active']: 
+    if not principal['is_active']: 
         raise HTTPException(status_code=403, detail="Tài khoản đã bị khóa.")
         
-    # Trả về object có đủ thông tin cần thiết cho các hàm sau
-    # Thêm username vào kết quả trả về để dùng nếu cần
-    return result
+    # Trả về Principal (id / username / role / is_active), truy cập được bằng ['id'] hoặc .id
+    return principal
 # --- 2. PHÂN QUYỀN ADMIN (RBAC) ---
 async def get_current_admin(current_user = Depends(get_current_user)):
     if current_user['role'] != "admin":
@@ -1,23 +1,18 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
+import asyncio
 import os
 import uuid
 # Import dependency bảo mật (nếu muốn bảo vệ API này)
 from app.api.deps import verify_admin 
+from app.core.clients import qdrant_slot
+from app.core.config import settings
 from app.services.embedding_bge_service import get_bge_service
 
 router = APIRouter()
 
-# Config
-QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
-QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
-# Dùng tên collection mới hỗ trợ Hybrid
-COLLECTION_NAME = os.getenv("COLLECTION_NAME", "gym_food_hybrid_v1")
-
-qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-embedder = get_bge_service()
+# [NÂNG CẤP] Client Qdrant + tên collection lấy từ cấu hình hiện tại (Hot Reload),
+# embedder lấy khi cần (không load model lúc import)
 
 class NewFoodItem(BaseModel):
     name: str
@@ -33,6 +28,8 @@ async def add_food_knowledge(item: NewFoodItem, dependencies=[Depends(verify_adm
     """
     Admin API: Thêm món ăn mới vào trí tuệ của AI (Chuẩn Hybrid).
     """
+    from qdrant_client.http import models  # Import khi cần (SDK nặng, không cần lúc khởi động)
+
     try:
         gym_advice = ""
         if item.protein > 20: gym_advice = "Giàu protein, tốt cho tăng cơ."
@@ -48,34 +45,35 @@ async def add_food_knowledge(item: NewFoodItem, dependencies=[Depends(verify_adm
 
         # --- [SỬA ĐỔI QUAN TRỌNG] TẠO HYBRID VECTOR ---
         # 1. Vector Ngữ nghĩa (Dense)
-        dense_vector = embedder.embed_dense(content)
-        
         # 2. Vector Từ khóa (Sparse) - Cần thiết cho Hybrid Search
-        sparse_vector = embedder.embed_sparse(content)
+        # Load model / encode ở thread + worker pool -> không chặn event loop
+        embedder = await asyncio.to_thread(get_bge_service)
+        dense_vector, sparse_vector = await embedder.aembed_hybrid(content)
 
         point_id = str(uuid.uuid4())
         
         # 3. Lưu vào Qdrant với cấu trúc Named Vectors
-        qdrant_client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=[
-                models.PointStruct(
-                    id=point_id,
-                    # Cấu trúc này bắt buộc phải khớp với lúc tạo collection
-                    vector={
-                        "dense": dense_vector,
-                        "sparse": sparse_vector.as_object() 
-                    },
-                    payload={
-                        "name": item.name,
-                        "content": content,
-                        "protein_g": item.protein,
-                        "kcal": item.calories,
-                        "is_admin_added": True
-                    }
-                )
-            ]
-        )
+        with qdrant_slot.lease() as qdrant:
+            qdrant.upsert(
+                collection_name=settings.COLLECTION_NAME,
+                points=[
+                    models.PointStruct(
+                        id=point_id,
+                        # Cấu trúc này bắt buộc phải khớp với lúc tạo collection
+                        vector={
+                            "dense": dense_vector,
+                            "sparse": sparse_vector.as_object() 
+                        },
+                        payload={
+                            "name": item.name,
+                            "content": content,
+                            "protein_g": item.protein,
+                            "kcal": item.calories,
+                            "is_admin_added": True
+                        }
+                    )
+                ]
+            )
 
         return {
             "status": "success", 
@@ -1,28 +1,31 @@
-from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from jose import jwt, JWTError
 
-from app.api.deps import get_db, get_current_user
-from app.core.security import create_reset_token, verify_password, get_password_hash, create_access_token, create_refresh_token
+from app.api.deps import get_db, get_current_user, security
+from app.core.rate_limit import limiter
+from app.core.security import create_reset_token, averify_password, aget_password_hash, create_access_token, create_refresh_token
 from app.core.config import settings
+from app.core.principal_cache import principal_cache
+from app.core.token_store import token_store
 from app.models.schemas import PasswordResetConfirm, PasswordResetRequest, Token, UserCreate, UserLogin, UserResponse, RefreshTokenRequest
 
 router = APIRouter()
 
 # 1. ĐĂNG KÝ (Public - Ai cũng tạo được, mặc định là User)
 @router.post("/register", response_model=UserResponse)
-async def register(user_in: UserCreate, db: Session = Depends(get_db)):
+async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check trùng username
-    check = db.execute(text("SELECT 1 FROM users WHERE username=:u OR email=:e"), 
-                       {"u": user_in.username, "e": user_in.email}).fetchone()
+    check = (await db.execute(text("SELECT 1 FROM users WHERE username=:u OR email=:e"), 
+                       {"u": user_in.username, "e": user_in.email})).fetchone()
     if check:
         raise HTTPException(400, "Username hoặc Email đã tồn tại.")
     raw_password = user_in.password
     if len(raw_password.encode('utf-8')) > 72:
         raw_password = raw_password[:72]
-    hashed_pw = get_password_hash(raw_password)
+    hashed_pw = await aget_password_hash(raw_password)
     role = "user" # Mặc định
 
     sql = text("""
@@ -32,38 +35,58 @@ async def register(user_in: UserCreate, db: Session = Depends(get_db)):
     """)
     
     # Thực thi và lấy kết quả trả về
-    new_user = db.execute(sql, {
+    new_user = (await db.execute(sql, {
         "u": user_in.username, 
         "e": user_in.email, 
         "p": hashed_pw, 
         "f": user_in.full_name,
         "r": role, 
         "a": True
-    }).fetchone()
+    })).fetchone()
     
-    db.commit()
+    await db.commit()
     return new_user
 
+def _too_many_attempts(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"Thử đăng nhập quá nhiều lần. Vui lòng thử lại sau {retry_after} giây.",
+        headers={"Retry-After": str(retry_after)},
+    )
+
 # 2. ĐĂNG NHẬP (Trả về Access + Refresh Token)
 # 2. ĐĂNG NHẬP (Hỗ trợ Username hoặc Email)
 @router.post("/login", response_model=Token)
-async def login(form_data: UserLogin = Body(), db: Session = Depends(get_db)):
+async def login(request: Request, form_data: UserLogin = Body(), db: AsyncSession = Depends(get_db)):
+    # [MỚI] Chặn login flood trước khi tốn CPU cho bcrypt
+    # - Theo IP: đếm mọi lần thử
+    # - Theo tài khoản: chỉ đếm lần sai mật khẩu (chống dò mật khẩu 1 tài khoản từ nhiều IP)
+    client_ip = request.client.host if request.client else "unknown"
+    account_key = f"rl:login:user:{form_data.username.strip().lower()}"
+    retry_after = await limiter.hit(f"rl:login:ip:{client_ip}", settings.LOGIN_IP_MAX_ATTEMPTS, settings.LOGIN_IP_WINDOW)
+    if not retry_after:
+        retry_after = await limiter.hit(account_key, settings.LOGIN_ACCOUNT_MAX_FAILURES, settings.LOGIN_ACCOUNT_WINDOW, record=False)
+    if retry_after:
+        raise _too_many_attempts(retry_after)
+
     try:
         # [SỬA ĐỔI] Tìm user theo username HOẶC email
         # form_data.username chứa giá trị người dùng nhập (có thể là tên hoặc email)
-        user = db.execute(
+        user = (await db.execute(
             text("SELECT * FROM users WHERE username = :u OR email = :u"), 
             {"u": form_data.username}
-        ).fetchone()
+        )).fetchone()
         
         # Xử lý giới hạn độ dài mật khẩu (Bcrypt max 72 bytes)
         login_password = form_data.password
         if len(login_password.encode('utf-8')) > 72:
             login_password = login_password[:72]
 
-        # Kiểm tra mật khẩu
-        if not user or not verify_password(login_password, user.password_hash):
+        # Kiểm tra mật khẩu (bcrypt chạy trong thread pool riêng, không chặn Event Loop)
+        if not user or not await averify_password(login_password, user.password_hash):
+            await limiter.hit(account_key, settings.LOGIN_ACCOUNT_MAX_FAILURES, settings.LOGIN_ACCOUNT_WINDOW)
             raise HTTPException(status_code=401, detail="Sai tài khoản hoặc mật khẩu")
+        await limiter.reset(account_key)
         
         # Kiểm tra tài khoản bị khóa
         if not user.is_active:
@@ -71,13 +94,14 @@ async def login(form_data: UserLogin = Body(), db: Session = Depends(get_db)):
 
         # Tạo Token
         # Lưu ý: user.username lấy từ DB để đảm bảo thống nhất trong Token
-        access_token = create_access_token(data={"sub": user.username, "role": user.role})
-        refresh_token = create_refresh_token(data={"sub": user.username})
+        # [NÂNG CẤP] Mỗi lần đăng nhập = 1 phiên (jti) riêng cho thiết bị, Access Token mang sid = jti
+        jti = token_store.new_jti()
+        access_token = create_access_token(data={"sub": user.username, "role": user.role, "sid": jti})
+        refresh_token = create_refresh_token(data={"sub": user.username, "jti": jti})
 
-        # Lưu Refresh Token vào DB
-        db.execute(text("UPDATE users SET refresh_token = :rt WHERE id = :id"), 
-                {"rt": refresh_token, "id": user.id})
-        db.commit()
+        # Lưu Refresh Token vào Redis (không ghi vào bảng users nữa)
+        device = f"{request.headers.get('user-agent', 'unknown')} ({request.client.host if request.client else '?'})"
+        await token_store.add(jti, user.id, user.username, user.role, device)
 
         return {
             "access_token": access_token, 
@@ -92,20 +116,23 @@ async def login(form_data: UserLogin = Body(), db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Lỗi hệ thống khi đăng nhập")
 # 3. LÀM MỚI TOKEN (Khi Access Token hết hạn)
 @router.post("/refresh", response_model=Token)
-async def refresh_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+async def refresh_token(request: RefreshTokenRequest):
     try:
         payload = jwt.decode(request.refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username = payload.get("sub")
+        jti = payload.get("jti")
+        if payload.get("type") != "refresh" or not jti:
+            raise HTTPException(401, "Phiên đăng nhập không hợp lệ (Vui lòng đăng nhập lại)")
         
-        # Kiểm tra trong DB
-        user = db.execute(text("SELECT * FROM users WHERE username = :u"), {"u": username}).fetchone()
+        # [NÂNG CẤP] Kiểm tra trong Redis (O(1)), không chạm bảng users
+        entry = await token_store.get(jti)
         
-        # Nếu token gửi lên KHÁC token trong DB -> Có thể token cũ đã bị thu hồi
-        if not user or user.refresh_token != request.refresh_token:
+        # Không còn trong kho -> Đã đăng xuất / bị thu hồi / hết hạn
+        if not entry or entry["username"] != username:
             raise HTTPException(401, "Phiên đăng nhập không hợp lệ (Vui lòng đăng nhập lại)")
             
         # Cấp mới Access Token
-        new_access_token = create_access_token(data={"sub": user.username, "role": user.role})
+        new_access_token = create_access_token(data={"sub": username, "role": entry["role"], "sid": jti})
         
         return {
             "access_token": new_access_token,
@@ -116,17 +143,43 @@ async def refresh_token(request: RefreshTokenRequest, db: Session = Depends(get_
         raise HTTPException(401, "Refresh Token hết hạn hoặc không hợp lệ")
 
 # 4. ĐĂNG XUẤT
+def _session_id(token_obj: HTTPAuthorizationCredentials) -> str:
+    """Lấy sid (jti của phiên) từ Access Token đã được get_current_user xác thực"""
+    return jwt.get_unverified_claims(token_obj.credentials).get("sid")
+
 @router.post("/logout")
-async def logout(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Xóa refresh token trong DB -> Token cũ bị vô hiệu hóa ngay lập tức
-    db.execute(text("UPDATE users SET refresh_token = NULL WHERE id = :id"), {"id": current_user.id})
-    db.commit()
+async def logout(current_user = Depends(get_current_user), token_obj: HTTPAuthorizationCredentials = Depends(security)):
+    # Thu hồi phiên của thiết bị hiện tại -> Refresh Token + Access Token của phiên bị vô hiệu hóa ngay lập tức
+    sid = _session_id(token_obj)
+    if sid:
+        await token_store.revoke(sid, current_user.id)
+    await principal_cache.invalidate(current_user.username)
     return {"message": "Đăng xuất thành công"}
 
+# 4.1 [MỚI] ĐĂNG XUẤT KHỎI MỌI THIẾT BỊ
+@router.post("/logout-all")
+async def logout_all(current_user = Depends(get_current_user)):
+    count = await token_store.revoke_all(current_user.id)
+    await principal_cache.invalidate(current_user.username)
+    return {"message": f"Đã đăng xuất khỏi {count} thiết bị."}
+
+# 4.2 [MỚI] DANH SÁCH THIẾT BỊ ĐANG ĐĂNG NHẬP
+@router.get("/sessions")
+async def list_login_sessions(current_user = Depends(get_current_user), token_obj: HTTPAuthorizationCredentials = Depends(security)):
+    current_sid = _session_id(token_obj)
+    sessions = await token_store.list_sessions(current_user.id)
+    return [{**s, "current": s["sid"] == current_sid} for s in sessions]
+
 # 5. LẤY THÔNG TIN CÁ NHÂN
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user = Depends(get_current_user)):
-    return current_user
+async def read_users_me(current_user = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # Principal cache chỉ có id/role/is_active -> đọc đủ hồ sơ từ DB
+    user = (await db.execute(
+        text("SELECT id, username, email, role, is_active FROM users WHERE id = :id"), {"id": current_user.id}
+    )).mappings().fetchone()
+    if user is None:
+        raise HTTPException(status_code=404, detail="Người dùng không tồn tại.")
+    return user
 
 
 # --- 5. YÊU CẦU QUÊN MẬT KHẨU (Gửi Email) ---
@@ -134,13 +187,13 @@ async def read_users_me(current_user = Depends(get_current_user)):
 async def forgot_password(
     request: PasswordResetRequest, 
     background_tasks: BackgroundTasks, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Bước 1: Người dùng gửi Email. Hệ thống tạo Link reset.
     """
     # 1. Tìm user qua email
-    user = db.execute(text("SELECT * FROM users WHERE email = :e"), {"e": request.email}).fetchone()
+    user = (await db.execute(text("SELECT * FROM users WHERE email = :e"), {"e": request.email})).fetchone()
     
     # Bảo mật: Dù email không tồn tại, vẫn báo thành công để tránh hacker dò email
     if not user:
@@ -165,7 +218,7 @@ async def forgot_password(
 @router.post("/reset-password")
 async def reset_password_confirm(
     data: PasswordResetConfirm, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Bước 2: Người dùng gửi Token + Mật khẩu mới để cập nhật.
@@ -183,20 +236,23 @@ async def reset_password_confirm(
         raise HTTPException(status_code=400, detail="Token đã hết hạn hoặc bị lỗi.")
 
     # 2. Kiểm tra user tồn tại
-    user = db.execute(text("SELECT * FROM users WHERE email = :e"), {"e": email}).fetchone()
+    user = (await db.execute(text("SELECT * FROM users WHERE email = :e"), {"e": email})).fetchone()
     if not user:
         raise HTTPException(status_code=404, detail="Người dùng không tồn tại.")
 
     # 3. Hash mật khẩu mới
     # (Nhớ xử lý vụ 72 bytes nếu cần thiết như ở trên)
-    new_password_hash = get_password_hash(data.new_password)
+    new_password_hash = await aget_password_hash(data.new_password)
 
     # 4. Cập nhật vào DB
     # Đồng thời xóa refresh_token cũ để bắt đăng nhập lại ở mọi nơi
-    db.execute(
+    await db.execute(
         text("UPDATE users SET password_hash = :p, refresh_token = NULL WHERE email = :e"),
         {"p": new_password_hash, "e": email}
     )
-    db.commit()
+    await db.commit()
+    # Thu hồi mọi phiên đăng nhập -> bắt đăng nhập lại ở mọi nơi
+    await token_store.revoke_all(user.id)
+    await principal_cache.invalidate(user.username)
 
     return {"message": "Đổi mật khẩu thành công. Vui lòng đăng nhập lại."}
\ No newline at end of file
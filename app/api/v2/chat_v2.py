@@ -1,34 +1,34 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
 from fastapi.params import Depends
 from pydantic import BaseModel
-from qdrant_client import QdrantClient
-from qdrant_client.http import models  # [QUAN TRỌNG] Import models để dùng Prefetch
+import asyncio
 import os
+import time
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Import Services
 from app.api.deps import get_db
 from app.api.deps import get_current_user
+from app.core.clients import qdrant_slot
+from app.core.config import settings
+from app.core.metrics import CHAT_REQUESTS, V2_STAGES, observe_dependency
 from app.core.response import success_response
 from app.models.schemas import ChatRequest
 from app.services.embedding_bge_service import (
     get_bge_service,
 )  # Dùng service mới đã sửa
 from app.services.history_service import HistoryService
-from app.services.llm_service_fully import get_llm_service
+from app.services.history_writer import history_writer
+from app.services.source_refs import CACHE_HIT_LABEL, build_source_refs
+from app.services.llm_service_fully import llm_slot
 from app.services.cache_service import cache_service
 
 router = APIRouter()
 
-QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
-QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
-# Đảm bảo tên collection khớp với bên admin.py
-COLLECTION_NAME_V2 = os.getenv("COLLECTION_NAME", "gym_food_hybrid_v1")
-
-qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-embedder = get_bge_service()
-llm_service = get_llm_service()
+# [NÂNG CẤP] Qdrant / LLM lấy từ slot Hot Reload (đổi cấu hình không cần restart),
+# tên collection đọc từ settings mỗi request.
+# Embedder lấy qua get_bge_service() khi cần (không load model lúc import)
 # --- [BƯỚC 1] KHAI BÁO SYSTEM PROMPT CỰC ĐOAN TẠI ĐÂY ---
 HARDCORE_SYSTEM_PROMPT = """
 # ROLE & PERSONA
@@ -130,9 +130,8 @@ Sau đó nhân BMR với hệ số (ví dụ: x1.55 nếu tập vừa phải).
 @router.post("/chat")
 async def chat_v2(
     request: ChatRequest,
-    background_tasks: BackgroundTasks,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     API V2 Hybrid Search + Cache + History + Session Management
@@ -144,46 +143,51 @@ async def chat_v2(
         history_service = HistoryService(db_session=db)
         session_id = request.session_id
 
-        # Nếu chưa có session_id, tạo mới ngay lập tức
-        if not session_id:
-            session_id = history_service.create_session(current_user['id'], request.question)
-            chat_history_text = "" # Session mới thì chưa có lịch sử
-        else:
-            # [QUAN TRỌNG] Lấy 10 tin nhắn gần nhất để làm ngữ cảnh
-            raw_history = history_service.get_session_messages(session_id, current_user['id'])
-            # Format thành dạng text để đưa vào Prompt
-            # Ví dụ:
-            # User: Chào bạn
-            # AI: Chào bạn, tôi giúp gì được?
-            history_msgs = []
-            if raw_history:
-                # Lấy 6 tin gần nhất (3 cặp hỏi đáp) để tiết kiệm token nhưng vẫn nhớ
-                for msg in raw_history[-6:]: 
-                    role_name = "User" if msg['role'] == "user" else "AI Coach"
-                    history_msgs.append(f"{role_name}: {msg['content']}")
-            
-            chat_history_text = "\n".join(history_msgs)
+        # [MỚI] Mỗi chặng được đo bằng Histogram (V2_STAGES) -> GET /metrics
+        with V2_STAGES["session"].time():
+            # Nếu chưa có session_id, tạo mới ngay lập tức
+            if not session_id:
+                session_id = await history_service.create_session(current_user['id'], request.question)
+                chat_history_text = "" # Session mới thì chưa có lịch sử
+            else:
+                # [NÂNG CẤP] Chỉ lấy N cặp hỏi đáp gần nhất (Redis ring buffer -> DB LIMIT n)
+                # thay vì tải toàn bộ hội thoại rồi cắt 6 tin cuối
+                recent_turns = await history_service.get_recent_turns(session_id, current_user['id'])
+                # Format thành dạng text để đưa vào Prompt
+                # Ví dụ:
+                # User: Chào bạn
+                # AI: Chào bạn, tôi giúp gì được?
+                history_msgs = []
+                for turn in recent_turns or []:
+                    history_msgs.append(f"User: {turn['question']}")
+                    history_msgs.append(f"AI Coach: {turn['answer']}")
+                
+                chat_history_text = "\n".join(history_msgs)
         # ====================================================
         # 2. VECTOR & CACHE
         # ====================================================
-        query_dense = embedder.embed_dense(request.question)
-        query_sparse = embedder.embed_sparse(request.question)
+        with V2_STAGES["embedding"].time():
+            # Lần đầu get_bge_service() load model (vài giây, giữ lock) -> chạy ở thread, event loop vẫn trả lời /livez
+            embedder = await asyncio.to_thread(get_bge_service)
+            query_dense, query_sparse = await embedder.aembed_hybrid(request.question)
 
-        cached_answer = cache_service.check_cache(query_dense)
+        with V2_STAGES["cache_lookup"].time():
+            cached_answer = cache_service.check_cache(query_dense)
         
         if cached_answer:
             emb_model_name = getattr(embedder, "model_name", "unknown-model")
             
             # [QUAN TRỌNG] Ngay cả khi Cache Hit, vẫn phải lưu vào Lịch sử Chat
             # để người dùng thấy tin nhắn này trong Sidebar
-            background_tasks.add_task(
-                history_service.save_interaction, 
-                user_id=current_user['id'],
-                session_id=session_id, # Đã có giá trị ở bước 1
-                question=request.question, 
-                answer=cached_answer, 
-                sources=["Cache Hit"]
-            )
+            with V2_STAGES["history_write"].time():
+                await history_writer.enqueue(
+                    user_id=current_user['id'],
+                    session_id=session_id, # Đã có giá trị ở bước 1
+                    question=request.question, 
+                    answer=cached_answer, 
+                    sources=[CACHE_HIT_LABEL]
+                )
+            CHAT_REQUESTS.labels(api="v2", outcome="cache_hit").inc()
 
             # Trả về kết quả Cache kèm session_id
             response_data = {
@@ -198,28 +202,32 @@ async def chat_v2(
         # ====================================================
         # 3. HYBRID SEARCH (CACHE MISS)
         # ====================================================
-        search_result = qdrant_client.query_points(
-            collection_name=COLLECTION_NAME_V2,
-            prefetch=[
-                models.Prefetch(query=query_dense, using="dense", limit=100),
-                models.Prefetch(query=query_sparse.as_object(), using="sparse", limit=100),
-            ],
-            query=models.FusionQuery(fusion=models.Fusion.RRF),
-            limit=30,
-        )
+        from qdrant_client.http import models  # [QUAN TRỌNG] Import models để dùng Prefetch (import khi cần, SDK nặng)
+        with V2_STAGES["hybrid_search"].time(), observe_dependency("qdrant", "query_points"), \
+                qdrant_slot.lease() as qdrant:
+            search_result = qdrant.query_points(
+                collection_name=settings.COLLECTION_NAME,
+                prefetch=[
+                    models.Prefetch(query=query_dense, using="dense", limit=100),
+                    models.Prefetch(query=query_sparse.as_object(), using="sparse", limit=100),
+                ],
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                limit=30,
+            )
 
         # Xử lý khi không tìm thấy
         if not search_result.points:
             # Vẫn nên lưu câu hỏi này vào lịch sử dù không tìm thấy
             empty_answer = "Xin lỗi, tôi chưa tìm thấy thông tin về món này trong dữ liệu."
-            background_tasks.add_task(
-                history_service.save_interaction, 
-                user_id=current_user['id'],
-                session_id=session_id,
-                question=request.question, 
-                answer=empty_answer, 
-                sources=[]
-            )
+            with V2_STAGES["history_write"].time():
+                await history_writer.enqueue(
+                    user_id=current_user['id'],
+                    session_id=session_id,
+                    question=request.question, 
+                    answer=empty_answer, 
+                    sources=[]
+                )
+            CHAT_REQUESTS.labels(api="v2", outcome="no_context").inc()
             
             return success_response(data={
                 "answer": empty_answer,
@@ -227,8 +235,11 @@ async def chat_v2(
                 "context_used": []
             }, message="Không tìm thấy dữ liệu.")
 
+        prompt_started = time.perf_counter()
         context_list = [hit.payload["content"] for hit in search_result.points]
         context = "\n".join(context_list)
+        # [NÂNG CẤP] Lịch sử chỉ lưu tham chiếu (point id + score + hash), văn bản lưu 1 lần trong bảng documents
+        source_refs, source_docs = build_source_refs(search_result.points)
 
         # ====================================================
         # 4. GENERATE ANSWER (LLM)
@@ -250,24 +261,30 @@ async def chat_v2(
         
         HÃY TRẢ LỜI (Dựa trên Context và Lịch sử, tuân thủ Strict Rules):
         """
+        V2_STAGES["prompt_build"].observe(time.perf_counter() - prompt_started)
 
-        answer = llm_service.generate_answer(final_prompt)
+        # Lease: nếu LLM được đổi giữa chừng, client cũ chỉ bị đóng sau khi câu trả lời này xong
+        with V2_STAGES["llm"].time(), llm_slot.lease() as llm_service:
+            answer = llm_service.generate_answer(final_prompt)
 
         # ====================================================
         # 5. SAVE HISTORY & CACHE
         # ====================================================
         # Lưu lịch sử chạy ngầm
-        background_tasks.add_task(
-            history_service.save_interaction, 
-            user_id=current_user['id'],
-            session_id=session_id, # Đã có giá trị
-            question=request.question, 
-            answer=answer, 
-            sources=context_list
-        )
+        with V2_STAGES["history_write"].time():
+            await history_writer.enqueue(
+                user_id=current_user['id'],
+                session_id=session_id, # Đã có giá trị
+                question=request.question, 
+                answer=answer, 
+                sources=source_refs,
+                documents=source_docs
+            )
         
         # Lưu Cache vector
-        cache_service.save_to_cache(query_dense, request.question, answer)
+        with V2_STAGES["cache_save"].time():
+            cache_service.save_to_cache(query_dense, request.question, answer)
+        CHAT_REQUESTS.labels(api="v2", outcome="answered").inc()
 
         # ====================================================
         # 6. RESPONSE
@@ -284,6 +301,7 @@ async def chat_v2(
         return success_response(data=response_data, message="Trả lời thành công.")
 
     except Exception as e:
+        CHAT_REQUESTS.labels(api="v2", outcome="error").inc()
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
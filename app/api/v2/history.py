@@ -1,9 +1,13 @@
 # app/api/v2/history.py
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Literal, Optional
 
 from app.api.deps import get_db, get_current_user
+from app.services.deletion_jobs import deletion_jobs
+from app.services.history_export import history_exporter
 from app.services.history_service import HistoryService
 from app.models.schemas import ChatHistoryItem
 from app.core.response import success_response
@@ -15,43 +19,71 @@ router = APIRouter()
 @router.get("/", response_model=dict)
 async def get_my_history(
     limit: int = Query(20, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor / prev_cursor của trang trước"),
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Xem toàn bộ lịch sử chat (Flat List)"""
+    """Xem toàn bộ lịch sử chat (Flat List) - phân trang theo cursor"""
     service = HistoryService(db)
     # [FIX] Truy cập bằng ['id']
-    history = service.get_user_history(current_user['id'], limit, offset)
+    page = await service.get_user_history(current_user['id'], limit, cursor)
     
-    data = [ChatHistoryItem(**row).model_dump() for row in history]
-    return success_response(data=data, message="Lấy lịch sử chat thành công.")
+    page["items"] = [ChatHistoryItem(**row).model_dump() for row in page["items"]]
+    return success_response(data=page, message="Lấy lịch sử chat thành công.")
+
+# --- [MỚI] TÌM KIẾM TRONG LỊCH SỬ ---
+@router.get("/search", response_model=dict)
+async def search_my_history(
+    q: str = Query(..., min_length=2, max_length=200, description='VD: whey protein, "ức gà" -chiên'),
+    limit: int = Query(20, ge=1, le=50),
+    since: Optional[datetime] = Query(None, description="Chỉ tìm từ thời điểm này"),
+    until: Optional[datetime] = Query(None, description="Chỉ tìm trước thời điểm này"),
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Tìm tin nhắn theo từ khóa (không dấu vẫn khớp), xếp hạng theo độ liên quan, đoạn khớp được bọc <mark>"""
+    service = HistoryService(db)
+    results = await service.search_history(current_user['id'], q, limit, since, until)
+    return success_response(data=results, message=f"Tìm thấy {len(results)} kết quả.")
+
+# --- [MỚI] XUẤT TOÀN BỘ LỊCH SỬ (STREAMING) ---
+@router.get("/export")
+async def export_my_history(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    cursor: Optional[str] = Query(None, description="Tải tiếp: 'cursor' của dòng cuối cùng đã nhận"),
+    current_user = Depends(get_current_user)
+):
+    """Tải toàn bộ lịch sử chat dạng NDJSON/CSV, stream từng lô (RAM không tăng theo số tin nhắn)"""
+    stream = history_exporter.stream(current_user['id'], format, cursor)  # Quá HISTORY_EXPORT_MAX_CONCURRENT -> 429
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"chat_history_{current_user['id']}.{format}"
+    return StreamingResponse(stream, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 # --- 2. LẤY DANH SÁCH HỘI THOẠI (SESSION LIST - Mới/Sidebar) ---
 @router.get("/sessions")
 async def get_sessions(
-    limit: int = 20, 
-    offset: int = 0, 
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor / prev_cursor của trang trước"),
     current_user = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Lấy danh sách các cuộc hội thoại (cho Sidebar)"""
+    """Lấy danh sách các cuộc hội thoại (cho Sidebar) - phân trang theo cursor"""
     service = HistoryService(db)
     # [FIX] Truy cập bằng ['id']
-    sessions = service.get_user_sessions(current_user['id'], limit, offset)
-    return success_response(data=sessions)
+    page = await service.get_user_sessions(current_user['id'], limit, cursor)
+    return success_response(data=page)
 
 # --- 3. LẤY CHI TIẾT 1 HỘI THOẠI ---
 @router.get("/sessions/{session_id}")
 async def get_session_detail(
     session_id: str,
     current_user = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Lấy toàn bộ nội dung chat của 1 session"""
     service = HistoryService(db)
     # [FIX] Truy cập bằng ['id']
-    messages = service.get_session_messages(session_id, current_user['id'])
+    messages = await service.get_session_messages(session_id, current_user['id'])
     
     if messages is None:
         raise HTTPException(404, "Hội thoại không tồn tại hoặc không có quyền truy cập")
@@ -60,14 +92,20 @@ async def get_session_detail(
 
 # --- 4. XÓA LỊCH SỬ ---
 @router.delete("/clear", response_model=dict)
-async def clear_my_history(
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Xóa toàn bộ lịch sử chat"""
-    service = HistoryService(db)
-    
-    # [FIX QUAN TRỌNG] Đổi .id thành ['id']
-    count = service.clear_user_history(current_user['id'])
-    
-    return success_response(data={"deleted_rows": count}, message="Đã xóa toàn bộ lịch sử chat.")
\ No newline at end of file
+async def clear_my_history(current_user = Depends(get_current_user)):
+    """
+    Xóa toàn bộ lịch sử chat - [NÂNG CẤP] chạy nền theo từng lô, trả về job_id ngay.
+    Theo dõi tiến độ: GET /history/jobs/{job_id}
+    """
+    job_id = await deletion_jobs.submit(current_user['id'], kind="history")
+    return success_response(data={"job_id": job_id, "status": "queued"}, message="Đang xóa lịch sử chat trong nền.")
+
+# --- 5. TIẾN ĐỘ JOB XÓA ---
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_deletion_job(job_id: str, current_user = Depends(get_current_user)):
+    """Trạng thái job xóa (queued / running / done / failed) + số dòng đã xóa"""
+    job = await deletion_jobs.get(job_id)
+    # Chỉ chủ sở hữu hoặc Admin được xem
+    if job is None or (job["user_id"] != current_user['id'] and current_user['role'] != "admin"):
+        raise HTTPException(404, "Job không tồn tại hoặc đã hết hạn")
+    return success_response(data=job)
@@ -1,22 +1,23 @@
 import os
 import asyncio
+import time
 from fastapi import APIRouter, HTTPException, Depends
 from dotenv import set_key
 
 from pydantic import BaseModel
-from sqlalchemy import create_engine, text, MetaData, Table, Column, Integer, String, Text, DateTime, func, inspect
+from sqlalchemy import text, MetaData, Table, Column, Integer, String, Text, DateTime, func, inspect
 from sqlalchemy.sql import text as sql_text
 from sqlalchemy.dialects.postgresql import insert # Import tính năng Upsert
-from qdrant_client import QdrantClient
-import google.generativeai as genai
 
 # Import models và auth
 from app.api.deps import verify_admin
 from app.api.v2 import users
 from app.api.v2.system import log_manager 
 from app.core.config import settings
-from app.core.security import get_password_hash
-from app.db.migrations import run_db_migrations
+from app.core.hot_reload import reload_config
+from app.core.security import aget_password_hash
+from app.db.engine_registry import engine_registry
+from app.db.migrations import diff_indexes, history_partition_status, run_db_migrations
 from app.db.seeds import seed_initial_data
 from app.db.schemas import system_settings,users # Import bảng settings để lưu Step 5
 from app.models.schemas import (
@@ -26,6 +27,8 @@ from app.models.schemas import (
 
 class MigrationRequest(BaseModel):
     force_reset: bool = False
+    concurrent_indexes: bool = True # CREATE INDEX CONCURRENTLY: không khóa ghi khi DB đang chạy
+    partition_history: bool = False # Chuyển bảng chat_history cũ sang phân vùng theo tháng (chép toàn bộ dữ liệu)
 
 router = APIRouter()
 DEFAULT_ADMIN_KEY = "gym-food-super-admin"
@@ -45,6 +48,59 @@ def save_to_env(config_dict: dict):
             os.environ[env_key] = str(value) # Update RAM
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi lưu file .env: {str(e)}")
+    # [MỚI] Cấu hình đổi -> trạng thái cache không còn đúng, pool của DB cũ phải đóng
+    invalidate_status_cache()
+    if "DATABASE_URL" in (key.upper() for key in config_dict):
+        engine_registry.retain(os.getenv("DATABASE_URL"))
+
+async def save_and_reload(config_dict: dict):
+    """[MỚI] Lưu .env rồi áp dụng ngay (Hot Reload) cho worker này + các worker khác"""
+    save_to_env(config_dict)
+    return await reload_config()
+
+# [MỚI] Cache kết quả kiểm tra DB của /status (frontend poll liên tục): {db_url: (hết hạn, kết quả)}
+_status_cache: dict = {}
+
+def invalidate_status_cache():
+    _status_cache.clear()
+
+def _check_db_setup(db_url: str):
+    """Kiểm tra bảng + tài khoản Admin (sync, chạy trong thread). Trả về dict 'pending' hoặc None nếu đã xong"""
+    try:
+        engine = engine_registry.get(db_url)
+        inspector = inspect(engine)
+        
+        # 1. Check Bảng
+        if 'users' not in inspector.get_table_names():
+            return {
+                "status": "pending", "requires_auth": True, "step": 4,
+                "message": "Chưa khởi tạo cấu trúc bảng (Cần Migrate)."
+            }
+        
+        # 2. [MỚI] Check Dữ Liệu Admin
+        with engine.connect() as conn:
+             admin_count = conn.execute(
+                 sql_text("SELECT count(*) FROM users WHERE role='admin'")
+             ).scalar()
+             
+             if admin_count == 0:
+                 return {
+                     "status": "pending", "requires_auth": True, 
+                     "step": 4.5, # Bước mới: Tạo Admin
+                     "message": "Chưa có tài khoản Admin (Cần tạo)."
+                 }
+
+    except Exception as e:
+        return {"status": "pending", "requires_auth": True, "step": 2, "message": str(e)}
+    return None
+
+async def check_db_setup_cached(db_url: str):
+    cached = _status_cache.get(db_url)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    result = await asyncio.to_thread(_check_db_setup, db_url)
+    _status_cache[db_url] = (time.monotonic() + settings.SETUP_STATUS_CACHE_TTL, result)
+    return result
 @router.get("/status")
 async def get_system_status():
     """
@@ -84,32 +140,10 @@ async def get_system_status():
              "message": "Chưa cấu hình Database."
          }
 
-    try:
-        engine = create_engine(db_url)
-        inspector = inspect(engine)
-        
-        # 1. Check Bảng
-        if 'users' not in inspector.get_table_names():
-            return {
-                "status": "pending", "requires_auth": True, "step": 4,
-                "message": "Chưa khởi tạo cấu trúc bảng (Cần Migrate)."
-            }
-        
-        # 2. [MỚI] Check Dữ Liệu Admin
-        with engine.connect() as conn:
-             admin_count = conn.execute(
-                 sql_text("SELECT count(*) FROM users WHERE role='admin'")
-             ).scalar()
-             
-             if admin_count == 0:
-                 return {
-                     "status": "pending", "requires_auth": True, 
-                     "step": 4.5, # Bước mới: Tạo Admin
-                     "message": "Chưa có tài khoản Admin (Cần tạo)."
-                 }
-
-    except Exception as e:
-        return {"status": "pending", "requires_auth": True, "step": 2, "message": str(e)}
+    # [NÂNG CẤP] Engine dùng chung + cache vài giây: poll liên tục không mở thêm kết nối
+    pending = await check_db_setup_cached(db_url)
+    if pending:
+        return pending
 
     # Nếu đã có Admin Key + Có Bảng + Có Admin User -> Completed
     return {
@@ -127,7 +161,7 @@ async def initialize_admin(config: AdminSetupConfig):
         raise HTTPException(status_code=400, detail="⛔ Admin đã được thiết lập. Không thể khởi tạo lại!")
     if len(config.admin_secret_key) < 8:
         raise HTTPException(status_code=400, detail="⚠️ Admin Key phải dài ít nhất 8 ký tự!")
-    save_to_env({"ADMIN_SECRET_KEY": config.admin_secret_key})
+    await save_and_reload({"ADMIN_SECRET_KEY": config.admin_secret_key})
     return {"status": "success", "message": "Đã tạo Admin Key thành công!"}
 
 # ============================================================
@@ -135,7 +169,7 @@ async def initialize_admin(config: AdminSetupConfig):
 # ============================================================
 @router.post("/step1/save", dependencies=[Depends(verify_admin)])
 async def save_network_config(config: NetworkConfig):
-    save_to_env(config.model_dump())
+    await save_and_reload(config.model_dump())
     return {"status": "success", "message": "Network configuration saved."}
 
 # ============================================================
@@ -145,9 +179,8 @@ async def save_network_config(config: NetworkConfig):
 async def test_database(config: DatabaseConfig):
     try:
         url = f"postgresql+psycopg://{config.username}:{config.password}@{config.host}:{config.port}/{config.db_name}"
-        engine = create_engine(url)
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+        # [NÂNG CẤP] URL chưa lưu -> kết nối 1 lần (NullPool), không tạo pool thừa
+        await asyncio.to_thread(engine_registry.probe, url)
         return {"status": "success", "message": "Kết nối DB thành công (Driver: Psycopg 3)!"}
     except Exception as e:
         err_msg = str(e)
@@ -160,7 +193,7 @@ async def save_database_config(config: DatabaseConfig):
     db_url = f"postgresql+psycopg://{config.username}:{config.password}@{config.host}:{config.port}/{config.db_name}"
     save_data = config.model_dump()
     save_data['DATABASE_URL'] = db_url 
-    save_to_env(save_data)
+    await save_and_reload(save_data)
     return {"status": "success", "message": "Database configuration saved."}
 
 # ============================================================
@@ -171,12 +204,17 @@ async def check_db_status():
     db_url = os.getenv("DATABASE_URL")
     if not db_url: raise HTTPException(400, "Chưa cấu hình Database.")
     try:
-        engine = create_engine(db_url)
+        engine = engine_registry.get(db_url)
         inspector = inspect(engine)
         tables = inspector.get_table_names()
+        # [MỚI] Báo cáo lệch Index so với schemas.py
+        index_drift = diff_indexes(engine) if tables else {"missing": [], "mismatched": [], "extra": []}
         return {
             "status": "dirty" if len(tables) > 0 else "clean",
             "tables": tables,
+            "index_drift": index_drift,
+            "indexes_in_sync": not (index_drift["missing"] or index_drift["mismatched"]),
+            "history_partitioning": history_partition_status(engine) if tables else None,
             "message": f"Found {len(tables)} tables." if tables else "Database empty."
         }
     except Exception as e:
@@ -191,9 +229,10 @@ async def execute_migration_endpoint(request: MigrationRequest):
         await log_manager.broadcast_log(msg)
 
     try:
-        engine = create_engine(db_url)
-        await run_db_migrations(engine, request.force_reset, ws_log)
+        engine = engine_registry.get(db_url)
+        await run_db_migrations(engine, request.force_reset, ws_log, request.concurrent_indexes, request.partition_history)
         await seed_initial_data(engine, ws_log)
+        invalidate_status_cache()
         await ws_log("[DONE] System initialization complete!")
         return {"status": "success", "message": "Database initialized."}
     except Exception as e:
@@ -213,7 +252,7 @@ async def create_first_admin(data: FirstAdminRequest):
         raise HTTPException(400, "Chưa cấu hình Database.")
 
     try:
-        engine = create_engine(db_url)
+        engine = engine_registry.get(db_url)
         with engine.begin() as conn:
             # 1. Kiểm tra an toàn: Nếu đã có admin rồi thì chặn lại (tránh ghi đè ác ý)
             existing_admin = conn.execute(
@@ -230,7 +269,7 @@ async def create_first_admin(data: FirstAdminRequest):
             if len(raw_password.encode('utf-8')) > 72:
                 raw_password = raw_password[:72]
             # 2. Hash mật khẩu
-            hashed_pw = get_password_hash(raw_password)
+            hashed_pw = await aget_password_hash(raw_password)
 
             # 3. Insert vào DB
             conn.execute(users.insert().values(
@@ -242,6 +281,7 @@ async def create_first_admin(data: FirstAdminRequest):
                 is_active=True
             ))
             
+        invalidate_status_cache()
         return {
             "status": "success", 
             "message": f"Tài khoản Admin '{data.username}' đã được tạo thành công!"
@@ -255,6 +295,7 @@ async def create_first_admin(data: FirstAdminRequest):
 @router.post("/step3/test", dependencies=[Depends(verify_admin)])
 async def test_vector_db(config: VectorConfig):
     try:
+        from qdrant_client import QdrantClient
         client = QdrantClient(url=config.host, api_key=config.api_key, timeout=5)
         colls = client.get_collections().collections
         exists = any(c.name == config.collection_name for c in colls)
@@ -269,7 +310,7 @@ async def save_vector_config(config: VectorConfig):
         url_parts = config.host.replace("http://", "").replace("https://", "").split(":")
         host = url_parts[0]
         port = url_parts[1] if len(url_parts) > 1 else "6333"
-        save_to_env({
+        await save_and_reload({
             "QDRANT_HOST": host, "QDRANT_PORT": port, "COLLECTION_NAME": config.collection_name
         })
         return {"status": "success", "message": "Vector DB config saved."}
@@ -282,6 +323,7 @@ async def save_vector_config(config: VectorConfig):
 @router.post("/step4/test", dependencies=[Depends(verify_admin)])
 async def test_llm_connection(config: LLMConfig):
     try:
+        import google.generativeai as genai
         genai.configure(api_key=config.api_key)
         model = genai.GenerativeModel(config.model_name)
         response = model.generate_content("Hello")
@@ -292,7 +334,7 @@ async def test_llm_connection(config: LLMConfig):
 
 @router.post("/step4/save", dependencies=[Depends(verify_admin)])
 async def save_llm_config(config: LLMConfig):
-    save_to_env({"LLM_BACKEND":config.provider,"GOOGLE_API_KEY": config.api_key, "GEMINI_MODEL": config.model_name})
+    await save_and_reload({"LLM_BACKEND":config.provider,"GOOGLE_API_KEY": config.api_key, "GEMINI_MODEL": config.model_name})
     return {"status": "success", "message": "LLM credentials saved."}
 
 # ============================================================
@@ -305,7 +347,7 @@ async def save_general_config(config: GeneralConfig):
     """
     # --- 1. LƯU VÀO FILE .ENV ---
     try:
-        save_to_env(config.model_dump())
+        await save_and_reload(config.model_dump())
         print("✅ Đã lưu cấu hình vào .env")
     except Exception as e:
         print(f"⚠️ Cảnh báo: Không lưu được vào .env: {e}")
@@ -317,7 +359,7 @@ async def save_general_config(config: GeneralConfig):
         return {"status": "warning", "message": "Đã lưu vào .env, nhưng chưa kết nối DB để lưu bảng settings."}
     
     try:
-        engine = create_engine(db_url)
+        engine = engine_registry.get(db_url)
         with engine.begin() as conn:
             settings_to_save = config.model_dump()
             for key, value in settings_to_save.items():
@@ -10,6 +10,12 @@ from dotenv import load_dotenv, set_key
 
 # Import dependency bảo mật từ file deps.py (Bạn nhớ tạo file này nhé)
 from app.api.deps import verify_admin
+from app.core.config import settings
+from app.core.hot_reload import reload_config
+from app.core.health_monitor import health_monitor
+from app.core.startup_profiler import startup_profiler
+from app.core.warmup import readiness
+from app.services.history_archiver import history_archiver
 
 router = APIRouter()
 
@@ -30,18 +36,23 @@ class EnvUpdate(BaseModel):
 
 @router.get("/health") 
 async def system_health():
-    """Kiểm tra trạng thái server, RAM, CPU"""
+    """Kiểm tra trạng thái server, RAM, CPU + latency/lỗi của các dependency (đọc từ RAM, không chặn)"""
     process = psutil.Process(os.getpid())
     mem_info = process.memory_info()
+    deps_report = health_monitor.report()
     
     return {
-        "status": "online",
+        "status": "degraded" if deps_report["status"] == "degraded" else "online",
         "system": {
             "cpu_percent": psutil.cpu_percent(),
             "ram_usage_mb": round(mem_info.rss / 1024 / 1024, 2),
             "uptime_seconds": int(time.time() - process.create_time())
         },
-        "backend": "FastAPI Hybrid RAG"
+        "backend": "FastAPI Hybrid RAG",
+        "startup": startup_profiler.report(), # [MỚI] Thời gian khởi động từng bước
+        "ready": readiness.ready,
+        "degraded": deps_report["degraded"],
+        "dependencies": deps_report["dependencies"], # [MỚI] p50/p95/p99, số lỗi, lỗi gần nhất
     }
 
 @router.get("/config", dependencies=[Depends(verify_admin)])
@@ -69,14 +80,40 @@ async def update_env(data: EnvUpdate):
         
         # 2. Cập nhật RAM
         os.environ[data.key] = data.value
-        
-        return {
-            "status": "success", 
-            "message": f"Đã cập nhật {data.key}. Hãy Restart để áp dụng triệt để."
-        }
+
+        # 3. [MỚI] Hot Reload: dựng lại client bị ảnh hưởng (Qdrant, LLM...) trên mọi worker
+        result = await reload_config()
+        message = f"Đã cập nhật và áp dụng {data.key}."
+        if result["restart_required"]:
+            message = f"Đã cập nhật {data.key}. Cần Restart để áp dụng: {', '.join(result['restart_required'])}."
+        return {"status": "success", "message": message, "reload": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- [MỚI] BẢO TRÌ LỊCH SỬ CHAT (PARTITION / RETENTION / ARCHIVE) ---
+@router.get("/history/maintenance", dependencies=[Depends(verify_admin)])
+async def history_maintenance_status():
+    """Báo cáo lần chạy gần nhất của job bảo trì partition"""
+    return {
+        "retention_months": settings.HISTORY_RETENTION_MONTHS,
+        "partitions_ahead": settings.HISTORY_PARTITIONS_AHEAD,
+        "archive_dir": settings.HISTORY_ARCHIVE_DIR,
+        "last_report": history_archiver.last_report,
+    }
+
+@router.post("/history/maintenance", dependencies=[Depends(verify_admin)])
+async def run_history_maintenance(dry_run: bool = False):
+    """Chạy ngay job bảo trì: tạo partition tháng tới + lưu trữ partition hết hạn"""
+    try:
+        return await history_archiver.run_once(dry_run=dry_run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi bảo trì lịch sử: {e}")
+
+@router.post("/config/reload", dependencies=[Depends(verify_admin)])
+async def reload_env():
+    """[MỚI] Đọc lại .env và áp dụng ngay (sau khi sửa file .env bằng tay) - không restart, không load lại model"""
+    return {"status": "success", "reload": await reload_config()}
+
 @router.post("/system/restart", dependencies=[Depends(verify_admin)])
 async def restart_server(background_tasks: BackgroundTasks):
     """Khởi động lại Server (Yêu cầu Docker restart: always)"""
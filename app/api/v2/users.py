@@ -1,45 +1,54 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, select, text
 from app.api.deps import get_db, get_current_admin
-from app.models.schemas import UserResponse, UserUpdate
+from app.core.pagination import escape_like, keyset_paginate
+from app.core.principal_cache import principal_cache
+from app.core.token_store import token_store
+from app.services.deletion_jobs import deletion_jobs
+from app.db.schemas import users as users_table
+from app.models.schemas import UserPage, UserResponse, UserUpdate
 
 router = APIRouter()
 
 # --- 1. XEM DANH SÁCH NGƯỜI DÙNG ---
-@router.get("/", response_model=List[UserResponse])
+@router.get("/", response_model=UserPage)
 async def list_users(
-    db: Session = Depends(get_db), 
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor / prev_cursor của trang trước"),
+    q: Optional[str] = Query(None, min_length=1, description="Lọc theo tiền tố username hoặc email"),
+    db: AsyncSession = Depends(get_db), 
     admin_user = Depends(get_current_admin) # Yêu cầu quyền Admin
 ):
-    """Lấy danh sách tất cả người dùng (Chỉ Admin)"""
-    # Lấy tất cả user (trừ password_hash và refresh_token)
-    sql = text("SELECT id, username, email, role, is_active FROM users")
-    users = db.execute(sql).fetchall()
-    
-    # Chuyển đổi kết quả FetchManyRows sang list of dicts
-    user_list = [
-        UserResponse(
-            id=row[0], 
-            username=row[1], 
-            email=row[2], 
-            role=row[3], 
-            is_active=row[4]
-        ) for row in users
-    ]
-    return user_list
+    """Lấy danh sách người dùng (Chỉ Admin) - phân trang keyset (created_at, id)"""
+    # Lấy thông tin user (trừ password_hash và refresh_token)
+    query = select(
+        users_table.c.id, users_table.c.username, users_table.c.email,
+        users_table.c.role, users_table.c.is_active, users_table.c.created_at
+    )
+    if q:
+        # LIKE 'abc%' dùng được Index text_pattern_ops
+        pattern = f"{escape_like(q)}%"
+        query = query.where(or_(
+            users_table.c.username.like(pattern, escape="\\"),
+            users_table.c.email.like(pattern, escape="\\")
+        ))
+
+    page = await keyset_paginate(db, query, users_table.c.created_at, users_table.c.id, limit, cursor)
+    page["items"] = [UserResponse(**row) for row in page["items"]]
+    return page
 
 # --- 2. XEM CHI TIẾT NGƯỜI DÙNG BẰNG ID ---
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user_by_id(
     user_id: int, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_db), 
     admin_user = Depends(get_current_admin)
 ):
     """Xem chi tiết người dùng (Chỉ Admin)"""
     sql = text("SELECT id, username, email, role, is_active FROM users WHERE id = :id")
-    user = db.execute(sql, {"id": user_id}).fetchone()
+    user = (await db.execute(sql, {"id": user_id})).fetchone()
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -53,7 +62,7 @@ async def get_user_by_id(
 async def update_user(
     user_id: int, 
     user_in: UserUpdate, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_db), 
     admin_user = Depends(get_current_admin)
 ):
     """Cập nhật thông tin người dùng, bao gồm Role và Active Status (Chỉ Admin)"""
@@ -70,26 +79,35 @@ async def update_user(
     sql = text(f"UPDATE users SET {set_clause} WHERE id = :id")
     
     # Thực hiện update
-    db.execute(sql, updates)
-    db.commit()
+    await db.execute(sql, updates)
+    await db.commit()
     
     # Trả về đối tượng sau khi update
-    return await get_user_by_id(user_id, db, admin_user)
+    user = await get_user_by_id(user_id, db, admin_user)
+    # [MỚI] Role / is_active có thể đã đổi -> xóa Principal cache trên mọi worker
+    await principal_cache.invalidate(user.username)
+    if updates.get("is_active") is False:
+        await token_store.revoke_all(user_id) # Khóa tài khoản -> thu hồi mọi phiên
+    return user
 
 # --- 4. XÓA NGƯỜI DÙNG ---
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(get_db), admin_user = Depends(get_current_admin)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db), admin_user = Depends(get_current_admin)):
     """Xóa người dùng bằng ID (Chỉ Admin)"""
     
     # Không cho Admin tự xóa chính mình (Chỉ Admin mới có ID < 100 thường là user đầu tiên)
     if user_id == admin_user.id:
          raise HTTPException(status_code=400, detail="Không thể tự xóa tài khoản Admin đang hoạt động.")
 
-    sql = text("DELETE FROM users WHERE id = :id RETURNING id")
-    result = db.execute(sql, {"id": user_id})
+    # [NÂNG CẤP] Khóa tài khoản ngay, dữ liệu (tin nhắn, session, user) được xóa nền theo từng lô
+    sql = text("UPDATE users SET is_active = false WHERE id = :id RETURNING id, username")
+    deleted = (await db.execute(sql, {"id": user_id})).fetchone()
     
-    if result.rowcount == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.commit()
-    return {"status": "success", "message": f"User ID {user_id} deleted."}
\ No newline at end of file
+    await db.commit()
+    await token_store.revoke_all(user_id)
+    await principal_cache.invalidate(deleted.username)
+    job_id = await deletion_jobs.submit(user_id, kind="user")
+    return {"status": "success", "message": f"User ID {user_id} is being deleted.", "job_id": job_id}
\ No newline at end of file
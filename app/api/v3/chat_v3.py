@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+import json
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
 
 # Import các dependency và service
-from app.api.deps import get_db, get_current_user
+from app.api.deps import get_db, get_current_user, get_current_admin
 from app.core.response import success_response
-from app.services.v3.agent import agent_service_v3
+from app.services.v3 import get_agent_v3
 from app.services.history_service import HistoryService
+from app.services.history_writer import history_writer
+from app.services.source_refs import AGENT_V3_LABEL
 
 router = APIRouter()
 
@@ -18,9 +22,8 @@ class ChatRequestV3(BaseModel):
 @router.post("/chat")
 async def chat_agent_v3(
     request: ChatRequestV3,
-    background_tasks: BackgroundTasks,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     API V3: LangGraph Agent + Redis Memory + Postgres History.
@@ -33,21 +36,20 @@ async def chat_agent_v3(
         session_id = request.session_id
         if not session_id:
             # Tạo session trong Postgres để hiển thị bên Sidebar
-            session_id = history_service.create_session(current_user['id'], request.question)
+            session_id = await history_service.create_session(current_user['id'], request.question)
 
         # 2. Gọi Agent (LangGraph)
         # Agent sẽ tự động dùng session_id để truy xuất bộ nhớ ngắn hạn từ Redis
-        answer = await agent_service_v3.process_question(session_id, request.question)
+        answer = await get_agent_v3().process_question(session_id, request.question)
 
         # 3. Lưu Lịch sử vào Postgres (Chạy ngầm)
         # Để người dùng có thể xem lại lịch sử chat sau này (Long-term memory)
-        background_tasks.add_task(
-            history_service.save_interaction, 
+        await history_writer.enqueue(
             user_id=current_user['id'],
             session_id=session_id,
             question=request.question, 
             answer=answer, 
-            sources=["Agent V3 (LangGraph)"] # Agent tự động nên khó track source chi tiết hơn V2
+            sources=[AGENT_V3_LABEL] # Agent tự động nên khó track source chi tiết hơn V2
         )
 
         return success_response(
@@ -62,4 +64,63 @@ async def chat_agent_v3(
     except Exception as e:
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============================================================
+# [MỚI] STREAMING (SSE): Đẩy token + sự kiện tool ngay khi có
+# ============================================================
+def _sse(event: dict) -> str:
+    """Đóng gói 1 sự kiện theo chuẩn Server-Sent Events"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_agent_v3_stream(
+    request: ChatRequestV3,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    API V3 (Streaming): Trả về text/event-stream gồm các sự kiện
+    session -> token / tool_start / tool_end -> done (hoặc error).
+    """
+    history_service = HistoryService(db_session=db)
+    session_id = request.session_id
+    if not session_id:
+        session_id = await history_service.create_session(current_user['id'], request.question)
+
+    user_id = current_user['id']
+
+    async def event_generator():
+        yield _sse({"type": "session", "session_id": session_id})
+        answer = None
+        try:
+            async for event in get_agent_v3().stream_question(session_id, request.question):
+                if event["type"] == "done":
+                    answer = event["answer"]
+                    event = {**event, "session_id": session_id}
+                yield _sse(event)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield _sse({"type": "error", "message": str(e)})
+            return
+
+        # Lưu lịch sử sau khi stream xong (đẩy vào hàng đợi ghi theo lô)
+        await history_writer.enqueue(
+            user_id=user_id,
+            session_id=session_id,
+            question=request.question,
+            answer=answer,
+            sources=[AGENT_V3_LABEL]
+        )
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/agent/memory-stats")
+async def agent_memory_stats(admin_user = Depends(get_current_admin)):
+    """Thống kê quản lý lịch sử của Agent V3 (số lần tóm tắt, token tiết kiệm được)"""
+    return success_response(data=get_agent_v3().history_stats)
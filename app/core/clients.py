@@ -0,0 +1,138 @@
+# app/core/clients.py
+"""
+"Ngăn chứa" (slot) cho các client phụ thuộc cấu hình: Qdrant, LLM...
+Đổi cấu hình lúc đang chạy -> chỉ dựng lại client bị ảnh hưởng, không restart process:
+1. Dựng client mới ở thread riêng (request vẫn dùng client cũ trong lúc chờ).
+2. Tráo con trỏ (atomic) -> request mới dùng client mới ngay.
+3. Đợi các lời gọi đang dùng client cũ (lease) kết thúc, rồi mới close() client cũ.
+Model Embedding (vài GB) không nằm trong slot nào -> không bao giờ bị load lại.
+"""
+import asyncio
+import inspect
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from app.core.config import settings
+
+
+class ClientSlot:
+    def __init__(self, name: str, factory: Callable[[], Any], keys: Iterable[str], closer: Optional[Callable[[Any], Any]] = None):
+        self.name = name
+        self.factory = factory
+        self.keys: Set[str] = set(keys)
+        self.closer = closer
+        self.generation = 0
+        self._client = None
+        self._inflight: Dict[int, int] = {}  # generation -> số lời gọi đang dùng
+        self._lock = threading.Lock()        # lease() được gọi cả trong thread pool
+
+    def get(self):
+        """
+        Client hiện tại (dựng lần đầu khi cần). swap() KHÔNG chờ người gọi get() -> client có thể bị close()
+        giữa chừng khi đổi cấu hình. Mọi lời gọi ra Qdrant/LLM phải dùng lease().
+        """
+        if self._client is None:
+            with self._lock:
+                self._build_locked()
+        return self._client
+
+    def _build_locked(self):
+        # Gọi khi đang giữ self._lock
+        if self._client is None:
+            self._client = self.factory()
+            self.generation += 1
+
+    @contextmanager
+    def lease(self):
+        """Mượn client cho 1 lời gọi: client cũ chỉ bị đóng sau khi mọi lease của nó kết thúc"""
+        # Đọc client + generation trong cùng 1 lần giữ lock -> swap() chen giữa không làm lệch cặp này
+        with self._lock:
+            self._build_locked()
+            client, generation = self._client, self.generation
+            self._inflight[generation] = self._inflight.get(generation, 0) + 1
+        try:
+            yield client
+        finally:
+            with self._lock:
+                remaining = self._inflight.get(generation, 0) - 1
+                if remaining > 0:
+                    self._inflight[generation] = remaining
+                else:
+                    self._inflight.pop(generation, None)
+
+    async def swap(self) -> None:
+        new_client = await asyncio.to_thread(self.factory)
+        with self._lock:
+            old_client, old_generation = self._client, self.generation
+            self._client = new_client
+            self.generation += 1
+        if old_client is None:
+            return
+
+        # Drain: chờ lời gọi dở dang trên client cũ (có giới hạn thời gian)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.CLIENT_DRAIN_TIMEOUT
+        while self._inflight.get(old_generation, 0) > 0 and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        # Không xóa bộ đếm: lease còn dở tự trả về 0 (và xóa key) khi lời gọi kết thúc
+        leftover = self._inflight.get(old_generation, 0)
+        if leftover:
+            print(f"⚠️ [Clients] {self.name}: {leftover} calls still running on old client after drain timeout.")
+        await self._close(old_client)
+
+    async def _close(self, client) -> None:
+        close = self.closer or getattr(client, "close", None)
+        if close is None:
+            return
+        try:
+            result = close(client) if self.closer else close()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"⚠️ [Clients] {self.name}: close failed: {e}")
+
+
+class ClientRegistry:
+    def __init__(self):
+        self.slots: Dict[str, ClientSlot] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], keys: Iterable[str], closer=None) -> ClientSlot:
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = ClientSlot(name, factory, keys, closer)
+        return slot
+
+    async def apply(self, changed_keys: Iterable[str]) -> List[str]:
+        """Dựng lại (song song) các slot phụ thuộc vào key vừa đổi. Slot chưa từng dùng thì bỏ qua"""
+        changed = set(changed_keys)
+        targets = [slot for slot in self.slots.values() if slot.keys & changed and slot.generation > 0]
+        results = await asyncio.gather(*(slot.swap() for slot in targets), return_exceptions=True)
+        reloaded = []
+        for slot, result in zip(targets, results):
+            if isinstance(result, Exception):
+                print(f"❌ [Clients] Rebuild '{slot.name}' failed, keeping old client: {result}")
+            else:
+                reloaded.append(slot.name)
+        return reloaded
+
+
+clients = ClientRegistry()
+
+
+# --- QDRANT (dùng chung cho V2 Chat, Admin, Semantic Cache, V3 Tools) ---
+QDRANT_KEYS = {"QDRANT_HOST", "QDRANT_PORT"}
+
+
+def _build_qdrant():
+    from qdrant_client import QdrantClient
+    return QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
+
+
+def _build_async_qdrant():
+    from qdrant_client import AsyncQdrantClient
+    return AsyncQdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
+
+
+qdrant_slot = clients.register("qdrant", _build_qdrant, QDRANT_KEYS)
+async_qdrant_slot = clients.register("qdrant_async", _build_async_qdrant, QDRANT_KEYS)
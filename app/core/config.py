@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 import os
+from typing import Dict
 
 # Tải biến môi trường từ file .env
 load_dotenv() 
@@ -17,6 +18,15 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30        # Access Token sống 30 phút
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7           # Refresh Token sống 7 ngày
+    AUTH_CACHE_LOCAL_TTL: int = 15               # Giây giữ Principal trong RAM của worker
+    AUTH_CACHE_TTL: int = 300                    # Giây giữ Principal trong Redis
+    AUTH_CACHE_MAX_ENTRIES: int = 10000          # Số user tối đa trong LRU của mỗi worker
+    BCRYPT_ROUNDS: int = 12                      # Cost factor của bcrypt (mỗi +1 = gấp đôi thời gian)
+    BCRYPT_WORKERS: int = 2                      # Số luồng tối đa dành cho hash/verify mật khẩu
+    LOGIN_IP_MAX_ATTEMPTS: int = 20              # Số lần login tối đa / IP trong LOGIN_IP_WINDOW
+    LOGIN_IP_WINDOW: int = 60                    # Cửa sổ trượt (giây) cho giới hạn theo IP
+    LOGIN_ACCOUNT_MAX_FAILURES: int = 5          # Số lần sai mật khẩu tối đa / tài khoản trong LOGIN_ACCOUNT_WINDOW
+    LOGIN_ACCOUNT_WINDOW: int = 300              # Cửa sổ trượt (giây) cho giới hạn theo tài khoản
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "") 
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
     # --- 3. EMBEDDING & LLM ---
@@ -41,6 +51,17 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = "admin"
     POSTGRES_PASSWORD: str = "admin"
     POSTGRES_DB: str = "gym_food_db"
+    # Connection pool (Async Engine)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 10.0                # Giây chờ lấy connection khi pool đã đầy
+    DB_POOL_RECYCLE: int = 1800                  # Làm mới connection sau N giây
+    DB_CONNECT_TIMEOUT: int = 2                  # Giây chờ mở kết nối mới
+    DB_STATEMENT_TIMEOUT_MS: int = 15000         # Hủy truy vấn chạy quá lâu
+    # Engine sync của Setup Wizard / Migration (app/db/engine_registry.py)
+    SETUP_DB_POOL_SIZE: int = 2
+    SETUP_DB_MAX_OVERFLOW: int = 3
+    SETUP_STATUS_CACHE_TTL: float = 5.0          # Giây cache kết quả /setup/status (frontend poll liên tục)
 
     # --- 6. PGADMIN (Optional - Backend ít dùng nhưng khai báo cho đủ bộ) ---
     PGADMIN_EMAIL: str = "admin@gymfood.com"
@@ -48,6 +69,58 @@ class Settings(BaseSettings):
     
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
+
+    # --- 7. LANGGRAPH CHECKPOINT (V3 AGENT MEMORY) ---
+    CHECKPOINT_TTL_SECONDS: int = 604800         # 7 ngày
+    CHECKPOINT_KEEP_LAST: int = 4                # Số checkpoint giữ lại cho mỗi thread
+    CHECKPOINT_SNAPSHOT_EVERY: int = 8           # Sau N delta thì ghi lại 1 bản messages đầy đủ
+    V3_HISTORY_TOKEN_BUDGET: int = 6000          # Vượt ngưỡng này thì rút gọn / tóm tắt lịch sử
+    V3_HISTORY_KEEP_TURNS: int = 3               # Số lượt hỏi gần nhất giữ nguyên văn
+    V3_TOOL_RESULT_MAX_CHARS: int = 400          # Độ dài tối đa của kết quả tool ở các lượt cũ
+    V3_TOOL_CACHE_GLOBAL_TTL: int = 300          # TTL (giây) của cache kết quả tool dùng chung
+    V3_TOOL_MAX_CONCURRENCY: int = 4             # Số tác vụ tool chạy đồng thời trong 1 bước
+    V3_TOOL_TIMEOUT: float = 15.0                # Timeout (giây) cho mỗi tác vụ tool
+    CHECKPOINT_COMPRESSION: str = "zstd"         # 'zstd' hoặc 'none' (zstd cần thư viện zstandard)
+
+    # --- 8. CHAT HISTORY (NGỮ CẢNH HỘI THOẠI) ---
+    CHAT_CONTEXT_TURNS: int = 3                  # Số cặp hỏi đáp gần nhất đưa vào Prompt
+    HISTORY_RECENT_TTL: int = 86400              # TTL (giây) của ring buffer lượt gần nhất trong Redis
+    HISTORY_WRITER_BATCH_SIZE: int = 100         # Số tin nhắn tối đa trong 1 lô INSERT
+    HISTORY_WRITER_FLUSH_INTERVAL: float = 0.5   # Giây chờ gom lô trước khi ghi
+    HISTORY_WRITER_QUEUE_MAXSIZE: int = 10000    # Hàng đợi đầy -> request chờ (backpressure)
+    HISTORY_WRITER_PERSIST: bool = True          # Lưu tạm hàng đợi vào Redis (không mất khi crash)
+    HISTORY_WRITER_RECOVERY_AGE: int = 60        # Tin nhắn chờ quá N giây coi như của worker đã chết
+    HISTORY_PARTITIONS_AHEAD: int = 3            # Số tháng tạo sẵn partition phía trước
+    HISTORY_RETENTION_MONTHS: int = 12           # Giữ N tháng gần nhất trong DB (0 = giữ vĩnh viễn)
+    HISTORY_ARCHIVE_DIR: str = "data/archive"    # Thư mục chứa file .csv.gz của partition đã lưu trữ
+    HISTORY_ARCHIVE_DROP: bool = False           # True: DROP partition sau khi export, False: giữ bảng *_archived
+    HISTORY_MAINTENANCE_INTERVAL: int = 86400    # Chu kỳ (giây) chạy job bảo trì partition (0 = tắt)
+    HISTORY_STORE_SOURCE_TEXT: bool = True       # Lưu văn bản nguồn vào bảng documents (False: chỉ lưu id + score)
+    DELETION_BATCH_SIZE: int = 1000              # Job xóa nền: số dòng mỗi transaction
+    DELETION_BATCH_PAUSE: float = 0.05           # Nghỉ giữa các lô (giây) để không chiếm hết I/O của DB
+    DELETION_JOB_TTL: int = 86400                # Giữ trạng thái job trong Redis (giây)
+    DELETION_JOB_STALE: int = 60                 # Job không cập nhật tiến độ quá N giây coi như worker đã chết
+    HISTORY_EXPORT_FETCH_SIZE: int = 500         # Export: số dòng mỗi lần FETCH từ server-side cursor
+    HISTORY_EXPORT_MAX_CONCURRENT: int = 4       # Export đồng thời tối đa mỗi worker (mỗi export giữ 1 kết nối DB)
+
+    # --- 9. HOT RELOAD (ĐỔI CẤU HÌNH KHÔNG CẦN RESTART) ---
+    CLIENT_DRAIN_TIMEOUT: float = 30.0           # Giây chờ lời gọi dở dang trước khi đóng client cũ
+    STARTUP_IMPORT_BUDGET: float = 3.0           # Ngân sách (giây) import app.main - python -m app.core.startup_profiler
+
+    # --- 10. WARM-UP & READINESS (/livez, /readyz) ---
+    WARMUP_ENABLED: bool = True                  # False: bỏ qua warm-up, /readyz trả 200 ngay khi khởi động xong
+    WARMUP_STEP_TIMEOUT: float = 120.0           # Giây tối đa cho mỗi bước warm-up (load model có thể lâu)
+    WARMUP_RETRY_INTERVAL: float = 10.0          # Bước lỗi (DB/Redis/Qdrant chưa lên) được thử lại sau N giây
+    WARMUP_DB_CONNECTIONS: int = 2               # Số connection Postgres mở sẵn trong pool
+    WARMUP_AGENT_V3: bool = True                 # Dựng sẵn graph Agent V3 (không bắt buộc cho readiness)
+
+    # --- 11. HEALTH MONITOR (/system/health) ---
+    HEALTH_PROBE_INTERVAL: float = 15.0          # Chu kỳ (giây) probe Postgres/Redis/Qdrant/Embedding (0 = tắt)
+    HEALTH_LLM_PROBE_INTERVAL: float = 300.0     # Probe LLM thưa hơn (gọi API bên ngoài), 0 = tắt
+    HEALTH_PROBE_TIMEOUT: float = 5.0            # Probe quá N giây -> tính là lỗi
+    HEALTH_WINDOW: int = 100                     # Số mẫu latency gần nhất dùng để tính p50/p95/p99
+    HEALTH_P95_THRESHOLDS_MS: Dict[str, float] = {}  # VD: {"postgres": 200, "qdrant": 300} -> vượt thì degraded
+    HEALTH_MAX_CONSECUTIVE_FAILURES: int = 3     # Lỗi liên tiếp >= N -> degraded
     # --- HELPER PROPERTY ---
     # Tự động tạo chuỗi kết nối DB chuẩn Psycopg 3 từ các biến rời rạc
     @property
@@ -62,6 +135,22 @@ class Settings(BaseSettings):
 # Khởi tạo instance
 settings = Settings()
 
+
+def reload_settings() -> set:
+    """
+    [MỚI] Đọc lại .env + biến môi trường, cập nhật TẠI CHỖ object `settings`
+    (mọi module đã `from app.core.config import settings` đều thấy giá trị mới).
+    Trả về tập các key đã thay đổi.
+    """
+    load_dotenv(override=True)
+    fresh = Settings()
+    changed = set()
+    for key, value in fresh.model_dump().items():
+        if getattr(settings, key) != value:
+            setattr(settings, key, value)
+            changed.add(key)
+    return changed
+
 # --- DEBUGGING INFO (In ra terminal khi khởi động) ---
 print("-" * 50)
 print(f"✅ Config Loaded: {settings.PROJECT_NAME}")
@@ -0,0 +1,76 @@
+# app/core/events.py
+"""
+Event Bus giữa các worker qua Redis Pub/Sub.
+Dùng cho các cache nằm trong RAM của từng worker (VD: Principal cache) cần được xóa đồng loạt.
+- publish(channel, payload): gửi JSON tới mọi worker (kể cả chính worker gửi).
+- subscribe(channel, handler): đăng ký handler async, gọi khi có message.
+- start()/stop(): gọi từ lifespan.
+"""
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, List
+
+import redis.asyncio as redis
+
+from app.core.redis import redis_pool
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class EventBus:
+    def __init__(self):
+        self.client = redis.Redis(connection_pool=redis_pool)
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._task: asyncio.Task = None
+
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, payload: dict):
+        try:
+            await self.client.publish(channel, json.dumps(payload, ensure_ascii=False))
+        except Exception as e:
+            print(f"⚠️ [Event Bus] Publish '{channel}' failed: {e}")
+
+    async def start(self):
+        if self._task is None and self._handlers:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        # Tự kết nối lại nếu Redis rớt (các cache vẫn có TTL ngắn nên chỉ stale tạm thời)
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(*self._handlers.keys())
+                print(f"📡 [Event Bus] Listening: {', '.join(self._handlers.keys())}")
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    for handler in self._handlers.get(message["channel"], []):
+                        try:
+                            await handler(payload)
+                        except Exception as e:
+                            print(f"⚠️ [Event Bus] Handler error on '{message['channel']}': {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ [Event Bus] Connection lost: {e}. Reconnecting in 2s...")
+                await asyncio.sleep(2)
+            finally:
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+
+
+event_bus = EventBus()
@@ -0,0 +1,175 @@
+# app/core/health_monitor.py
+"""
+Theo dõi sức khỏe các phụ thuộc (Postgres, Redis, Qdrant, Embedding, LLM) bằng probe chạy nền.
+- Mỗi HEALTH_PROBE_INTERVAL giây: probe song song, ghi latency vào cửa sổ trượt HEALTH_WINDOW mẫu.
+- /system/health chỉ đọc số liệu trong RAM (không gọi ra ngoài) -> không bao giờ bị treo theo dependency.
+- Degraded khi p95 vượt HEALTH_P95_THRESHOLDS_MS hoặc lỗi liên tiếp >= HEALTH_MAX_CONSECUTIVE_FAILURES.
+"""
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+
+PROBE_TEXT = "health check"
+
+
+async def _probe_postgres():
+    from app.api.deps import engine
+    if engine is None:
+        return "skipped"
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def _probe_redis():
+    import redis.asyncio as redis
+    from app.core.redis import redis_pool
+    client = redis.Redis(connection_pool=redis_pool)
+    try:
+        await client.ping()
+    finally:
+        await client.close()
+
+
+async def _probe_qdrant():
+    from app.core.clients import async_qdrant_slot
+    with async_qdrant_slot.lease() as client:
+        await client.get_collections()
+
+
+async def _probe_embedding():
+    from app.services import embedding_bge_service
+    service = embedding_bge_service._service_instance
+    if service is None:  # Chưa load (warm-up chưa chạy tới) -> không ép load model ở đây
+        return "skipped"
+    await service.aembed_dense(PROBE_TEXT)  # Gồm cả thời gian chờ trong worker pool encode
+
+
+async def _probe_llm():
+    from app.services.llm_service_fully import llm_slot
+    with llm_slot.lease() as llm_service:
+        await asyncio.to_thread(llm_service.ping, settings.HEALTH_PROBE_TIMEOUT)
+
+
+class DependencyStats:
+    def __init__(self, name: str, window: int):
+        self.name = name
+        self.latencies_ms = deque(maxlen=window)
+        self.total = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[str] = None
+        self.last_checked_at: Optional[str] = None
+        self.skipped = False
+
+    def record(self, latency_ms: Optional[float], error: Optional[str] = None):
+        self.total += 1
+        self.last_checked_at = datetime.now().isoformat()
+        if error is None:
+            self.latencies_ms.append(latency_ms)  # Probe lỗi/timeout không kéo lệch percentile
+            self.consecutive_failures = 0
+            return
+        self.errors += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        self.last_error_at = self.last_checked_at
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))  # Nearest-rank
+        return round(ordered[index], 2)
+
+    def problems(self) -> list:
+        problems = []
+        if self.consecutive_failures >= settings.HEALTH_MAX_CONSECUTIVE_FAILURES:
+            problems.append(f"{self.consecutive_failures} consecutive failures")
+        threshold = settings.HEALTH_P95_THRESHOLDS_MS.get(self.name)
+        p95 = self.percentile(95)
+        if threshold and p95 is not None and p95 > threshold:
+            problems.append(f"p95 {p95}ms > {threshold}ms")
+        return problems
+
+    def report(self) -> dict:
+        if self.skipped:
+            return {"status": "skipped"}
+        if not self.total:
+            return {"status": "pending"}
+        problems = self.problems()
+        return {
+            "status": "degraded" if problems else "ok",
+            "problems": problems,
+            "latency_ms": {"p50": self.percentile(50), "p95": self.percentile(95),
+                           "p99": self.percentile(99), "samples": len(self.latencies_ms)},
+            "probes": self.total,
+            "errors": self.errors,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "last_checked_at": self.last_checked_at,
+        }
+
+
+class HealthMonitor:
+    def __init__(self):
+        # tên -> (hàm probe, hàm lấy chu kỳ) - chu kỳ đọc từ settings mỗi vòng (Hot Reload)
+        self.probes: Dict[str, tuple] = {
+            "postgres": (_probe_postgres, lambda: settings.HEALTH_PROBE_INTERVAL),
+            "redis": (_probe_redis, lambda: settings.HEALTH_PROBE_INTERVAL),
+            "qdrant": (_probe_qdrant, lambda: settings.HEALTH_PROBE_INTERVAL),
+            "embedding": (_probe_embedding, lambda: settings.HEALTH_PROBE_INTERVAL),
+            "llm": (_probe_llm, lambda: settings.HEALTH_LLM_PROBE_INTERVAL),
+        }
+        self.stats: Dict[str, DependencyStats] = {
+            name: DependencyStats(name, settings.HEALTH_WINDOW) for name in self.probes
+        }
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        if self._tasks:
+            return
+        for name, (func, interval) in self.probes.items():
+            self._tasks[name] = asyncio.create_task(self._loop(name, func, interval))
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def probe(self, name: str, func: Callable[[], Awaitable]) -> None:
+        stats = self.stats[name]
+        t0 = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(func(), timeout=settings.HEALTH_PROBE_TIMEOUT)
+            stats.skipped = result == "skipped"
+            if not stats.skipped:
+                stats.record((time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            stats.skipped = False
+            stats.record(None, f"{type(e).__name__}: {e}"[:300])
+
+    async def _loop(self, name: str, func: Callable[[], Awaitable], interval: Callable[[], float]):
+        # Mỗi dependency 1 vòng lặp riêng: 1 probe bị treo (tới timeout) không làm trễ các probe khác
+        while True:
+            seconds = interval()
+            if seconds > 0:
+                await self.probe(name, func)
+            else:
+                self.stats[name].skipped = True
+            await asyncio.sleep(seconds if seconds > 0 else 30)  # Tắt (0): chỉ kiểm tra lại cấu hình định kỳ
+
+    def report(self) -> dict:
+        dependencies = {name: stats.report() for name, stats in self.stats.items()}
+        degraded = [name for name, item in dependencies.items() if item["status"] == "degraded"]
+        return {"status": "degraded" if degraded else "ok", "degraded": degraded, "dependencies": dependencies}
+
+
+health_monitor = HealthMonitor()
@@ -0,0 +1,48 @@
+# app/core/hot_reload.py
+"""
+Áp dụng cấu hình mới lúc đang chạy (thay cho /system/restart -> os._exit).
+reload_config(): đọc lại .env -> tìm key thay đổi -> dựng lại client bị ảnh hưởng (app/core/clients.py)
+-> báo cho các worker khác qua Event Bus (kênh config:reload) để chúng làm tương tự.
+"""
+import asyncio
+import os
+import uuid
+
+from app.core.clients import clients
+from app.core.config import reload_settings
+from app.core.events import event_bus
+
+CHANNEL = "config:reload"
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# Key chỉ có hiệu lực sau khi restart (model nặng / pool DB / Redis của cả process)
+RESTART_REQUIRED_KEYS = {
+    "USE_LOCAL_EMBEDDING", "LOCAL_EMBEDDING_MODEL",
+    "POSTGRES_HOST", "POSTGRES_PORT", "POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB",
+    "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "REDIS_HOST", "REDIS_PORT",
+}
+
+_lock = asyncio.Lock()
+
+
+async def reload_config(broadcast: bool = True) -> dict:
+    async with _lock:  # 2 lần reload chồng nhau -> chạy lần lượt
+        changed = reload_settings()
+        reloaded = await clients.apply(changed) if changed else []
+    if broadcast:
+        await event_bus.publish(CHANNEL, {"origin": WORKER_ID})
+    if changed:
+        print(f"🔁 [Hot Reload] changed={sorted(changed)} rebuilt={reloaded}")
+    return {
+        "changed": sorted(changed),
+        "reloaded_clients": reloaded,
+        "restart_required": sorted(changed & RESTART_REQUIRED_KEYS),
+    }
+
+
+async def _on_reload_event(payload: dict):
+    if payload.get("origin") != WORKER_ID:
+        await reload_config(broadcast=False)
+
+
+event_bus.subscribe(CHANNEL, _on_reload_event)
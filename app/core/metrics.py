@@ -0,0 +1,135 @@
+# app/core/metrics.py
+"""
+Metrics Prometheus (GET /metrics) - đo thời gian từng chặng thay cho print():
+- chat_stage_seconds       : các bước của /api/v2/chat (embedding, cache, hybrid search, LLM, ghi lịch sử...)
+- agent_node_seconds       : các node của Graph V3 (manage_history, agent, tools)
+- agent_tool_seconds       : từng tool / lô tool V3
+- semantic_cache_total     : hit / miss / error của Semantic Cache
+- llm_request_seconds, llm_tokens_total : theo backend (gemini / openai / ollama)
+- dependency_seconds       : latency phía client của Postgres (mỗi câu lệnh), Redis (mỗi round-trip), Qdrant (mỗi lời gọi)
+
+Chi phí trên hot path: mỗi observe() là vài phép cộng có lock (~1µs), label đã bind sẵn ở mức module.
+Chạy nhiều worker (uvicorn --workers / gunicorn): đặt PROMETHEUS_MULTIPROC_DIR -> /metrics gộp số liệu mọi worker.
+"""
+import inspect
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+# Bucket (giây): truy vấn DB/Redis vài ms ... LLM vài chục giây
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Thời gian từng chặng xử lý câu hỏi", ["api", "stage"], buckets=SLOW_BUCKETS
+)
+CHAT_REQUESTS = Counter("chat_requests_total", "Số câu hỏi theo kết quả", ["api", "outcome"])
+AGENT_NODE_SECONDS = Histogram(
+    "agent_node_seconds", "Thời gian chạy node của Graph V3", ["node"], buckets=SLOW_BUCKETS
+)
+AGENT_TOOL_SECONDS = Histogram(
+    "agent_tool_seconds", "Thời gian chạy tool V3 (1 lần gọi hoặc 1 lô)", ["tool", "status"], buckets=SLOW_BUCKETS
+)
+SEMANTIC_CACHE = Counter("semantic_cache_total", "Tra cứu Semantic Cache", ["result"])
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Thời gian 1 lời gọi LLM", ["backend"], buckets=SLOW_BUCKETS
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Token LLM (input = prompt, output = câu trả lời)", ["backend", "direction"])
+DEPENDENCY_SECONDS = Histogram(
+    "dependency_seconds", "Latency phía client của Postgres / Redis / Qdrant", ["dependency", "operation"],
+    buckets=FAST_BUCKETS,
+)
+
+# Label bind sẵn cho các chặng của /api/v2/chat: `with V2_STAGES["embedding"].time(): ...`
+V2_STAGES = {
+    stage: CHAT_STAGE_SECONDS.labels(api="v2", stage=stage)
+    for stage in ("session", "embedding", "cache_lookup", "hybrid_search", "prompt_build",
+                  "llm", "history_write", "cache_save")
+}
+CACHE_HIT = SEMANTIC_CACHE.labels(result="hit")
+CACHE_MISS = SEMANTIC_CACHE.labels(result="miss")
+CACHE_ERROR = SEMANTIC_CACHE.labels(result="error")
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+REDIS_ROUNDTRIP = DEPENDENCY_SECONDS.labels(dependency="redis", operation="roundtrip")
+
+
+def observe_dependency(dependency: str, operation: str):
+    """`with observe_dependency("qdrant", "query_points"): ...`"""
+    return DEPENDENCY_SECONDS.labels(dependency=dependency, operation=operation).time()
+
+
+def record_llm_usage(backend: str, input_tokens, output_tokens) -> None:
+    if input_tokens:
+        LLM_TOKENS.labels(backend=backend, direction="input").inc(input_tokens)
+    if output_tokens:
+        LLM_TOKENS.labels(backend=backend, direction="output").inc(output_tokens)
+
+
+@contextmanager
+def observe_tool(tool: str):
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"  # Gồm cả timeout (CancelledError từ wait_for)
+        raise
+    finally:
+        AGENT_TOOL_SECONDS.labels(tool=tool, status=status).observe(time.perf_counter() - t0)
+
+
+def timed_node(name: str, func):
+    """
+    Bọc 1 node của LangGraph để đo thời gian. LangGraph chỉ truyền `config` cho hàm có tham số `config`
+    -> wrapper giữ nguyên chữ ký đó.
+    """
+    child = AGENT_NODE_SECONDS.labels(node=name)
+    if "config" in inspect.signature(func).parameters:
+        async def node_with_config(state, config):
+            with child.time():
+                return await func(state, config)
+        return node_with_config
+
+    async def node(state):
+        with child.time():
+            return await func(state)
+    return node
+
+
+def instrument_engine(engine) -> None:
+    """Đo thời gian mỗi câu lệnh SQL của AsyncEngine (event của sync_engine bên dưới)"""
+    from sqlalchemy import event
+
+    children = {op: DEPENDENCY_SECONDS.labels(dependency="postgres", operation=op.lower()) for op in SQL_OPERATIONS}
+    other = DEPENDENCY_SECONDS.labels(dependency="postgres", operation="other")
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        words = statement[:32].split(None, 1)
+        operation = words[0].upper() if words else ""
+        children.get(operation, other).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+
+def render_latest() -> tuple:
+    """(body, content_type) cho /metrics"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
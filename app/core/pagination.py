@@ -0,0 +1,79 @@
+# app/core/pagination.py
+"""
+Phân trang Keyset (Cursor) thay cho LIMIT/OFFSET.
+- Sắp xếp theo cặp (cột thời gian, id) giảm dần -> trang sâu vẫn dùng Index, không phải quét bỏ N dòng đầu.
+- Cursor là chuỗi base64 "mờ" (client không cần hiểu), chứa hướng đi + khóa của dòng biên.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import literal, tuple_
+
+
+def encode_cursor(direction: str, key: List[Any]) -> str:
+    payload = {"d": direction, "k": [v.isoformat() if isinstance(v, datetime) else v for v in key]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        direction, (ts, row_id) = payload["d"], payload["k"]
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        if not isinstance(row_id, (int, str)):
+            raise ValueError(row_id)
+        return {"direction": direction, "key": [datetime.fromisoformat(ts) if ts else None, row_id]}
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ.")
+
+
+def escape_like(prefix: str) -> str:
+    """Escape ký tự đặc biệt của LIKE để tìm theo tiền tố"""
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def keyset_paginate(db, query, sort_col, id_col, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Chạy `query` (chưa ORDER BY / LIMIT) theo keyset (sort_col DESC, id_col DESC).
+    Trả về {items, next_cursor, prev_cursor}: next = cũ hơn, prev = mới hơn.
+    """
+    direction, key = "next", None
+    if cursor:
+        decoded = decode_cursor(cursor)
+        direction, key = decoded["direction"], decoded["key"]
+
+    if key:
+        # So sánh theo hàng (row comparison) -> Postgres dùng được Index (…, sort_col, id_col)
+        columns = tuple_(sort_col, id_col)
+        bound = tuple_(literal(key[0], sort_col.type), literal(key[1], id_col.type))
+    if direction == "next":
+        if key:
+            query = query.where(columns < bound)
+        query = query.order_by(sort_col.desc(), id_col.desc())
+    else:
+        query = query.where(columns > bound).order_by(sort_col.asc(), id_col.asc())
+
+    # Lấy dư 1 dòng để biết còn trang tiếp hay không
+    rows = list((await db.execute(query.limit(limit + 1))).mappings().all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == "prev":
+        rows.reverse()
+
+    def key_of(row):
+        return [row[sort_col.name], row[id_col.name]]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if (direction == "next" and has_more) or direction == "prev":
+            next_cursor = encode_cursor("next", key_of(rows[-1]))
+        if (direction == "prev" and has_more) or (direction == "next" and key):
+            prev_cursor = encode_cursor("prev", key_of(rows[0]))
+
+    return {"items": rows, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
@@ -0,0 +1,145 @@
+# app/core/principal_cache.py
+"""
+Cache danh tính người dùng đã xác thực (Principal) cho get_current_user.
+JWT đã được verify chữ ký, chỉ cần biết user còn tồn tại / còn active / role hiện tại.
+- Tầng 1: LRU trong RAM của worker, TTL rất ngắn (AUTH_CACHE_LOCAL_TTL).
+- Tầng 2: Redis auth:principal:{username}, TTL AUTH_CACHE_TTL, dùng chung giữa các worker.
+- invalidate(): tăng generation + xóa Redis + phát sự kiện 'auth:invalidate' để mọi worker xóa LRU của mình.
+- Chống ghi đè bằng dữ liệu cũ: get_current_user lấy snapshot() TRƯỚC khi đọc DB, set() chỉ ghi nếu generation
+  chưa đổi (compare-and-set bằng Lua) -> invalidate chen giữa lúc đọc DB và lúc ghi cache không bị mất.
+Chỉ lưu id / username / role / is_active (không lưu hash mật khẩu, token...).
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.events import event_bus
+from app.core.redis import redis_pool
+
+INVALIDATE_CHANNEL = "auth:invalidate"
+
+# KEYS[1] = principal, KEYS[2] = generation | ARGV: generation lúc snapshot, principal JSON, TTL
+# Chỉ ghi khi generation hiện tại vẫn bằng lúc đọc DB (không có invalidate chen giữa)
+SET_IF_GENERATION_LUA = """
+local current = redis.call('GET', KEYS[2]) or '0'
+if current ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+return 1
+"""
+
+
+class Principal(dict):
+    """Dict hỗ trợ cả current_user['id'] lẫn current_user.id"""
+    FIELDS = ("id", "username", "role", "is_active")
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @classmethod
+    def from_row(cls, row) -> "Principal":
+        return cls({field: row[field] for field in cls.FIELDS})
+
+
+class PrincipalCache:
+    def __init__(self):
+        self.client = redis.Redis(connection_pool=redis_pool)
+        self.local_ttl = settings.AUTH_CACHE_LOCAL_TTL
+        self.ttl = settings.AUTH_CACHE_TTL
+        self.max_entries = settings.AUTH_CACHE_MAX_ENTRIES
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._local_generation = 0  # Tăng mỗi lần có invalidate (bất kỳ user nào) nhận được ở worker này
+        self._set_script = self.client.register_script(SET_IF_GENERATION_LUA)
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+        event_bus.subscribe(INVALIDATE_CHANNEL, self._on_invalidate)
+
+    @staticmethod
+    def _key(username: str) -> str:
+        return f"auth:principal:{username}"
+
+    @staticmethod
+    def _generation_key(username: str) -> str:
+        return f"auth:principal:gen:{username}"
+
+    async def snapshot(self, username: str) -> Tuple[int, Optional[str]]:
+        """Generation (worker, Redis) - gọi TRƯỚC khi đọc DB rồi truyền cho set()"""
+        try:
+            redis_generation = (await self.client.get(self._generation_key(username))) or b"0"
+            redis_generation = redis_generation.decode() if isinstance(redis_generation, bytes) else str(redis_generation)
+        except Exception as e:
+            print(f"⚠️ [Auth Cache Read Error] {e}")
+            redis_generation = None  # Không biết generation -> set() bỏ qua Redis, chỉ ghi LRU
+        return self._local_generation, redis_generation
+
+    async def get(self, username: str) -> Optional[Principal]:
+        entry = self._local.get(username)
+        if entry and entry[0] > time.monotonic():
+            self._local.move_to_end(username)
+            self.stats["local_hits"] += 1
+            return entry[1]
+
+        try:
+            raw = await self.client.get(self._key(username))
+        except Exception as e:
+            print(f"⚠️ [Auth Cache Read Error] {e}")
+            raw = None
+        if raw is not None:
+            principal = Principal(json.loads(raw))
+            self._remember(username, principal)
+            self.stats["redis_hits"] += 1
+            return principal
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, principal: Principal, snapshot: Tuple[int, Optional[str]]) -> None:
+        """Ghi principal vừa đọc từ DB, bỏ qua nếu đã có invalidate kể từ snapshot()"""
+        local_generation, redis_generation = snapshot
+        username = principal["username"]
+        if local_generation == self._local_generation:
+            self._remember(username, principal)
+        if redis_generation is None:
+            return
+        try:
+            await self._set_script(
+                keys=[self._key(username), self._generation_key(username)],
+                args=[redis_generation, json.dumps(principal), self.ttl],
+            )
+        except Exception as e:
+            print(f"⚠️ [Auth Cache Write Error] {e}")
+
+    async def invalidate(self, username: str) -> None:
+        """Gọi sau khi thay đổi user (update / delete / logout / reset mật khẩu)"""
+        self._local_generation += 1
+        self._local.pop(username, None)
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.incr(self._generation_key(username))
+            # Sống lâu hơn principal: hết hạn rồi thì không còn bản cache nào cũ hơn lần invalidate này
+            pipe.expire(self._generation_key(username), self.ttl + 60)
+            pipe.delete(self._key(username))
+            await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [Auth Cache Delete Error] {e}")
+        await event_bus.publish(INVALIDATE_CHANNEL, {"username": username})
+
+    async def _on_invalidate(self, payload: dict) -> None:
+        self._local_generation += 1
+        self._local.pop(payload.get("username"), None)
+
+    def _remember(self, username: str, principal: Principal) -> None:
+        self._local[username] = (time.monotonic() + self.local_ttl, principal)
+        self._local.move_to_end(username)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,63 @@
+# app/core/rate_limit.py
+"""
+Giới hạn tần suất kiểu cửa sổ trượt (Sliding Window Log) trên Redis.
+Mỗi key là 1 ZSET: member = lần thử, score = timestamp. Lua script đảm bảo
+dọn cửa sổ + đếm + ghi nhận là 1 thao tác nguyên tử (nhiều worker cùng đếm không vượt ngưỡng).
+"""
+import time
+import uuid
+
+import redis.asyncio as redis
+
+from app.core.redis import redis_pool
+
+# KEYS[1] = key | ARGV = now, window, limit, member, record(1/0)
+# Trả về 0 nếu được phép, ngược lại số giây phải chờ
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if count >= limit then
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    return math.max(1, math.ceil(tonumber(oldest[2]) + window - now))
+end
+if ARGV[5] == '1' then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('EXPIRE', key, math.ceil(window))
+end
+return 0
+"""
+
+
+class SlidingWindowLimiter:
+    def __init__(self):
+        self.client = redis.Redis(connection_pool=redis_pool)
+        self._script = self.client.register_script(SLIDING_WINDOW_LUA)
+
+    async def hit(self, key: str, limit: int, window: int, record: bool = True) -> int:
+        """
+        Kiểm tra (và ghi nhận nếu record=True) 1 lần thử.
+        Trả về 0 nếu được phép, hoặc số giây cần chờ (Retry-After).
+        Redis lỗi -> cho qua (không để limiter làm sập đăng nhập).
+        """
+        try:
+            now = time.time()
+            retry_after = await self._script(
+                keys=[key], args=[now, window, limit, f"{now}:{uuid.uuid4().hex[:8]}", "1" if record else "0"]
+            )
+            return int(retry_after)
+        except Exception as e:
+            print(f"⚠️ [Rate Limit Error] {e}")
+            return 0
+
+    async def reset(self, key: str) -> None:
+        try:
+            await self.client.delete(key)
+        except Exception as e:
+            print(f"⚠️ [Rate Limit Error] {e}")
+
+
+limiter = SlidingWindowLimiter()
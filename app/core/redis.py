@@ -1,13 +1,38 @@
 # app/core/redis.py
+import time
+
 import redis.asyncio as redis
 from app.core.config import settings
+from app.core.metrics import REDIS_ROUNDTRIP
+
+
+
+class TimedConnection(redis.Connection):
+    """
+    [MỚI] Đo round-trip Redis cho /metrics: từ lúc gửi lệnh (hoặc cả pipeline) tới khi đọc được phản hồi đầu tiên.
+    Lần đọc không đi kèm lệnh gửi (Pub/Sub listen) không được tính.
+    """
+    _sent_at = None
+
+    async def send_packed_command(self, command, check_health: bool = True):
+        self._sent_at = time.perf_counter()
+        await super().send_packed_command(command, check_health)
+
+    async def read_response(self, *args, **kwargs):
+        response = await super().read_response(*args, **kwargs)
+        if self._sent_at is not None:
+            REDIS_ROUNDTRIP.observe(time.perf_counter() - self._sent_at)
+            self._sent_at = None
+        return response
+
 
 # Tạo connection pool để tái sử dụng kết nối (Quan trọng cho Scalability)
 redis_pool = redis.ConnectionPool(
     host=settings.REDIS_HOST, 
     port=settings.REDIS_PORT, 
     db=0, 
-    decode_responses=True
+    decode_responses=True,
+    connection_class=TimedConnection,
 )
 
 # Hàm lấy client (dùng trong Dependency)
@@ -0,0 +1,113 @@
+# app/core/startup_profiler.py
+"""
+Đo thời gian khởi động:
+1. Import: chạy `python -X importtime -c "import app.main"` trong process con, gom thời gian theo package.
+2. Init: các bước trong lifespan được bọc bằng `startup_profiler.step(name)`, xem qua /system/health.
+
+Kiểm tra ngân sách (dùng trong CI):
+    python -m app.core.startup_profiler --budget 3 --top 15
+Thoát với mã 1 nếu thời gian import app.main vượt ngân sách (mặc định STARTUP_IMPORT_BUDGET).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.steps: Dict[str, float] = {}
+        self.ready_at = None
+
+    @contextmanager
+    def step(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round(time.perf_counter() - t0, 3)
+
+    def mark_ready(self):
+        self.ready_at = time.perf_counter()
+        print(f"⏱️ [Startup] Ready in {self.ready_at - self.started_at:.2f}s (since app.main import). Steps: {self.steps}")
+
+    def report(self) -> dict:
+        return {
+            "ready_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "steps": self.steps,
+        }
+
+
+startup_profiler = StartupProfiler()
+
+
+def profile_imports(target: str = "app.main") -> Tuple[float, List[Tuple[str, float, float]]]:
+    """
+    Import `target` trong process sạch với -X importtime.
+    Trả về (tổng giây, [(module, self giây, cumulative giây), ...]).
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules.append((name.rstrip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+        except ValueError:
+            continue
+    return wall, modules
+
+
+def top_level_packages(modules: List[Tuple[str, float, float]]) -> Dict[str, float]:
+    """Cộng thời gian 'self' theo package gốc (torch, langchain_core, app...)"""
+    totals = defaultdict(float)
+    for name, self_s, _ in modules:
+        totals[name.strip().split(".")[0]] += self_s
+    return dict(sorted(totals.items(), key=lambda kv: kv[1], reverse=True))
+
+
+def main():
+    from app.core.config import settings
+
+    parser = argparse.ArgumentParser(description="Đo thời gian import app.main")
+    parser.add_argument("--target", default="app.main")
+    parser.add_argument("--budget", type=float, default=settings.STARTUP_IMPORT_BUDGET, help="Giây")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    wall, modules = profile_imports(args.target)
+    print(f"\n📦 Top packages theo thời gian import (self):")
+    for package, seconds in list(top_level_packages(modules).items())[:args.top]:
+        print(f"   {package:<30} {seconds * 1000:8.1f} ms")
+
+    app_modules = sorted((m for m in modules if m[0].strip().startswith("app")), key=lambda m: m[2], reverse=True)
+    print(f"\n🧩 Module của app (cumulative):")
+    for name, _, cumulative in app_modules[:args.top]:
+        print(f"   {name.strip():<40} {cumulative * 1000:8.1f} ms")
+
+    print(f"\n⏱️ import {args.target}: {wall:.2f}s (ngân sách {args.budget:.2f}s)")
+    if wall > args.budget:
+        print("❌ Vượt ngân sách khởi động!")
+        sys.exit(1)
+    print("✅ Trong ngân sách.")
+
+
+if __name__ == "__main__":
+    main()
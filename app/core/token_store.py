@@ -0,0 +1,97 @@
+# app/core/token_store.py
+"""
+Kho Refresh Token trong Redis (thay cho cột users.refresh_token).
+- rt:{jti}            -> JSON {user_id, username, role, device, created_at}, TTL = hạn của refresh token
+- rt:user:{user_id}   -> SET các jti của user (mỗi thiết bị 1 jti) -> đăng nhập nhiều thiết bị cùng lúc
+- rt:deny:{jti}       -> Access Token của phiên đã thu hồi (TTL = hạn Access Token), kiểm tra O(1)
+Access Token mang claim 'sid' = jti của phiên đăng nhập sinh ra nó.
+"""
+import json
+import time
+import uuid
+from typing import List, Optional
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.redis import redis_pool
+
+
+class RefreshTokenStore:
+    def __init__(self):
+        self.client = redis.Redis(connection_pool=redis_pool)
+
+    @property
+    def ttl(self) -> int:
+        return settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+
+    @property
+    def deny_ttl(self) -> int:
+        return settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    @staticmethod
+    def new_jti() -> str:
+        return uuid.uuid4().hex
+
+    async def add(self, jti: str, user_id: int, username: str, role: str, device: str = "") -> None:
+        entry = {
+            "user_id": user_id,
+            "username": username,
+            "role": role,
+            "device": device[:200],
+            "created_at": int(time.time()),
+        }
+        user_key = f"rt:user:{user_id}"
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(f"rt:{jti}", json.dumps(entry, ensure_ascii=False), ex=self.ttl)
+        pipe.sadd(user_key, jti)
+        pipe.expire(user_key, self.ttl)
+        await pipe.execute()
+
+    async def get(self, jti: str) -> Optional[dict]:
+        raw = await self.client.get(f"rt:{jti}")
+        return json.loads(raw) if raw else None
+
+    async def list_sessions(self, user_id: int) -> List[dict]:
+        """Các thiết bị đang đăng nhập (dọn luôn jti đã hết hạn khỏi SET)"""
+        user_key = f"rt:user:{user_id}"
+        jtis = list(await self.client.smembers(user_key))
+        if not jtis:
+            return []
+        raws = await self.client.mget([f"rt:{jti}" for jti in jtis])
+        sessions, expired = [], []
+        for jti, raw in zip(jtis, raws):
+            if raw is None:
+                expired.append(jti)
+                continue
+            entry = json.loads(raw)
+            sessions.append({"sid": jti, "device": entry["device"], "created_at": entry["created_at"]})
+        if expired:
+            await self.client.srem(user_key, *expired)
+        return sorted(sessions, key=lambda s: s["created_at"], reverse=True)
+
+    async def revoke(self, jti: str, user_id: int) -> None:
+        """Đăng xuất 1 thiết bị: xóa refresh token + chặn Access Token còn hạn của phiên đó"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(f"rt:{jti}")
+        pipe.srem(f"rt:user:{user_id}", jti)
+        pipe.set(f"rt:deny:{jti}", 1, ex=self.deny_ttl)
+        await pipe.execute()
+
+    async def revoke_all(self, user_id: int) -> int:
+        """Đăng xuất mọi nơi"""
+        user_key = f"rt:user:{user_id}"
+        jtis = list(await self.client.smembers(user_key))
+        pipe = self.client.pipeline(transaction=True)
+        for jti in jtis:
+            pipe.delete(f"rt:{jti}")
+            pipe.set(f"rt:deny:{jti}", 1, ex=self.deny_ttl)
+        pipe.delete(user_key)
+        await pipe.execute()
+        return len(jtis)
+
+    async def is_revoked(self, jti: str) -> bool:
+        return bool(await self.client.exists(f"rt:deny:{jti}"))
+
+
+token_store = RefreshTokenStore()
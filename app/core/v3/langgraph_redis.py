@@ -1,14 +1,52 @@
-import pickle
-from typing import Any, Optional, AsyncIterator,List,Tuple
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Optional, AsyncIterator, List, Tuple
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointMetadata, CheckpointTuple, get_checkpoint_id
 from redis.asyncio import Redis
 from app.core.config import settings
 
+try:
+    from langgraph.checkpoint.base import WRITES_IDX_MAP
+except ImportError:  # langgraph-checkpoint cũ
+    WRITES_IDX_MAP = {}
+
+try:
+    from langgraph.checkpoint.base import get_checkpoint_metadata
+except ImportError:
+    def get_checkpoint_metadata(config, metadata):
+        return metadata
+
+# Nén zstd là tùy chọn: thiếu thư viện thì lưu thô
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Header 1 byte đứng đầu mỗi value để biết có nén hay không
+_RAW = b"r"
+_ZSTD = b"z"
+_EMPTY = b"e"
+_DELTA = b"d"
+_COMPRESS_MIN_BYTES = 512
+_MAX_TRACKED_THREADS = 10000
+
+
 class AsyncRedisSaver(BaseCheckpointSaver):
     """
     Custom Checkpointer: Lưu trạng thái của Agent vào Redis.
     Giúp Bot 'nhớ' được ngữ cảnh câu chuyện giữa các request.
+
+    [NÂNG CẤP] Lưu dạng tăng dần (incremental) thay vì pickle cả state mỗi bước:
+    - checkpoint:{thread}:{ns}:{id}         HASH  -> khung checkpoint + metadata + parent (không chứa channel_values)
+    - checkpoint_blob:{thread}:{ns}:{ch}:{v} STRING -> giá trị của 1 channel tại 1 version (chỉ ghi channel thay đổi).
+      Với channel dạng list tin nhắn (messages) chỉ ghi phần tin nhắn MỚI nối thêm (delta) so với version trước,
+      cứ CHECKPOINT_SNAPSHOT_EVERY delta thì ghi lại 1 bản đầy đủ để chuỗi đọc không quá dài.
+      Tin nhắn cũ bị thay tại chỗ (cùng id, nội dung khác - VD rút gọn kết quả tool) -> ghi bản đầy đủ.
+    - checkpoint_writes:{thread}:{ns}:{id}  HASH  -> pending writes của từng task
+    - checkpoint_index:{thread}:{ns}        ZSET  -> danh sách checkpoint id (uuid6, sắp theo thứ tự từ điển)
+    Serialize bằng serde của LangGraph (+ zstd nếu có), đọc/ghi gom theo pipeline.
     """
     def __init__(self):
         super().__init__()
@@ -16,20 +54,87 @@ class AsyncRedisSaver(BaseCheckpointSaver):
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
             db=0,
-            decode_responses=False # Bắt buộc False để lưu bytes (pickle)
+            decode_responses=False # Bắt buộc False để lưu bytes
         )
+        self.ttl = settings.CHECKPOINT_TTL_SECONDS
+        self.keep_last = max(1, settings.CHECKPOINT_KEEP_LAST)
+        use_zstd = settings.CHECKPOINT_COMPRESSION.lower() == "zstd" and zstandard is not None
+        self._compressor = zstandard.ZstdCompressor(level=3) if use_zstd else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+        self.snapshot_every = max(1, settings.CHECKPOINT_SNAPSHOT_EVERY)
+        # Trạng thái checkpoint cuối cùng mà worker này đã ghi cho từng thread
+        # (thread, ns) -> {"id": checkpoint_id, "channels": {channel: {"version", "fingerprints", "chain"}}}
+        self._heads: OrderedDict = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # KEY HELPERS
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _checkpoint_key(thread_id: str, ns: str, checkpoint_id: str) -> str:
+        return f"checkpoint:{thread_id}:{ns}:{checkpoint_id}"
+
+    @staticmethod
+    def _blob_key(thread_id: str, ns: str, channel: str, version: Any) -> str:
+        return f"checkpoint_blob:{thread_id}:{ns}:{channel}:{version}"
+
+    @staticmethod
+    def _writes_key(thread_id: str, ns: str, checkpoint_id: str) -> str:
+        return f"checkpoint_writes:{thread_id}:{ns}:{checkpoint_id}"
+
+    @staticmethod
+    def _index_key(thread_id: str, ns: str) -> str:
+        return f"checkpoint_index:{thread_id}:{ns}"
+
+    # ------------------------------------------------------------------
+    # SERIALIZATION
+    # ------------------------------------------------------------------
+    def _dumps(self, obj: Any) -> bytes:
+        type_, data = self.serde.dumps_typed(obj)
+        payload = type_.encode() + b"\x00" + data
+        if self._compressor is not None and len(payload) >= _COMPRESS_MIN_BYTES:
+            return _ZSTD + self._compressor.compress(payload)
+        return _RAW + payload
+
+    def _loads(self, raw: bytes) -> Any:
+        header, body = raw[:1], raw[1:]
+        if header == _ZSTD:
+            if self._decompressor is None:
+                raise RuntimeError("Checkpoint được nén zstd nhưng thiếu thư viện 'zstandard'.")
+            body = self._decompressor.decompress(body)
+        type_, _, data = body.partition(b"\x00")
+        return self.serde.loads_typed((type_.decode(), data))
+
+    # ------------------------------------------------------------------
+    # WRITE PATH
+    # ------------------------------------------------------------------
     async def aput_writes(
         self,
         config: RunnableConfig,
         writes: List[Tuple[str, Any]],
         task_id: str,
+        task_path: str = "",
     ) -> None:
         """
-        Lưu các dữ liệu ghi trung gian (Required by LangGraph mới).
-        Đối với Chatbot cơ bản không cần resume phức tạp, ta có thể để trống (pass)
-        để tránh lỗi NotImplementedError.
+        Lưu các dữ liệu ghi trung gian (pending writes) của 1 task.
+        Giúp Graph resume đúng nếu 1 bước bị gián đoạn giữa chừng.
         """
-        pass
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        key = self._writes_key(thread_id, ns, checkpoint_id)
+
+        pipe = self.client.pipeline(transaction=False)
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            field = f"{task_id}:{write_idx}"
+            data = channel.encode() + b"\x00" + task_path.encode() + b"\x00" + self._dumps(value)
+            if write_idx >= 0:
+                pipe.hsetnx(key, field, data)  # Write thường: không ghi đè
+            else:
+                pipe.hset(key, field, data)    # Write đặc biệt (error/interrupt): ghi đè
+        pipe.expire(key, self.ttl)
+        await pipe.execute()
+
     async def aput(
         self,
         config: RunnableConfig,
@@ -37,39 +142,268 @@ class AsyncRedisSaver(BaseCheckpointSaver):
         metadata: CheckpointMetadata,
         new_versions: dict[str, Any],
     ) -> RunnableConfig:
-        """Ghi state vào Redis"""
+        """Ghi state vào Redis (chỉ ghi các channel có version mới)"""
         thread_id = config["configurable"]["thread_id"]
-        
-        # Serialize object thành bytes
-        data = pickle.dumps({
-            "checkpoint": checkpoint,
-            "metadata": metadata,
-            "versions": new_versions
+        ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        versions = c["channel_versions"]
+
+        # Chỉ dùng delta khi checkpoint cha chính là checkpoint cuối worker này đã ghi
+        # (nếu worker khác đã ghi xen vào thì ghi bản đầy đủ cho an toàn)
+        head = self._heads.get((thread_id, ns))
+        prev_channels = head["channels"] if head and head["id"] == parent_id else {}
+        new_channels = {ch: info for ch, info in prev_channels.items() if ch not in new_versions}
+
+        pipe = self.client.pipeline(transaction=False)
+        # 1. Blob cho các channel vừa thay đổi
+        for channel, version in new_versions.items():
+            key = self._blob_key(thread_id, ns, channel, version)
+            if channel not in values:
+                pipe.set(key, _EMPTY, ex=self.ttl)
+                continue
+            value = values[channel]
+            fingerprints = _message_fingerprints(value)
+            prev = prev_channels.get(channel)
+            if (
+                fingerprints is not None and prev is not None
+                and len(prev["chain"]) < self.snapshot_every
+                and fingerprints[:len(prev["fingerprints"])] == prev["fingerprints"]
+            ):
+                # Delta: chỉ lưu các tin nhắn mới nối thêm (các tin nhắn cũ giữ nguyên cả id lẫn nội dung)
+                appended = value[len(prev["fingerprints"]):]
+                pipe.set(key, _DELTA + str(prev["version"]).encode() + b"\x00" + self._dumps(appended), ex=self.ttl)
+                chain = prev["chain"] + [prev["version"]]
+            else:
+                pipe.set(key, self._dumps(value), ex=self.ttl)
+                chain = []
+            if fingerprints is not None:
+                new_channels[channel] = {"version": version, "fingerprints": fingerprints, "chain": chain}
+
+        # Danh sách mọi blob checkpoint này cần (kể cả các version gốc của chuỗi delta)
+        refs = [[ch, v] for ch, v in versions.items()]
+        for channel, info in new_channels.items():
+            refs.extend([channel, base] for base in info["chain"])
+
+        # Gia hạn TTL cho các blob cũ vẫn đang được checkpoint mới tham chiếu
+        for channel, version in refs:
+            if channel not in new_versions or version != new_versions[channel]:
+                pipe.expire(self._blob_key(thread_id, ns, channel, version), self.ttl)
+
+        # 2. Khung checkpoint (nhỏ, không chứa channel_values)
+        ckey = self._checkpoint_key(thread_id, ns, checkpoint["id"])
+        pipe.hset(ckey, mapping={
+            "checkpoint": self._dumps(c),
+            "metadata": self._dumps(get_checkpoint_metadata(config, metadata)),
+            "parent": parent_id or "",
+            "refs": json.dumps(refs),
         })
-        
-        # Lưu với key "checkpoint:{session_id}"
-        # TTL: Tự động xóa sau 7 ngày (604800 giây) để dọn rác
-        await self.client.set(f"checkpoint:{thread_id}", data, ex=604800)
-        
-        return config
+        pipe.expire(ckey, self.ttl)
+
+        # 3. Index
+        index_key = self._index_key(thread_id, ns)
+        pipe.zadd(index_key, {checkpoint["id"]: 0})
+        pipe.expire(index_key, self.ttl)
+        pipe.zcard(index_key)
+
+        results = await pipe.execute()
+        self._remember_head(thread_id, ns, checkpoint["id"], new_channels)
+        if results[-1] > self.keep_last:
+            await self._prune(thread_id, ns, refs)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def _remember_head(self, thread_id: str, ns: str, checkpoint_id: str, channels: dict) -> None:
+        key = (thread_id, ns)
+        self._heads[key] = {"id": checkpoint_id, "channels": channels}
+        self._heads.move_to_end(key)
+        while len(self._heads) > _MAX_TRACKED_THREADS:
+            self._heads.popitem(last=False)
+
+    async def _prune(self, thread_id: str, ns: str, latest_refs: list) -> None:
+        """
+        Chỉ giữ lại N checkpoint gần nhất của thread.
+        Blob của checkpoint bị xóa chỉ bị xóa theo nếu không còn checkpoint nào giữ lại tham chiếu tới.
+        """
+        index_key = self._index_key(thread_id, ns)
+        ids = [i.decode() for i in await self.client.zrange(index_key, 0, -1)]
+        stale, kept = ids[:-self.keep_last], ids[-self.keep_last:]
+        if not stale:
+            return
+
+        pipe = self.client.pipeline(transaction=False)
+        for cid in stale + kept:
+            pipe.hget(self._checkpoint_key(thread_id, ns, cid), "refs")
+        raw_refs = await pipe.execute()
+
+        referenced = {(ch, str(v)) for ch, v in latest_refs}
+        for raw in raw_refs[len(stale):]:
+            if raw:
+                referenced.update((ch, str(v)) for ch, v in json.loads(raw))
 
+        keys_to_delete = []
+        for cid, raw in zip(stale, raw_refs[:len(stale)]):
+            keys_to_delete.append(self._checkpoint_key(thread_id, ns, cid))
+            keys_to_delete.append(self._writes_key(thread_id, ns, cid))
+            if raw:
+                for ch, v in json.loads(raw):
+                    if (ch, str(v)) not in referenced:
+                        keys_to_delete.append(self._blob_key(thread_id, ns, ch, v))
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(*keys_to_delete)
+        pipe.zrem(index_key, *stale)
+        await pipe.execute()
+
+    # ------------------------------------------------------------------
+    # READ PATH
+    # ------------------------------------------------------------------
     async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
         """Đọc state từ Redis"""
         thread_id = config["configurable"]["thread_id"]
-        data = await self.client.get(f"checkpoint:{thread_id}")
-        
-        if not data:
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        if not checkpoint_id:
+            latest = await self.client.zrevrangebylex(self._index_key(thread_id, ns), "+", "-", start=0, num=1)
+            if not latest:
+                return None
+            checkpoint_id = latest[0].decode()
+
+        return await self._load_tuple(thread_id, ns, checkpoint_id)
+
+    async def _load_tuple(self, thread_id: str, ns: str, checkpoint_id: str) -> Optional[CheckpointTuple]:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self._checkpoint_key(thread_id, ns, checkpoint_id))
+        pipe.hgetall(self._writes_key(thread_id, ns, checkpoint_id))
+        saved, raw_writes = await pipe.execute()
+        if not saved:
             return None
-            
-        saved_data = pickle.loads(data)
+
+        checkpoint = self._loads(saved[b"checkpoint"])
+        metadata = self._loads(saved[b"metadata"])
+        parent_id = saved.get(b"parent", b"").decode()
+
+        # Gom toàn bộ blob cần thiết (kể cả gốc của chuỗi delta) vào 1 lệnh MGET
+        refs = json.loads(saved[b"refs"]) if saved.get(b"refs") else list(checkpoint["channel_versions"].items())
+        blobs = {}
+        if refs:
+            raw_blobs = await self.client.mget([self._blob_key(thread_id, ns, ch, v) for ch, v in refs])
+            blobs = {(ch, str(v)): blob for (ch, v), blob in zip(refs, raw_blobs)}
+
+        channel_values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            value = self._resolve_blob(blobs, channel, str(version))
+            if value is not _MISSING:
+                channel_values[channel] = value
+
+        pending_writes = []
+        for field, data in raw_writes.items():
+            task_id, _, idx = field.decode().rpartition(":")
+            channel, task_path, value = data.split(b"\x00", 2)
+            pending_writes.append((task_path.decode(), task_id, int(idx), channel.decode(), value))
+        pending_writes.sort(key=lambda w: (w[0], w[1], w[2]))
+
         return CheckpointTuple(
-            config, 
-            saved_data["checkpoint"], 
-            saved_data["metadata"], 
-            (None, None), # parent_config (bỏ qua)
-            [] # pending_writes (bỏ qua)
+            {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            {**checkpoint, "channel_values": channel_values},
+            metadata,
+            (
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            [(task_id, channel, self._loads(value)) for _, task_id, _, channel, value in pending_writes],
         )
 
+    def _resolve_blob(self, blobs: dict, channel: str, version: str) -> Any:
+        """Giải mã 1 blob; nếu là delta thì ghép với các version gốc trong chuỗi"""
+        blob = blobs.get((channel, version))
+        if blob is None or blob == _EMPTY:
+            return _MISSING
+        if blob[:1] != _DELTA:
+            return self._loads(blob)
+        base_version, _, data = blob[1:].partition(b"\x00")
+        base = self._resolve_blob(blobs, channel, base_version.decode())
+        if base is _MISSING:
+            raise RuntimeError(f"Thiếu blob gốc '{channel}:{base_version.decode()}' của chuỗi delta.")
+        return list(base) + list(self._loads(data))
+
     async def alist(self, config: RunnableConfig, *, filter: dict[str, Any] | None = None, before: RunnableConfig | None = None, limit: int | None = None) -> AsyncIterator[CheckpointTuple]:
-        """Hàm liệt kê (Chưa cần thiết cho Chatbot cơ bản)"""
-        yield None
\ No newline at end of file
+        """Liệt kê checkpoint của 1 thread (mới nhất trước)"""
+        if not config:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        before_id = get_checkpoint_id(before) if before else None
+
+        ids = [i.decode() for i in await self.client.zrevrange(self._index_key(thread_id, ns), 0, -1)]
+        for checkpoint_id in ids:
+            if before_id and checkpoint_id >= before_id:
+                continue
+            item = await self._load_tuple(thread_id, ns, checkpoint_id)
+            if item is None:
+                continue
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                if limit <= 0:
+                    break
+                limit -= 1
+            yield item
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Xóa toàn bộ checkpoint, blob và pending writes của 1 thread"""
+        keys = []
+        for prefix in ("checkpoint", "checkpoint_blob", "checkpoint_writes", "checkpoint_index"):
+            async for key in self.client.scan_iter(match=f"{prefix}:{thread_id}:*", count=500):
+                keys.append(key)
+        # Cache kết quả tool theo thread (app.services.v3.tool_cache) sống cùng checkpoint
+        keys.append(f"checkpoint_toolcache:{thread_id}")
+        for i in range(0, len(keys), 500):
+            await self.client.delete(*keys[i:i + 500])
+        for key in [k for k in self._heads if k[0] == thread_id]:
+            self._heads.pop(key, None)
+
+
+_MISSING = object()
+
+
+def _message_fingerprints(value: Any):
+    """
+    Trả về tuple (id, hash nội dung) nếu value là list tin nhắn (có id) -> đủ điều kiện lưu delta.
+    So cả hash nội dung vì add_messages cho phép thay tin nhắn tại chỗ dưới cùng id.
+    """
+    if not isinstance(value, list):
+        return None
+    fingerprints = []
+    for m in value:
+        message_id = getattr(m, "id", None)
+        if not message_id:
+            return None
+        fingerprints.append((message_id, _content_hash(m)))
+    return tuple(fingerprints)
+
+
+def _content_hash(message: Any) -> str:
+    parts = (
+        type(message).__name__,
+        repr(getattr(message, "content", None)),
+        repr(getattr(message, "tool_calls", None)),
+        repr(getattr(message, "additional_kwargs", None)),
+        repr(getattr(message, "artifact", None)),
+    )
+    return hashlib.blake2b("\x00".join(parts).encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
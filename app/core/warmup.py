@@ -0,0 +1,146 @@
+# app/core/warmup.py
+"""
+Warm-up sau khi khởi động + trạng thái sẵn sàng cho Load Balancer.
+- /livez : process còn sống (event loop phản hồi) -> luôn 200, kể cả khi đang warm-up.
+- /readyz: 200 chỉ khi mọi bước BẮT BUỘC đã warm xong, ngược lại 503 -> LB chưa route request vào worker này.
+Warm-up chạy nền (không chặn lifespan): request đầu tiên của user không phải trả chi phí
+load model / JIT kernel / tạo collection / mở kết nối lần đầu.
+Bước lỗi (DB, Redis, Qdrant chưa lên) được thử lại sau WARMUP_RETRY_INTERVAL giây.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+
+WARMUP_TEXT = "Bữa sáng nhiều protein cho người tập gym"
+
+
+async def _warm_embedding():
+    from app.services.embedding_bge_service import get_bge_service
+    embedder = await asyncio.to_thread(get_bge_service)  # Load model (vài giây)
+    await embedder.aembed_hybrid(WARMUP_TEXT)              # Lượt encode đầu: khởi tạo kernel / JIT
+    await embedder.aembed_hybrid_batch([WARMUP_TEXT, WARMUP_TEXT])
+
+
+async def _warm_postgres():
+    from app.api.deps import engine
+    if engine is None:  # Chưa qua Setup Wizard
+        return "skipped: database not configured"
+
+    async def checkout():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Mở đồng thời N connection -> được trả về pool và giữ lại cho các request sau
+    await asyncio.gather(*(checkout() for _ in range(max(1, settings.WARMUP_DB_CONNECTIONS))))
+
+
+async def _warm_redis():
+    import redis.asyncio as redis
+    from app.core.redis import redis_pool
+    client = redis.Redis(connection_pool=redis_pool)
+    try:
+        await client.ping()
+    finally:
+        await client.close()
+
+
+async def _warm_qdrant():
+    from app.core.clients import async_qdrant_slot, qdrant_slot
+    from app.services.cache_service import cache_service
+
+    def sync_part():
+        with qdrant_slot.lease() as client:
+            client.get_collections()
+        cache_service._ensure_collection()  # Tạo gym_chat_cache nếu chưa có
+        if not cache_service._is_initialized:
+            raise RuntimeError(f"cache collection '{cache_service.collection_name}' not ready")
+
+    await asyncio.to_thread(sync_part)
+    with async_qdrant_slot.lease() as client:
+        await client.get_collections()  # Client async của Tools V3
+
+
+async def _warm_agent_v3():
+    if not settings.WARMUP_AGENT_V3:
+        return "skipped: WARMUP_AGENT_V3=False"
+    from app.services.v3 import get_agent_v3
+    await asyncio.to_thread(get_agent_v3)  # Import langchain/langgraph + build graph
+
+
+class Readiness:
+    def __init__(self):
+        # (tên, hàm warm-up, bắt buộc cho readiness?)
+        self.steps: List[tuple] = [
+            ("postgres", _warm_postgres, True),
+            ("redis", _warm_redis, True),
+            ("qdrant", _warm_qdrant, True),
+            ("embedding", _warm_embedding, True),
+            ("agent_v3", _warm_agent_v3, False),
+        ]
+        self.results: Dict[str, dict] = {name: {"status": "pending"} for name, _, _ in self.steps}
+        self.started = False  # Lifespan đã chạy tới yield
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        if not self.started:
+            return False
+        return all(self.results[name]["status"] == "ok" for name, _, required in self.steps if required)
+
+    def report(self) -> dict:
+        return {"ready": self.ready, "steps": self.results}
+
+    async def start(self):
+        self.started = True
+        if not settings.WARMUP_ENABLED:
+            for name, _, _ in self.steps:
+                self.results[name] = {"status": "ok", "detail": "skipped: WARMUP_ENABLED=False"}
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.started = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_step(self, name: str, func: Callable[[], Awaitable]) -> bool:
+        t0 = time.perf_counter()
+        self.results[name] = {"status": "running"}
+        try:
+            detail = await asyncio.wait_for(func(), timeout=settings.WARMUP_STEP_TIMEOUT)
+            self.results[name] = {"status": "ok", "seconds": round(time.perf_counter() - t0, 3)}
+            if detail:
+                self.results[name]["detail"] = detail
+            return True
+        except Exception as e:
+            self.results[name] = {"status": "error", "error": str(e) or type(e).__name__,
+                                  "seconds": round(time.perf_counter() - t0, 3)}
+            print(f"⚠️ [Warm-up] {name} failed: {e}")
+            return False
+
+    async def _run(self):
+        pending = {name: func for name, func, _ in self.steps}
+        t0 = time.perf_counter()
+        while pending:
+            # Các bước độc lập -> chạy song song (I/O mạng chồng lên thời gian load model)
+            names = list(pending)
+            results = await asyncio.gather(*(self._run_step(name, pending[name]) for name in names))
+            for name, ok in zip(names, results):
+                if ok:
+                    pending.pop(name)
+            if pending:
+                await asyncio.sleep(settings.WARMUP_RETRY_INTERVAL)
+        print(f"🔥 [Warm-up] All steps warm in {time.perf_counter() - t0:.2f}s")
+
+
+readiness = Readiness()
@@ -0,0 +1,61 @@
+# app/db/engine_registry.py
+"""
+Engine đồng bộ (sync) dùng chung cho Setup Wizard / Migration, mỗi DATABASE_URL 1 engine có pool nhỏ.
+Trước đây mỗi request tạo create_engine() mới và không dispose -> mỗi lần frontend poll /status
+lại mở thêm 1 pool, rò rỉ kết nối tới khi Postgres báo "too many clients".
+"""
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+
+
+class EngineRegistry:
+    def __init__(self):
+        self._engines: Dict[str, Engine] = {}
+        self._lock = threading.Lock()  # get() được gọi cả từ thread pool (asyncio.to_thread)
+
+    def get(self, url: str) -> Engine:
+        with self._lock:
+            engine = self._engines.get(url)
+            if engine is None:
+                engine = create_engine(
+                    url,
+                    pool_size=settings.SETUP_DB_POOL_SIZE,
+                    max_overflow=settings.SETUP_DB_MAX_OVERFLOW,
+                    pool_timeout=settings.DB_POOL_TIMEOUT,
+                    pool_recycle=settings.DB_POOL_RECYCLE,
+                    pool_pre_ping=True,
+                    connect_args={"connect_timeout": settings.DB_CONNECT_TIMEOUT},
+                )
+                self._engines[url] = engine
+            return engine
+
+    def retain(self, url: Optional[str]) -> int:
+        """Cấu hình DB vừa đổi: đóng pool của các URL cũ, chỉ giữ lại `url`"""
+        with self._lock:
+            stale = [key for key in self._engines if key != url]
+            engines = [self._engines.pop(key) for key in stale]
+        for engine in engines:
+            engine.dispose()
+        return len(engines)
+
+    def dispose_all(self) -> None:
+        self.retain(None)
+
+    @staticmethod
+    def probe(url: str) -> None:
+        """Thử kết nối tới URL chưa lưu (Step 2 - Test): NullPool, không giữ lại kết nối nào"""
+        engine = create_engine(url, poolclass=NullPool, connect_args={"connect_timeout": settings.DB_CONNECT_TIMEOUT})
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        finally:
+            engine.dispose()
+
+
+engine_registry = EngineRegistry()
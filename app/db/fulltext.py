@@ -0,0 +1,109 @@
+# app/db/fulltext.py
+"""
+Tìm kiếm toàn văn (Full-Text Search) trên chat_history.
+- Cấu hình vn_unaccent: tách từ 'simple' (tiếng Việt không có stemmer) + unaccent
+  -> "whey protein", "đạm whey", "dam whey" đều khớp nhau.
+- Cột search_vector được trigger tính khi INSERT/UPDATE (câu hỏi trọng số A, câu trả lời B).
+- Index GIN (user_id, search_vector) cần btree_gin -> lọc theo user + khớp từ khóa trong 1 lần quét index.
+"""
+from app.db.partitions import PARENT_TABLE
+
+SEARCH_CONFIG = "vn_unaccent"
+
+# Phải chạy TRƯỚC create_all (index GIN trên cột integer cần btree_gin)
+EXTENSIONS_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+]
+
+CONFIG_SQL = f"""
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{SEARCH_CONFIG}') THEN
+        CREATE TEXT SEARCH CONFIGURATION {SEARCH_CONFIG} (COPY = simple);
+        ALTER TEXT SEARCH CONFIGURATION {SEARCH_CONFIG}
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, simple;
+    END IF;
+END $$
+"""
+
+# Hàm tạo tsvector dùng chung cho trigger và backfill
+DOCUMENT_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION {PARENT_TABLE}_search_doc(question text, answer text) RETURNS tsvector
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(question, '')), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(answer, '')), 'B')
+$$
+"""
+
+TRIGGER_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION {PARENT_TABLE}_search_vector_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := {PARENT_TABLE}_search_doc(NEW.question, NEW.answer);
+    RETURN NEW;
+END $$
+"""
+
+# Trigger BEFORE ... FOR EACH ROW trên bảng đã phân vùng cần PostgreSQL 13+
+TRIGGER_SQL = [
+    f"DROP TRIGGER IF EXISTS {PARENT_TABLE}_search_vector ON {PARENT_TABLE}",
+    f"""CREATE TRIGGER {PARENT_TABLE}_search_vector
+        BEFORE INSERT OR UPDATE OF question, answer ON {PARENT_TABLE}
+        FOR EACH ROW EXECUTE FUNCTION {PARENT_TABLE}_search_vector_trigger()""",
+]
+
+# Dữ liệu cũ (trước khi có cột / trigger): tính theo lô id
+BACKFILL_SQL = f"""
+    WITH batch AS (
+        SELECT id FROM {PARENT_TABLE}
+        WHERE id > :last_id AND search_vector IS NULL
+        ORDER BY id LIMIT :batch_size
+    )
+    UPDATE {PARENT_TABLE} h
+    SET search_vector = {PARENT_TABLE}_search_doc(h.question, h.answer)
+    FROM batch b WHERE h.id = b.id
+    RETURNING h.id
+"""
+
+def _html_escape(expr: str) -> str:
+    """
+    Escape HTML trong SQL trước khi ts_headline chèn <mark>: câu trả lời là output của LLM (có thể chứa
+    văn bản nguồn) -> client render highlight bằng innerHTML không bị stored XSS.
+    Thực thể (&lt; ...) không được đánh chỉ mục nên không ảnh hưởng việc tô sáng từ khóa.
+    """
+    for char, entity in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"), ("''", "&#39;")):
+        expr = f"replace({expr}, '{char}', '{entity}')"
+    return expr
+
+
+# Xếp hạng trên toàn bộ kết quả khớp, chỉ tô sáng (ts_headline - tốn CPU) cho N dòng đứng đầu
+SEARCH_SQL_TEMPLATE = f"""
+    WITH q AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}', :q) AS query),
+    ranked AS (
+        SELECT h.id, h.session_id, h.question, h.answer, h.created_at,
+               ts_rank_cd(h.search_vector, q.query) AS rank
+        FROM {PARENT_TABLE} h, q
+        WHERE h.user_id = :user_id
+          AND h.search_vector @@ q.query{{time_filter}}
+        ORDER BY rank DESC, h.created_at DESC
+        LIMIT :limit
+    )
+    SELECT r.id, r.session_id, r.created_at, r.rank,
+           ts_headline('{SEARCH_CONFIG}', {_html_escape("r.question")}, q.query, :headline_opts) AS question_highlight,
+           ts_headline('{SEARCH_CONFIG}', {_html_escape("r.answer")}, q.query, :headline_opts) AS answer_highlight
+    FROM ranked r, q
+    ORDER BY r.rank DESC, r.created_at DESC
+"""
+
+
+def build_search_sql(since: bool, until: bool) -> str:
+    """Chỉ thêm điều kiện thời gian được truyền vào -> generic plan vẫn loại được partition (không bind datetime.min/max)"""
+    time_filter = ""
+    if since:
+        time_filter += "\n          AND h.created_at >= :since"
+    if until:
+        time_filter += "\n          AND h.created_at < :until"
+    return SEARCH_SQL_TEMPLATE.format(time_filter=time_filter)
+
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=10, MaxFragments=2, FragmentDelimiter= … "
@@ -1,9 +1,360 @@
-from sqlalchemy import create_engine, text as sql_text, inspect
-from sqlalchemy.schema import CreateColumn
+import asyncio
+import json
+import re
+from datetime import datetime
+from sqlalchemy import MetaData, create_engine, text as sql_text, inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+from app.core.config import settings
+from app.db.fulltext import (
+    BACKFILL_SQL, CONFIG_SQL, DOCUMENT_FUNCTION_SQL, EXTENSIONS_SQL, TRIGGER_FUNCTION_SQL, TRIGGER_SQL
+)
+from app.db.partitions import (
+    LIST_PARTITIONS_SQL, PARENT_TABLE, RELKIND_SQL, create_default_partition_sql,
+    create_partition_sql, missing_partitions, month_floor
+)
 from sqlalchemy.ext.compiler import compiles
 from app.db.schemas import metadata  # Đảm bảo đúng tên file schema của bạn
 
-async def run_db_migrations(engine, force_reset: bool = False, log_func=None):
+# Chỉ quản lý các index do code khai báo (tiền tố ix_), không đụng tới index của PK/UNIQUE
+MANAGED_INDEX_PREFIX = "ix_"
+
+
+def _invalid_indexes(engine) -> set:
+    """Index bị INVALID (CREATE INDEX CONCURRENTLY thất bại giữa chừng) -> cần build lại"""
+    with engine.connect() as conn:
+        rows = conn.execute(sql_text("""
+            SELECT c.relname FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE NOT i.indisvalid AND n.nspname = current_schema()
+        """)).fetchall()
+    return {row[0] for row in rows}
+
+
+def diff_indexes(engine) -> dict:
+    """
+    So sánh index khai báo trong schemas.py với index thực tế trong DB.
+    Trả về {missing, mismatched, extra}: mỗi phần tử là {table, name, columns}.
+    Bảng chưa tồn tại được bỏ qua (create_all sẽ tạo kèm index).
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    invalid = _invalid_indexes(engine)
+    drift = {"missing": [], "mismatched": [], "extra": []}
+
+    for table_name, table_obj in metadata.tables.items():
+        if table_name not in existing_tables:
+            continue
+        db_indexes = {ix["name"]: ix for ix in inspector.get_indexes(table_name)}
+        declared = {ix.name: ix for ix in table_obj.indexes}
+
+        for name, ix in declared.items():
+            columns = [col.name for col in ix.columns]
+            item = {"table": table_name, "name": name, "columns": columns}
+            current = db_indexes.get(name)
+            if current is None:
+                drift["missing"].append(item)
+            elif (name in invalid
+                  or list(current["column_names"]) != columns
+                  or bool(current["unique"]) != bool(ix.unique)):
+                drift["mismatched"].append(item)
+
+        for name, current in db_indexes.items():
+            if (name not in declared and name.startswith(MANAGED_INDEX_PREFIX)
+                    and not current.get("duplicates_constraint")):
+                drift["extra"].append({"table": table_name, "name": name, "columns": list(current["column_names"])})
+
+    return drift
+
+
+def _create_index_sql(index, dialect, concurrently: bool) -> str:
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+    if concurrently:
+        ddl = re.sub(r"^CREATE (UNIQUE )?INDEX", lambda m: f"{m.group(0)} CONCURRENTLY", ddl)
+    return ddl
+
+
+async def reconcile_indexes(engine, concurrently: bool = True, log_func=None) -> dict:
+    """
+    Tạo index còn thiếu, build lại index sai cấu trúc / INVALID. Index thừa chỉ báo cáo, không xóa.
+    concurrently=True: dùng CREATE/DROP INDEX CONCURRENTLY để không khóa ghi trên DB đang chạy
+    (bắt buộc chạy ngoài transaction -> AUTOCOMMIT).
+    """
+    async def log(msg):
+        if log_func: await log_func(msg)
+
+    drift = diff_indexes(engine)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Bảng đã phân vùng không hỗ trợ CONCURRENTLY -> build thường (index được tạo trên từng partition)
+        partitioned = {row[0] for row in conn.execute(sql_text("SELECT relname FROM pg_class WHERE relkind = 'p'"))}
+
+        def use_concurrently(table_name: str) -> bool:
+            return concurrently and table_name not in partitioned
+
+        for item in drift["mismatched"]:
+            await log(f"   ♻️ Rebuilding index: {item['table']}.{item['name']}")
+            keyword = "CONCURRENTLY " if use_concurrently(item["table"]) else ""
+            try:
+                conn.execute(sql_text(f'DROP INDEX {keyword}IF EXISTS "{item["name"]}"'))
+            except Exception as e:
+                await log(f"      ❌ Failed to drop index '{item['name']}': {e}")
+
+        for item in drift["missing"] + drift["mismatched"]:
+            index = next(ix for ix in metadata.tables[item["table"]].indexes if ix.name == item["name"])
+            await log(f"   ➕ Creating index: {item['name']} ON {item['table']}({', '.join(item['columns'])})")
+            try:
+                conn.execute(sql_text(_create_index_sql(index, engine.dialect, use_concurrently(item["table"]))))
+                await log(f"      ✅ Index '{item['name']}' ready.")
+            except Exception as e:
+                await log(f"      ❌ Failed to create index '{item['name']}': {e}")
+
+    for item in drift["extra"]:
+        await log(f"   ⚠️ Extra index not declared in code: {item['table']}.{item['name']} (kept)")
+
+    return drift
+
+
+def history_partition_status(engine) -> dict:
+    """Trạng thái phân vùng chat_history (dùng cho db-status)"""
+    with engine.connect() as conn:
+        relkind = conn.execute(sql_text(RELKIND_SQL)).scalar()
+        partitions = [dict(row) for row in conn.execute(sql_text(LIST_PARTITIONS_SQL)).mappings()] if relkind == "p" else []
+    return {"partitioned": relkind == "p", "exists": relkind is not None, "partitions": partitions}
+
+
+def _ensure_partitions(conn, first_month):
+    """Tạo partition default + các tháng từ first_month tới (hiện tại + HISTORY_PARTITIONS_AHEAD)"""
+    existing = [row.name for row in conn.execute(sql_text(LIST_PARTITIONS_SQL))]
+    conn.execute(sql_text(create_default_partition_sql()))
+    created = missing_partitions(existing, first_month, settings.HISTORY_PARTITIONS_AHEAD)
+    for month in created:
+        for stmt in create_partition_sql(month):
+            conn.execute(sql_text(stmt))
+    return created
+
+
+async def sync_history_partitions(engine, convert_legacy: bool = False, log_func=None):
+    """
+    - Bảng đã phân vùng: đảm bảo đủ partition cho các tháng sắp tới.
+    - Bảng cũ (chưa phân vùng): chỉ chuyển đổi khi convert_legacy=True (chép theo lô, chỉ khóa ghi lúc tráo bảng).
+    """
+    async def log(msg):
+        if log_func: await log_func(msg)
+
+    with engine.connect() as conn:
+        relkind = conn.execute(sql_text(RELKIND_SQL)).scalar()
+
+    if relkind == "r":
+        if not convert_legacy:
+            await log("   ⚠️ chat_history chưa được phân vùng (bật 'partition_history' để chuyển đổi).")
+            return
+        await _convert_legacy_history(engine, log)
+        return
+    if relkind != "p":
+        return
+
+    with engine.begin() as conn:
+        created = _ensure_partitions(conn, month_floor(datetime.now()))
+    for month in created:
+        await log(f"   ➕ Created partition for {month:%Y-%m}")
+
+
+LEGACY_COPY_BATCH_SIZE = 20000  # Số id mỗi lô khi chép bảng cũ sang bảng phân vùng
+
+
+async def _convert_legacy_history(engine, log, batch_size: int = LEGACY_COPY_BATCH_SIZE):
+    """
+    Chuyển bảng cũ sang bảng phân vùng, không khóa chat_history suốt thời gian chép:
+    1. Dựng bảng tạm {PARENT_TABLE}_new (partition + index tên tạm) - app vẫn đọc/ghi bảng cũ.
+    2. Chép theo dải id, mỗi lô 1 transaction ngắn.
+    3. Transaction cuối (ngắn): chặn ghi bảng cũ, chép nốt dòng mới, xóa bảng cũ, đổi tên bảng tạm/khóa/sequence/index.
+    UPDATE/DELETE lên dòng đã chép trong lúc chạy bước 2 không được mang sang -> chạy lúc ít tải.
+    """
+    table = metadata.tables[PARENT_TABLE]
+    shadow_name = f"{PARENT_TABLE}_new"
+    shadow_metadata = MetaData()
+    for other in metadata.sorted_tables:
+        if other.name != PARENT_TABLE:
+            other.to_metadata(shadow_metadata)  # Khóa ngoại của bảng tạm cần thấy users / chat_sessions
+    shadow = table.to_metadata(shadow_metadata, name=shadow_name)
+    index_names = {}  # tên tạm -> tên thật (tên index là duy nhất trong schema, bảng cũ đang giữ tên thật)
+    for index in shadow.indexes:
+        index_names[f"{index.name}_new"] = index.name
+        index.name = f"{index.name}_new"
+
+    columns = ", ".join(col.name for col in table.columns)
+    select_cols = ", ".join("COALESCE(created_at, now())" if col.name == "created_at" else col.name for col in table.columns)
+    copy_sql = f"INSERT INTO {shadow_name} ({columns}) SELECT {select_cols} FROM {PARENT_TABLE} WHERE id > :lower"
+
+    def build_shadow():
+        with engine.begin() as conn:
+            conn.execute(sql_text(f"DROP TABLE IF EXISTS {shadow_name}"))  # Lần chuyển đổi trước dừng giữa chừng
+            first, max_id = conn.execute(sql_text(f"SELECT min(created_at), max(id) FROM {PARENT_TABLE}")).one()
+            conn.execute(CreateTable(shadow))
+            for index in shadow.indexes:
+                conn.execute(CreateIndex(index))
+            conn.execute(sql_text(create_default_partition_sql(shadow_name)))
+            months = missing_partitions([], month_floor(first or datetime.now()), settings.HISTORY_PARTITIONS_AHEAD)
+            for month in months:
+                for stmt in create_partition_sql(month, shadow_name):
+                    conn.execute(sql_text(stmt))
+        return max_id or 0, len(months)
+
+    def copy_batch(lower: int, upper: int) -> int:
+        with engine.begin() as conn:
+            return conn.execute(sql_text(f"{copy_sql} AND id <= :upper"), {"lower": lower, "upper": upper}).rowcount
+
+    def swap(lower: int) -> int:
+        with engine.begin() as conn:
+            # Chặn ghi (vẫn cho đọc) -> dòng mới phát sinh sau lô cuối không bị bỏ sót
+            conn.execute(sql_text(f"LOCK TABLE {PARENT_TABLE} IN EXCLUSIVE MODE"))
+            # Lô cuối chép lại 1 đoạn trước max_id: transaction lấy id sớm nhưng commit muộn
+            moved = conn.execute(sql_text(f"{copy_sql} ON CONFLICT DO NOTHING"), {"lower": lower}).rowcount
+            legacy_seq = conn.execute(sql_text(f"SELECT pg_get_serial_sequence('{PARENT_TABLE}', 'id')")).scalar()
+            seq = conn.execute(sql_text(f"SELECT pg_get_serial_sequence('{shadow_name}', 'id')")).scalar()
+            pkey = conn.execute(sql_text(
+                f"SELECT conname FROM pg_constraint WHERE conrelid = '{shadow_name}'::regclass AND contype = 'p'"
+            )).scalar()
+
+            conn.execute(sql_text(f"DROP TABLE {PARENT_TABLE}"))
+            if legacy_seq:
+                conn.execute(sql_text(f"DROP SEQUENCE IF EXISTS {legacy_seq}"))
+            conn.execute(sql_text(f"ALTER TABLE {shadow_name} RENAME TO {PARENT_TABLE}"))
+            if pkey:
+                conn.execute(sql_text(f'ALTER TABLE {PARENT_TABLE} RENAME CONSTRAINT "{pkey}" TO "{PARENT_TABLE}_pkey"'))
+            if seq:
+                conn.execute(sql_text(f"ALTER SEQUENCE {seq} RENAME TO {PARENT_TABLE}_id_seq"))
+            for temp_name, name in index_names.items():
+                conn.execute(sql_text(f'ALTER INDEX "{temp_name}" RENAME TO "{name}"'))
+            conn.execute(sql_text(
+                f"SELECT setval(pg_get_serial_sequence('{PARENT_TABLE}', 'id'), COALESCE((SELECT max(id) FROM {PARENT_TABLE}), 0) + 1, false)"
+            ))
+        return moved
+
+    await log(f"   🔀 Converting {PARENT_TABLE} to monthly partitions...")
+    max_id, months = await asyncio.to_thread(build_shadow)
+    lower, moved = 0, 0
+    while lower < max_id:
+        upper = lower + batch_size
+        moved += await asyncio.to_thread(copy_batch, lower, upper)
+        lower = upper
+        await log(f"   📦 Copied {moved} rows (id <= {min(upper, max_id)} / {max_id})...")
+    moved += await asyncio.to_thread(swap, max(0, max_id - batch_size))
+    await log(f"   ✅ Moved {moved} rows into {months} monthly partitions.")
+
+
+async def ensure_search_extensions(engine, log_func=None):
+    """unaccent + btree_gin (extension 'trusted' từ PG13, không cần superuser)"""
+    async def log(msg):
+        if log_func: await log_func(msg)
+
+    for stmt in EXTENSIONS_SQL:
+        try:
+            with engine.begin() as conn:
+                conn.execute(sql_text(stmt))
+        except Exception as e:
+            await log(f"   ❌ {stmt} failed: {e}")
+
+
+async def sync_history_search(engine, log_func=None, batch_size: int = 5000) -> int:
+    """Cấu hình vn_unaccent + trigger cập nhật search_vector + tính lại cho dữ liệu cũ (theo lô)"""
+    async def log(msg):
+        if log_func: await log_func(msg)
+
+    try:
+        with engine.begin() as conn:
+            for stmt in [CONFIG_SQL, DOCUMENT_FUNCTION_SQL, TRIGGER_FUNCTION_SQL, *TRIGGER_SQL]:
+                conn.execute(sql_text(stmt))
+    except Exception as e:
+        await log(f"   ❌ Full-text search setup failed: {e}")
+        return 0
+
+    last_id, indexed = 0, 0
+    while True:
+        with engine.begin() as conn:
+            ids = [row.id for row in conn.execute(sql_text(BACKFILL_SQL), {"last_id": last_id, "batch_size": batch_size})]
+        if not ids:
+            break
+        last_id, indexed = max(ids), indexed + len(ids)
+        await log(f"   🔎 Indexed {indexed} messages for search...")
+    return indexed
+
+
+# Bản ghi cũ: sources là mảng chuỗi nguyên văn ("[\"...") -> đổi sang [{id, score, hash}] + bảng documents.
+# Mảng chỉ gồm nhãn (["Cache Hit"], ["Agent V3 (LangGraph)"]) giữ nguyên - bên đọc coi đó là nhãn, không phải nguồn
+DEDUPE_SOURCES_SQL = f"""
+    WITH batch AS (
+        SELECT id, sources::jsonb AS src FROM {PARENT_TABLE}
+        WHERE id > :last_id AND sources LIKE '["%'
+          AND NOT (sources::jsonb <@ CAST(:labels AS jsonb))
+        ORDER BY id LIMIT :batch_size
+    ), elems AS (
+        SELECT b.id, e.ord, e.val, encode(sha256(convert_to(e.val, 'UTF8')), 'hex') AS hash
+        FROM batch b, jsonb_array_elements_text(b.src) WITH ORDINALITY AS e(val, ord)
+    ), docs AS (
+        INSERT INTO documents (hash, content)
+        SELECT DISTINCT ON (hash) hash, val FROM elems
+        ON CONFLICT (hash) DO NOTHING
+    )
+    UPDATE {PARENT_TABLE} h
+    SET sources = COALESCE((
+        SELECT jsonb_agg(jsonb_build_object('id', NULL::text, 'score', NULL::float, 'hash', e.hash) ORDER BY e.ord)
+        FROM elems e WHERE e.id = h.id
+    ), '[]'::jsonb)::text
+    FROM batch b WHERE h.id = b.id
+    RETURNING h.id
+"""
+
+
+DEDUPE_SOURCES_MIGRATION = "dedupe_history_sources_v1"
+
+
+def _data_migration_applied(engine, name: str) -> bool:
+    with engine.connect() as conn:
+        return conn.execute(sql_text("SELECT 1 FROM data_migrations WHERE name = :name"), {"name": name}).first() is not None
+
+
+def _mark_data_migration(engine, name: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(sql_text("INSERT INTO data_migrations (name) VALUES (:name) ON CONFLICT (name) DO NOTHING"), {"name": name})
+
+
+async def dedupe_history_sources(engine, log_func=None, batch_size: int = 5000) -> int:
+    """
+    Chuyển nguồn tham khảo dạng nguyên văn sang tham chiếu, từng lô theo id (mỗi lô 1 transaction).
+    Data migration 1 lần (ghi vào data_migrations): code hiện tại chỉ ghi tham chiếu hoặc nhãn,
+    không cần quét lại toàn bảng mỗi lần khởi động. Engine sync -> chạy ở thread, không chặn event loop.
+    """
+    from app.services.source_refs import SOURCE_LABELS
+
+    async def log(msg):
+        if log_func: await log_func(msg)
+
+    if await asyncio.to_thread(_data_migration_applied, engine, DEDUPE_SOURCES_MIGRATION):
+        return 0
+
+    labels = json.dumps(list(SOURCE_LABELS), ensure_ascii=False)
+
+    def convert_batch(last_id: int) -> list:
+        with engine.begin() as conn:
+            params = {"last_id": last_id, "batch_size": batch_size, "labels": labels}
+            return [row.id for row in conn.execute(sql_text(DEDUPE_SOURCES_SQL), params)]
+
+    last_id, converted = 0, 0
+    while True:
+        ids = await asyncio.to_thread(convert_batch, last_id)
+        if not ids:
+            break
+        last_id, converted = max(ids), converted + len(ids)
+        await log(f"   ♻️ Converted sources of {converted} messages...")
+    await asyncio.to_thread(_mark_data_migration, engine, DEDUPE_SOURCES_MIGRATION)
+    if converted:
+        await log(f"   ✅ {converted} messages now reference the documents table.")
+    return converted
+
+
+async def run_db_migrations(engine, force_reset: bool = False, log_func=None, concurrent_indexes: bool = True, partition_history: bool = False):
     """
     Hệ thống Migration thông minh: Tự động đồng bộ cấu trúc Python -> Database.
     """
@@ -20,6 +371,7 @@ async def run_db_migrations(engine, force_reset: bool = False, log_func=None):
 
     # 2. Tạo các bảng chưa tồn tại (Cơ bản)
     await log("🔍 Checking tables...")
+    await ensure_search_extensions(engine, log_func) # Index GIN của chat_history cần btree_gin
     metadata.create_all(engine)
     
     # 3. [NÂNG CẤP] AUTO-MIGRATE: Tự động phát hiện và thêm cột thiếu
@@ -58,4 +410,20 @@ async def run_db_migrations(engine, force_reset: bool = False, log_func=None):
                         except Exception as e:
                             await log(f"      ❌ Failed to add column '{column.name}': {e}")
 
+    # 4. [MỚI] Phân vùng chat_history theo tháng
+    await log("🗓️ Syncing chat_history partitions...")
+    await sync_history_partitions(engine, partition_history, log_func)
+
+    # 5. [MỚI] Full-text search (cấu hình tiếng Việt không dấu + trigger)
+    await log("🔎 Syncing chat_history full-text search...")
+    await sync_history_search(engine, log_func)
+
+    # 6. [MỚI] Nguồn tham khảo: văn bản nguyên văn -> tham chiếu bảng documents
+    await log("🧾 Deduplicating chat_history sources...")
+    await dedupe_history_sources(engine, log_func)
+
+    # 7. [MỚI] Đồng bộ Index (bảng mới đã có index từ create_all, ở đây xử lý bảng cũ)
+    await log("🗂️ Reconciling indexes...")
+    await reconcile_indexes(engine, concurrent_indexes, log_func)
+
     await log("🎉 Database synchronization complete.")
\ No newline at end of file
@@ -0,0 +1,93 @@
+# app/db/partitions.py
+"""
+Phân vùng (Partition) bảng chat_history theo tháng: chat_history_pYYYYMM + chat_history_default.
+Các hàm ở đây chỉ sinh câu lệnh SQL / tính toán tháng, dùng chung cho:
+- migrations.py (engine sync, lúc Setup / Migrate)
+- services/history_archiver.py (engine async, job định kỳ)
+"""
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+PARENT_TABLE = "chat_history"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+PARTITION_RE = re.compile(rf"^{PARENT_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+# relkind: 'p' = bảng đã phân vùng, 'r' = bảng thường (bản cũ chưa phân vùng)
+RELKIND_SQL = f"SELECT relkind FROM pg_class WHERE oid = to_regclass('{PARENT_TABLE}')"
+
+LIST_PARTITIONS_SQL = f"""
+    SELECT c.relname AS name, c.reltuples::bigint AS estimated_rows,
+           pg_total_relation_size(c.oid) AS total_bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass('{PARENT_TABLE}')
+    ORDER BY c.relname
+"""
+
+
+def month_floor(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + (month.month - 1) + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def months_between(start: date, end: date) -> List[date]:
+    """Các tháng từ start tới end (tính cả 2 đầu)"""
+    months, current = [], month_floor(start)
+    while current <= end:
+        months.append(current)
+        current = add_months(current, 1)
+    return months
+
+
+def create_partition_sql(month: date, parent: str = PARENT_TABLE) -> List[str]:
+    """
+    Tạo partition của 1 tháng. Không dùng thẳng PARTITION OF vì nếu partition default đang chứa dòng
+    thuộc tháng đó Postgres sẽ báo lỗi -> tạo bảng rời, chuyển dòng từ default sang rồi ATTACH.
+    parent: bảng cha (khác PARENT_TABLE khi đang dựng bảng tạm lúc chuyển đổi bảng cũ).
+    """
+    name = partition_name(month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    return [
+        f"CREATE TABLE IF NOT EXISTS {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+        f"""WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= '{lower}' AND created_at < '{upper}' RETURNING *
+            ) INSERT INTO {name} SELECT * FROM moved""",
+        f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')",
+    ]
+
+
+def create_default_partition_sql(parent: str = PARENT_TABLE) -> str:
+    return f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {parent} DEFAULT"
+
+
+def missing_partitions(existing_names: List[str], first_month: date, months_ahead: int, today: Optional[datetime] = None) -> List[date]:
+    """Các tháng từ first_month tới (tháng hiện tại + months_ahead) chưa có partition"""
+    last_month = add_months(month_floor(today or datetime.now()), months_ahead)
+    existing = {partition_month(name) for name in existing_names}
+    return [m for m in months_between(first_month, last_month) if m not in existing]
+
+
+def expired_partitions(existing_names: List[str], retention_months: int, today: Optional[datetime] = None) -> List[str]:
+    """Partition có toàn bộ dữ liệu cũ hơn cửa sổ lưu giữ (retention_months <= 0: giữ vĩnh viễn)"""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_floor(today or datetime.now()), -retention_months)
+    return sorted(
+        name for name in existing_names
+        if partition_month(name) is not None and add_months(partition_month(name), 1) <= cutoff
+    )
@@ -1,4 +1,5 @@
-from sqlalchemy import Boolean, ForeignKey, MetaData, Table, Column, Integer, String, Text, DateTime, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy import Boolean, ForeignKey, Index, MetaData, Table, Column, Integer, String, Text, DateTime, func
 
 # Metadata dùng chung cho toàn bộ hệ thống
 metadata = MetaData()
@@ -12,26 +13,57 @@ users = Table('users', metadata,
     Column('role', String(20), default='user'),
     Column('is_active', Boolean, default=True), # Dùng Boolean chuẩn của SQLAlchemy
     Column('refresh_token', String(500), nullable=True),
-    Column('created_at', DateTime, server_default=func.now())
+    Column('created_at', DateTime, server_default=func.now()),
+    # [MỚI] Phân trang Admin: ORDER BY created_at DESC, id DESC
+    Index('ix_users_created_id', 'created_at', 'id'),
+    # [MỚI] Lọc theo tiền tố (LIKE 'abc%') - text_pattern_ops để dùng Index với mọi collation
+    Index('ix_users_username_prefix', 'username', postgresql_ops={'username': 'text_pattern_ops'}),
+    Index('ix_users_email_prefix', 'email', postgresql_ops={'email': 'text_pattern_ops'})
 )
 chat_sessions = Table('chat_sessions', metadata,
     Column('id', String(36), primary_key=True), # UUID string
     Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
     Column('title', String(255)), # Tiêu đề cuộc trò chuyện (VD: "Tư vấn tăng cân")
     Column('created_at', DateTime, server_default=func.now()),
-    Column('updated_at', DateTime, server_default=func.now(), onupdate=func.now()) # Để sort session mới nhất lên đầu
+    Column('updated_at', DateTime, server_default=func.now(), onupdate=func.now()), # Để sort session mới nhất lên đầu
+    # [MỚI] Index cho Sidebar: WHERE user_id = ? ORDER BY updated_at DESC, id DESC (keyset)
+    Index('ix_chat_sessions_user_updated', 'user_id', 'updated_at', 'id')
 )
 # 2. Bảng Chat History (Đã bổ sung mối quan hệ)
+# [MỚI] Phân vùng theo tháng (RANGE created_at): partition được tạo/lưu trữ bởi app/db/partitions.py
+# -> Khóa chính phải chứa cột phân vùng: (id, created_at)
 chat_history = Table('chat_history', metadata,
-    Column('id', Integer, primary_key=True),
+    Column('id', Integer, primary_key=True, autoincrement=True),
     Column('user_id', Integer, ForeignKey('users.id'), nullable=False), # Link với User
     Column('session_id', String(36), ForeignKey('chat_sessions.id'), nullable=False), # Link với Chat Session
     Column('question', Text, nullable=False),
     Column('answer', Text, nullable=False),
-    Column('sources', Text, nullable=True), # [MỚI] Lưu JSON nguồn tham khảo
+    Column('sources', Text, nullable=True), # [NÂNG CẤP] JSON tham chiếu nguồn [{id, score, hash}] -> bảng documents
+    Column('created_at', DateTime, primary_key=True, server_default=func.now()),
+    Column('search_vector', TSVECTOR, nullable=True), # [MỚI] Full-text search, do trigger tính (app/db/fulltext.py)
+    # [MỚI] Chi tiết hội thoại + N lượt gần nhất: WHERE session_id = ? ORDER BY created_at
+    Index('ix_chat_history_session_created', 'session_id', 'created_at'),
+    # [MỚI] Lịch sử phân trang theo user: WHERE user_id = ? ORDER BY created_at DESC, id DESC (keyset)
+    Index('ix_chat_history_user_created', 'user_id', 'created_at', 'id'),
+    # [MỚI] Tìm kiếm lịch sử: WHERE user_id = ? AND search_vector @@ query (GIN + btree_gin)
+    Index('ix_chat_history_user_search', 'user_id', 'search_vector', postgresql_using='gin'),
+    postgresql_partition_by='RANGE (created_at)'
+)
+
+# [MỚI] Nội dung nguồn tham khảo, đánh địa chỉ theo nội dung (sha256)
+# -> cùng 1 đoạn văn bản món ăn chỉ lưu 1 lần dù được trích dẫn hàng triệu lần
+documents = Table('documents', metadata,
+    Column('hash', String(64), primary_key=True),
+    Column('content', Text, nullable=False),
     Column('created_at', DateTime, server_default=func.now())
 )
 
+# [MỚI] Data migration chạy 1 lần (chuyển đổi dữ liệu): tên + thời điểm đã chạy xong
+data_migrations = Table('data_migrations', metadata,
+    Column('name', String(100), primary_key=True),
+    Column('applied_at', DateTime, server_default=func.now())
+)
+
 # 3. Bảng System Settings
 system_settings = Table('system_settings', metadata,
     Column('key', String(50), primary_key=True),
@@ -1,5 +1,6 @@
+from app.core.startup_profiler import startup_profiler  # [MỚI] Import đầu tiên: mốc bắt đầu đo khởi động
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,6 +14,14 @@ from app.api.v3 import chat_v3
 from app.core.config import settings
 # from app.api.v1 import chat
 from app.api.v2 import chat_v2, admin, history, system, setup, users, auth
+from app.core.events import event_bus
+from app.core.health_monitor import health_monitor
+from app.core.metrics import render_latest
+from app.core.warmup import readiness
+from app.db.engine_registry import engine_registry
+from app.services.deletion_jobs import deletion_jobs
+from app.services.history_archiver import history_archiver
+from app.services.history_writer import history_writer
 
 # --- LOGGING ---
 logging.basicConfig(
@@ -27,8 +36,26 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     logger.info("🚀 System starting up...")
     log_task = asyncio.create_task(system.watch_log_file())
+    with startup_profiler.step("history_writer"):
+        await history_writer.start() # [MỚI] Pipeline ghi lịch sử theo lô
+    with startup_profiler.step("event_bus"):
+        await event_bus.start() # [MỚI] Pub/Sub giữa các worker (xóa cache RAM đồng loạt)
+    with startup_profiler.step("history_archiver"):
+        await history_archiver.start() # [MỚI] Job định kỳ: partition tháng tới + lưu trữ dữ liệu cũ
+    with startup_profiler.step("deletion_jobs"):
+        await deletion_jobs.start() # [MỚI] Nhận lại các job xóa dữ liệu bị bỏ dở
+    startup_profiler.mark_ready()
+    await readiness.start() # [MỚI] Warm-up nền (model, pool DB/Redis, collection Qdrant) -> /readyz
+    await health_monitor.start() # [MỚI] Probe nền Postgres/Redis/Qdrant/Embedding/LLM -> /system/health
     yield
     logger.info("🛑 System shutting down...")
+    await readiness.stop() # /readyz trả 503 ngay -> LB ngừng route request mới
+    await health_monitor.stop()
+    await deletion_jobs.stop()
+    await history_archiver.stop()
+    await event_bus.stop()
+    await history_writer.stop() # Flush nốt lịch sử còn trong hàng đợi
+    engine_registry.dispose_all() # Đóng pool của Setup Wizard / Migration
     log_task.cancel()
 
 app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
@@ -37,7 +64,7 @@ app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 # 🔥 UNIFIED EXCEPTION HANDLER (QUẢN LÝ LỖI TẬP TRUNG)
 # =================================================================
 
-def create_error_response(status_code: int, message: str, detail: str = None):
+def create_error_response(status_code: int, message: str, detail: str = None, headers: dict = None):
     return JSONResponse(
         status_code=status_code,
         content={
@@ -46,12 +73,14 @@ def create_error_response(status_code: int, message: str, detail: str = None):
             "message": message,
             "detail": detail
         },
+        headers=headers,
     )
 
 # 1. Bắt lỗi HTTP do bạn tự raise (HTTPException)
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
-    return create_error_response(exc.status_code, exc.detail)
+    # Giữ lại headers (VD: Retry-After của 429, WWW-Authenticate của 401)
+    return create_error_response(exc.status_code, exc.detail, headers=getattr(exc, "headers", None))
 
 # 2. Bắt lỗi Validate dữ liệu (Pydantic - 422)
 @app.exception_handler(RequestValidationError)
@@ -98,4 +127,22 @@ app.include_router(history.router, prefix="/api/v2/history", tags=["User History
 app.include_router(chat_v3.router, prefix="/api/v3", tags=["Chat V3 (LangGraph Agent)"]) # [MỚI]
 @app.get("/")
 def root():
-    return {"message": "API is running!"}
\ No newline at end of file
+    return {"message": "API is running!"}
+
+# [MỚI] Probe cho Load Balancer / Kubernetes
+@app.get("/livez", tags=["Probes"])
+async def livez():
+    """Liveness: process còn sống, không phụ thuộc DB/Redis/Qdrant"""
+    return {"status": "alive"}
+
+@app.get("/readyz", tags=["Probes"])
+async def readyz():
+    """Readiness: 503 cho tới khi warm-up các thành phần bắt buộc xong"""
+    report = readiness.report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+# [MỚI] Prometheus scrape endpoint (latency từng chặng chat, node/tool V3, cache, token LLM, DB/Redis/Qdrant)
+@app.get("/metrics", tags=["Probes"], include_in_schema=False)
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
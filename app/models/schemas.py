@@ -101,6 +101,12 @@ class UserResponse(BaseModel):
     role: str
     is_active: bool
 
+class UserPage(BaseModel):
+    """Một trang danh sách người dùng (phân trang theo cursor)"""
+    items: List[UserResponse]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
 class UserUpdate(BaseModel):
     """Schema dùng cho /users/{id} để cập nhật thông tin"""
     full_name: Optional[str] = None
@@ -134,7 +140,7 @@ class ChatHistoryItem(BaseModel):
     id: int
     question: str
     answer: str
-    sources: Optional[str] = None # JSON string
+    sources: Optional[str] = None # JSON tham chiếu [{id, score, hash}] (chi tiết session mới giải ra nội dung)
     created_at: datetime
     user_id: int
     session_id: str
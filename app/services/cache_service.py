@@ -1,15 +1,14 @@
 import os
 import uuid
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
+from contextlib import contextmanager
+from app.core.clients import qdrant_slot
+from app.core.metrics import CACHE_ERROR, CACHE_HIT, CACHE_MISS, observe_dependency
 from datetime import datetime
 
 class SemanticCacheService:
     def __init__(self):
-        self.host = os.getenv("QDRANT_HOST", "localhost")
-        self.port = int(os.getenv("QDRANT_PORT", 6333))
-        # Kết nối client
-        self.client = QdrantClient(host=self.host, port=self.port)
+        # [NÂNG CẤP] Client Qdrant dùng chung (Hot Reload), xem `_lease()`
+        self._generation = 0
         
         self.collection_name = "gym_chat_cache"
         self.threshold = 0.95 
@@ -17,30 +16,42 @@ class SemanticCacheService:
         # Biến cờ để đánh dấu trạng thái khởi tạo
         self._is_initialized = False
 
+    @contextmanager
+    def _lease(self):
+        # Mượn client qua lease -> đổi host lúc đang chạy thì client cũ chỉ bị đóng sau khi lời gọi này xong
+        with qdrant_slot.lease() as client:
+            # Qdrant vừa được đổi sang host khác -> kiểm tra/tạo lại collection trên host mới
+            if qdrant_slot.generation != self._generation:
+                self._generation = qdrant_slot.generation
+                self._is_initialized = False
+            yield client
+
     def _ensure_collection(self):
         """
         Cơ chế Lazy Loading: Chỉ tạo collection khi thực sự cần dùng.
         """
         if self._is_initialized:
             return
+        from qdrant_client.http import models  # Import khi cần (SDK nặng, không cần lúc khởi động)
 
         try:
-            # Kiểm tra collection
-            collections = self.client.get_collections().collections
-            exists = any(c.name == self.collection_name for c in collections)
+            with self._lease() as client:
+                # Kiểm tra collection
+                collections = client.get_collections().collections
+                exists = any(c.name == self.collection_name for c in collections)
 
-            if not exists:
-                print(f"📦 [Cache] Đang tạo bộ nhớ đệm mới: {self.collection_name}")
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=models.VectorParams(
-                        size=1024,  # Đảm bảo khớp với model embedding (BGE-M3 = 1024)
-                        distance=models.Distance.COSINE
+                if not exists:
+                    print(f"📦 [Cache] Đang tạo bộ nhớ đệm mới: {self.collection_name}")
+                    client.create_collection(
+                        collection_name=self.collection_name,
+                        vectors_config=models.VectorParams(
+                            size=1024,  # Đảm bảo khớp với model embedding (BGE-M3 = 1024)
+                            distance=models.Distance.COSINE
+                        )
                     )
-                )
-                print(f"✅ [Cache] Đã tạo collection '{self.collection_name}' thành công.")
-            
-            self._is_initialized = True
+                    print(f"✅ [Cache] Đã tạo collection '{self.collection_name}' thành công.")
+
+                self._is_initialized = True
             
         except Exception as e:
             print(f"⚠️ [Cache Init Warning] Không thể kết nối Qdrant: {e}")
@@ -52,26 +63,31 @@ class SemanticCacheService:
         self._ensure_collection()
         
         if not self._is_initialized:
+            CACHE_ERROR.inc()
             return None
 
         try:
             # [CHUẨN MỚI] Sử dụng query_points với tham số 'query'
-            search_result = self.client.query_points(
-                collection_name=self.collection_name,
-                query=vector_query, # Sửa từ query_vector -> query
-                limit=1,
-                score_threshold=self.threshold 
-            )
+            with self._lease() as client, observe_dependency("qdrant", "cache_query"):
+                search_result = client.query_points(
+                    collection_name=self.collection_name,
+                    query=vector_query, # Sửa từ query_vector -> query
+                    limit=1,
+                    score_threshold=self.threshold 
+                )
             
             # Kiểm tra kết quả trong danh sách points
             if search_result.points:
                 hit = search_result.points[0]
+                CACHE_HIT.inc()
                 print(f"🔥 [CACHE HIT] Tìm thấy câu trả lời cũ (Score: {hit.score:.4f})")
                 return hit.payload['answer']
             
+            CACHE_MISS.inc()
             print("❄️ [CACHE MISS] Không tìm thấy trong cache.")
             return None
         except Exception as e:
+            CACHE_ERROR.inc()
             print(f"⚠️ [Cache Read Error] {e}")
             return None
 
@@ -92,22 +108,25 @@ class SemanticCacheService:
             return
         # -------------------------------------------
 
+        from qdrant_client.http import models
+
         try:
             point_id = str(uuid.uuid4())
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=[
-                    models.PointStruct(
-                        id=point_id,
-                        vector=vector_query,
-                        payload={
-                            "question": question,
-                            "answer": answer,
-                            "created_at": datetime.now().isoformat()
-                        }
-                    )
-                ]
-            )
+            with self._lease() as client, observe_dependency("qdrant", "cache_upsert"):
+                client.upsert(
+                    collection_name=self.collection_name,
+                    points=[
+                        models.PointStruct(
+                            id=point_id,
+                            vector=vector_query,
+                            payload={
+                                "question": question,
+                                "answer": answer,
+                                "created_at": datetime.now().isoformat()
+                            }
+                        )
+                    ]
+                )
             print(f"💾 [CACHE SAVED] Đã lưu cache: '{question}'")
         except Exception as e:
             print(f"⚠️ [Cache Write Error] {e}")
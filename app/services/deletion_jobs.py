@@ -0,0 +1,190 @@
+import asyncio
+import time
+import uuid
+from typing import Optional
+
+import redis.asyncio as redis
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app.api.deps import SessionLocal
+from app.core.config import settings
+from app.core.redis import redis_pool
+from app.services.recent_turns_cache import recent_turns_cache
+
+# Mỗi lô 1 transaction ngắn: chọn N dòng theo index (user_id, ...) rồi xóa đúng các dòng đó
+DELETE_MESSAGES_SQL = text("""
+    DELETE FROM chat_history WHERE (id, created_at) IN (
+        SELECT id, created_at FROM chat_history WHERE user_id = :user_id LIMIT :batch_size
+    )
+""")
+# Chỉ xóa session đã hết tin nhắn (tin nhắn mới chen vào giữa chừng -> lượt sau xử lý)
+DELETE_SESSIONS_SQL = text("""
+    DELETE FROM chat_sessions WHERE id IN (
+        SELECT s.id FROM chat_sessions s
+        WHERE s.user_id = :user_id
+          AND NOT EXISTS (SELECT 1 FROM chat_history h WHERE h.session_id = s.id)
+        LIMIT :batch_size
+    )
+""")
+COUNT_REMAINING_SQL = text("""
+    SELECT (SELECT count(*) FROM chat_history WHERE user_id = :user_id)
+         + (SELECT count(*) FROM chat_sessions WHERE user_id = :user_id)
+""")
+DELETE_USER_SQL = text("DELETE FROM users WHERE id = :user_id AND is_active = false")
+
+
+class DeletionJobs:
+    """
+    Xóa dữ liệu lớn chạy nền (thay cho 1 câu DELETE khổng lồ trong request HTTP):
+    - kind="history": xóa toàn bộ tin nhắn + session của user.
+    - kind="user": như trên rồi xóa luôn user (endpoint đã khóa tài khoản trước đó).
+    Xóa từng lô DELETION_BATCH_SIZE dòng, mỗi lô 1 transaction ngắn, nghỉ DELETION_BATCH_PAUSE giây giữa các lô
+    (không giữ khóa lâu, WAL tăng đều, autovacuum theo kịp).
+    Tiến độ lưu trong Redis hash deljob:{job_id} -> worker nào cũng trả lời được GET trạng thái.
+    Job dở dang (worker chết) được worker khác nhận lại lúc khởi động (xóa lại từ đầu là an toàn).
+    Job "user" bị lỗi vẫn nằm trong hàng đợi để được chạy lại (tài khoản đã khóa không được kẹt ở trạng thái chưa xóa).
+    """
+    QUEUE_KEY = "deljob:queue"
+
+    def __init__(self):
+        self.client = redis.Redis(connection_pool=redis_pool)
+        self.batch_size = settings.DELETION_BATCH_SIZE
+        self.pause = settings.DELETION_BATCH_PAUSE
+        self.ttl = settings.DELETION_JOB_TTL
+        self._tasks: set = set()
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"deljob:{job_id}"
+
+    @staticmethod
+    def _active_key(user_id: int, kind: str) -> str:
+        # Theo cả kind: job "history" đang chạy không được "nuốt" yêu cầu xóa user (job đó không xóa user)
+        return f"deljob:active:{user_id}:{kind}"
+
+    # ==========================================
+    # API CHO ENDPOINT
+    # ==========================================
+    async def submit(self, user_id: int, kind: str = "history") -> str:
+        """Tạo job (mỗi user + kind chỉ 1 job đang chạy - gọi lại trả về job cũ, job lỗi thì được chạy lại)"""
+        active_key = self._active_key(user_id, kind)
+        job_id = uuid.uuid4().hex
+        if not await self.client.set(active_key, job_id, nx=True, ex=self.ttl):
+            existing = await self.client.get(active_key)
+            if existing and await self.client.exists(self._key(existing)):
+                if await self.client.hget(self._key(existing), "status") == "failed":
+                    await self._update(existing, status="queued", error="")
+                    self._spawn(existing)
+                return existing
+            await self.client.set(active_key, job_id, ex=self.ttl)
+
+        now = time.time()
+        await self.client.hset(self._key(job_id), mapping={
+            "job_id": job_id, "kind": kind, "user_id": user_id, "status": "queued",
+            "deleted_messages": 0, "deleted_sessions": 0, "error": "",
+            "created_at": now, "updated_at": now,
+        })
+        await self.client.expire(self._key(job_id), self.ttl)
+        await self.client.sadd(self.QUEUE_KEY, job_id)
+        self._spawn(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = await self.client.hgetall(self._key(job_id))
+        if not job:
+            return None
+        for field in ("user_id", "deleted_messages", "deleted_sessions"):
+            job[field] = int(job[field])
+        for field in ("created_at", "updated_at", "finished_at"):
+            if field in job:
+                job[field] = float(job[field])
+        return job
+
+    # ==========================================
+    # VÒNG ĐỜI (GỌI TỪ LIFESPAN)
+    # ==========================================
+    async def start(self):
+        """Nhận lại job bị bỏ dở (không cập nhật tiến độ quá DELETION_JOB_STALE giây)"""
+        try:
+            for job_id in await self.client.smembers(self.QUEUE_KEY):
+                job = await self.get(job_id)
+                if job is None:
+                    await self.client.srem(self.QUEUE_KEY, job_id)
+                elif time.time() - job["updated_at"] > settings.DELETION_JOB_STALE:
+                    await self._update(job_id, status="queued")
+                    self._spawn(job_id)
+        except Exception as e:
+            print(f"⚠️ [Deletion Jobs] Không khôi phục được job: {e}")
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    # ==========================================
+    # THỰC THI
+    # ==========================================
+    def _spawn(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _update(self, job_id: str, **fields):
+        await self.client.hset(self._key(job_id), mapping={**fields, "updated_at": time.time()})
+
+    async def _delete_batch(self, sql, user_id: int) -> int:
+        async with SessionLocal() as db:
+            result = await db.execute(sql, {"user_id": user_id, "batch_size": self.batch_size})
+            await db.commit()
+            return result.rowcount
+
+    async def _run(self, job_id: str):
+        job = await self.get(job_id)
+        if job is None:
+            return
+        user_id = job["user_id"]
+        messages, sessions = job["deleted_messages"], job["deleted_sessions"]
+        await self._update(job_id, status="running")
+        try:
+            while True:
+                # 1. Tin nhắn trước (FK chat_history -> chat_sessions)
+                while count := await self._delete_batch(DELETE_MESSAGES_SQL, user_id):
+                    messages += count
+                    await self._update(job_id, deleted_messages=messages)
+                    await asyncio.sleep(self.pause)
+                # 2. Session đã trống
+                try:
+                    while count := await self._delete_batch(DELETE_SESSIONS_SQL, user_id):
+                        sessions += count
+                        await self._update(job_id, deleted_sessions=sessions)
+                        await asyncio.sleep(self.pause)
+                except IntegrityError:
+                    continue # Tin nhắn mới vừa được ghi vào session đang xóa -> quét lại
+                # 3. Còn sót (tin nhắn tới sau khi quét) -> lặp lại
+                async with SessionLocal() as db:
+                    remaining = (await db.execute(COUNT_REMAINING_SQL, {"user_id": user_id})).scalar()
+                if not remaining:
+                    break
+
+            if job["kind"] == "user":
+                async with SessionLocal() as db:
+                    await db.execute(DELETE_USER_SQL, {"user_id": user_id})
+                    await db.commit()
+
+            await recent_turns_cache.invalidate_user(user_id)
+            await self._update(job_id, status="done", finished_at=time.time())
+            print(f"🧹 [Deletion Jobs] {job['kind']} user={user_id}: {messages} messages, {sessions} sessions.")
+        except asyncio.CancelledError:
+            # Shutdown: giữ trong hàng đợi để worker khởi động sau làm tiếp
+            raise
+        except Exception as e:
+            print(f"❌ [Deletion Jobs] Job {job_id} failed: {e}")
+            await self._update(job_id, status="failed", error=str(e)[:500])
+            if job["kind"] == "user":
+                return  # Giữ trong hàng đợi + active key: start() / submit() lần sau chạy lại
+        await self.client.srem(self.QUEUE_KEY, job_id)
+        await self.client.delete(self._active_key(user_id, job["kind"]))
+
+
+deletion_jobs = DeletionJobs()
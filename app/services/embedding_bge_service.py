@@ -1,15 +1,20 @@
 import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-import torch
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-# Thêm import này
-from fastembed import SparseTextEmbedding
+# [NÂNG CẤP] torch / sentence_transformers / fastembed import trong __init__ (mất vài giây)
+# -> import module này không còn kéo theo các thư viện nặng, chỉ lần dùng đầu tiên mới load
 
 load_dotenv()
 
 class BGEEmbeddingService:
     def __init__(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        from fastembed import SparseTextEmbedding
+
         # 1. Load Model Dense (Như cũ)
         self.model_name = os.getenv("V2_EMBEDDING_MODEL", "BAAI/bge-m3")
         print(f"🚀 [Dense] Loading BGE-M3: {self.model_name}...")
@@ -22,6 +27,11 @@ class BGEEmbeddingService:
         self.sparse_model = SparseTextEmbedding(model_name="prithivida/Splade_PP_en_v1")
         print("✅ [Embedding] Hybrid Models Ready!")
 
+        # 3. [MỚI] Worker pool riêng cho việc encode (torch/onnx nhả GIL khi tính toán)
+        # Giúp các coroutine gọi embedding không chặn Event Loop
+        workers = int(os.getenv("EMBEDDING_WORKERS", 2))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bge-embed")
+
     def embed_dense(self, text: str) -> List[float]:
         """Tạo Dense Vector (Ngữ nghĩa)"""
         embeddings = self.model.encode([text], convert_to_numpy=True, normalize_embeddings=True)
@@ -32,6 +42,35 @@ class BGEEmbeddingService:
         # fastembed trả về generator, ta lấy phần tử đầu tiên
         return list(self.sparse_model.embed([text]))[0]
 
+    def embed_hybrid(self, text: str):
+        """Tạo cả Dense + Sparse trong 1 lần gọi (tiện cho việc chạy trong worker pool)"""
+        return self.embed_dense(text), self.embed_sparse(text)
+
+    def embed_hybrid_batch(self, texts: List[str]):
+        """Encode nhiều câu trong 1 lần (1 forward pass cho Dense, 1 lượt cho Sparse)"""
+        if not texts:
+            return [], []
+        dense = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        sparse = list(self.sparse_model.embed(texts))
+        return dense.tolist(), sparse
+
+    # --- [MỚI] ASYNC API: Đẩy việc encode sang worker pool ---
+    async def aembed_dense(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.embed_dense, text)
+
+    async def aembed_sparse(self, text: str):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.embed_sparse, text)
+
+    async def aembed_hybrid(self, text: str):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.embed_hybrid, text)
+
+    async def aembed_hybrid_batch(self, texts: List[str]):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.embed_hybrid_batch, texts)
+
     # Giữ lại hàm cũ để tránh lỗi code cũ, trỏ về embed_dense
     def embed_query(self, text: str) -> List[float]:
         return self.embed_dense(text)
@@ -39,10 +78,13 @@ class BGEEmbeddingService:
     def embed_document(self, text: str) -> List[float]:
         return self.embed_dense(text)
 
-# Singleton
+# Singleton (Lazy: tạo ở lần gọi đầu tiên, lock để 2 request đồng thời không load model 2 lần)
 _service_instance = None
+_service_lock = threading.Lock()
 def get_bge_service():
     global _service_instance
     if _service_instance is None:
-        _service_instance = BGEEmbeddingService()
-    return _service_instance
\ No newline at end of file
+        with _service_lock:
+            if _service_instance is None:
+                _service_instance = BGEEmbeddingService()
+    return _service_instance
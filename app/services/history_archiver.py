@@ -0,0 +1,163 @@
+import asyncio
+import gzip
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.api.deps import engine
+from app.core.config import settings
+from app.db.partitions import (
+    DEFAULT_PARTITION, LIST_PARTITIONS_SQL, PARENT_TABLE, RELKIND_SQL, create_partition_sql,
+    expired_partitions, missing_partitions, month_floor, partition_name
+)
+
+
+class HistoryArchiver:
+    """
+    Job bảo trì chat_history (đã phân vùng theo tháng), chạy định kỳ trong lifespan:
+    1. Tạo trước partition cho HISTORY_PARTITIONS_AHEAD tháng tới (insert không rơi vào partition default).
+       Dòng đã lỡ rơi vào partition default (job ngừng chạy quá lâu...) được chuyển sang partition tháng
+       của chúng -> bước 2 lưu trữ theo đúng HISTORY_RETENTION_MONTHS, không nằm mãi trong default.
+    2. Partition cũ hơn HISTORY_RETENTION_MONTHS: COPY ra file .csv.gz trong HISTORY_ARCHIVE_DIR,
+       rồi DETACH khỏi bảng cha (query lịch sử gần đây không phải quét dữ liệu cũ nữa).
+       HISTORY_ARCHIVE_DROP=True -> DROP luôn bảng đã tách, ngược lại đổi tên thành *_archived.
+    Nhiều worker: dùng pg_try_advisory_lock để chỉ 1 worker chạy tại 1 thời điểm.
+    """
+    LOCK_ID = 804_001  # Khóa advisory riêng cho job này
+
+    def __init__(self):
+        self.interval = settings.HISTORY_MAINTENANCE_INTERVAL
+        self.archive_dir = settings.HISTORY_ARCHIVE_DIR
+        self._task: Optional[asyncio.Task] = None
+        self.last_report: Optional[dict] = None
+
+    async def start(self):
+        if self._task is None and engine is not None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"❌ [History Archiver] {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, dry_run: bool = False) -> dict:
+        report = {"started_at": datetime.now().isoformat(), "partitioned": False,
+                  "created": [], "moved_from_default": [], "archived": [], "skipped": None}
+        async with engine.connect() as conn:
+            if (await conn.execute(text(RELKIND_SQL))).scalar() != "p":
+                report["skipped"] = "chat_history chưa được phân vùng (chạy db-migrate với partition_history=true)."
+                self.last_report = report
+                return report
+            report["partitioned"] = True
+
+            # Khóa advisory cấp session: giữ qua các lần commit bên dưới
+            locked = (await conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": self.LOCK_ID})).scalar()
+            await conn.commit()
+            if not locked:
+                report["skipped"] = "Worker khác đang chạy bảo trì."
+                self.last_report = report
+                return report
+            try:
+                names = [row.name for row in await conn.execute(text(LIST_PARTITIONS_SQL))]
+
+                # 1. Partition cho các tháng sắp tới (mỗi tháng 1 transaction)
+                for month in missing_partitions(names, month_floor(datetime.now()), settings.HISTORY_PARTITIONS_AHEAD):
+                    report["created"].append(f"{month:%Y-%m}")
+                    if not dry_run:
+                        for stmt in create_partition_sql(month):
+                            await conn.execute(text(stmt))
+                        await conn.commit()
+
+                # 1b. Tháng còn dòng nằm trong partition default -> tạo partition tháng đó (chuyển dòng ra khỏi default)
+                for month in await self._default_months(conn, names):
+                    if partition_name(month) in names:
+                        continue
+                    report["moved_from_default"].append(f"{month:%Y-%m}")
+                    if not dry_run:
+                        for stmt in create_partition_sql(month):
+                            await conn.execute(text(stmt))
+                        await conn.commit()
+                if not dry_run and (report["created"] or report["moved_from_default"]):
+                    names = [row.name for row in await conn.execute(text(LIST_PARTITIONS_SQL))]
+
+                # 2. Lưu trữ partition hết hạn (export + detach trong cùng 1 transaction)
+                for name in expired_partitions(names, settings.HISTORY_RETENTION_MONTHS):
+                    if dry_run:
+                        report["archived"].append({"partition": name})
+                        continue
+                    report["archived"].append(await self._archive_partition(conn, name))
+                    await conn.commit()
+            finally:
+                await conn.rollback()
+                await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": self.LOCK_ID})
+                await conn.commit()
+
+        self.last_report = report
+        if report["created"] or report["moved_from_default"] or report["archived"]:
+            print(f"🗄️ [History Archiver] created={report['created']} moved_from_default={report['moved_from_default']} "
+                  f"archived={[a['partition'] for a in report['archived']]}")
+        return report
+
+    @staticmethod
+    async def _default_months(conn, names: list) -> list:
+        """Các tháng có dòng trong partition default (bình thường rỗng -> EXISTS dừng ngay, không quét)"""
+        if DEFAULT_PARTITION not in names:
+            return []
+        if not (await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION})"))).scalar():
+            return []
+        rows = await conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', created_at) AS month FROM {DEFAULT_PARTITION} ORDER BY month"
+        ))
+        return [month_floor(row.month) for row in rows]
+
+    async def _archive_partition(self, conn, name: str) -> dict:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.csv.gz")
+        tmp_path = f"{path}.part"
+        t0 = time.perf_counter()
+
+        # COPY TO STDOUT qua psycopg (stream từng chunk, không load cả partition vào RAM)
+        raw = await conn.get_raw_connection()
+        loop = asyncio.get_running_loop()
+        size = 0
+        with gzip.open(tmp_path, "wb") as f:
+            async with raw.driver_connection.cursor() as cur:
+                async with cur.copy(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)") as copy:
+                    async for chunk in copy:
+                        size += len(chunk)
+                        await loop.run_in_executor(None, f.write, chunk)
+        os.replace(tmp_path, path)  # File chỉ xuất hiện khi export xong trọn vẹn
+
+        await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        if settings.HISTORY_ARCHIVE_DROP:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        else:
+            # Đổi tên để job tạo partition không gắn nhầm lại bảng đã lưu trữ
+            await conn.execute(text(f"ALTER TABLE {name} RENAME TO {name}_archived"))
+
+        return {
+            "partition": name,
+            "file": path,
+            "raw_bytes": size,
+            "compressed_bytes": os.path.getsize(path),
+            "dropped": settings.HISTORY_ARCHIVE_DROP,
+            "seconds": round(time.perf_counter() - t0, 2),
+        }
+
+
+history_archiver = HistoryArchiver()
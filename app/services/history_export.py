@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import weakref
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import literal, select, tuple_
+
+from app.api.deps import engine
+from app.core.config import settings
+from app.core.pagination import decode_cursor, encode_cursor
+from app.db.schemas import chat_history
+
+EXPORT_COLUMNS = ["id", "session_id", "created_at", "question", "answer", "sources"]
+
+
+class HistoryExporter:
+    """
+    Xuất toàn bộ lịch sử chat của 1 user (NDJSON / CSV) với bộ nhớ cố định:
+    - Kết nối riêng (không dùng session của Depends - session đó đã đóng trước khi body được stream).
+    - Server-side cursor (conn.stream + yield_per): Postgres trả từng lô HISTORY_EXPORT_FETCH_SIZE dòng,
+      mỗi lô được ghi ra client rồi mới lấy lô tiếp theo.
+    - Mỗi dòng mang 'cursor' -> tải bị đứt thì gọi lại với ?cursor=<cursor của dòng cuối đã nhận>.
+    Thứ tự: mới nhất -> cũ nhất (giống phân trang), tin nhắn mới phát sinh trong lúc tải không làm lệch cursor.
+    """
+
+    def __init__(self):
+        self.fetch_size = settings.HISTORY_EXPORT_FETCH_SIZE
+        self.max_concurrent = settings.HISTORY_EXPORT_MAX_CONCURRENT
+        self.active = 0  # Mỗi export giữ 1 kết nối DB suốt thời gian tải
+
+    @property
+    def busy(self) -> bool:
+        return self.active >= self.max_concurrent
+
+    def _query(self, user_id: int, cursor: Optional[str]):
+        cols = chat_history.c
+        query = select(*[cols[name] for name in EXPORT_COLUMNS]).where(cols.user_id == user_id)
+        if cursor:
+            ts, row_id = decode_cursor(cursor)["key"]
+            bound = tuple_(literal(ts, cols.created_at.type), literal(row_id, cols.id.type))
+            query = query.where(tuple_(cols.created_at, cols.id) < bound)
+        return query.order_by(cols.created_at.desc(), cols.id.desc())
+
+    @staticmethod
+    def _record(row) -> dict:
+        record = dict(row)
+        record["created_at"] = row["created_at"].isoformat()
+        record["cursor"] = encode_cursor("next", [row["created_at"], row["id"]])
+        return record
+
+    def stream(self, user_id: int, fmt: str = "ndjson", cursor: Optional[str] = None) -> AsyncIterator[bytes]:
+        query = self._query(user_id, cursor)  # Cursor sai -> HTTPException trước khi trả header
+        # Kiểm tra + giữ chỗ liền nhau (không có await ở giữa) -> N request đồng thời không cùng lọt qua giới hạn
+        if self.busy:
+            raise HTTPException(429, "Hệ thống đang xuất dữ liệu cho nhiều người, vui lòng thử lại sau.",
+                                headers={"Retry-After": "10"})
+        self.active += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.active -= 1
+
+        stream = self._stream(query, fmt, cursor is None, release)
+        # Generator chưa từng được lặp (client ngắt trước khi body bắt đầu) không chạy finally -> trả chỗ khi bị thu hồi
+        weakref.finalize(stream, release)
+        return stream
+
+    async def _stream(self, query, fmt: str, first_part: bool, release) -> AsyncIterator[bytes]:
+        try:
+            async with engine.connect() as conn:
+                result = await conn.stream(query.execution_options(yield_per=self.fetch_size))
+                if fmt == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS + ["cursor"])
+                    if first_part:
+                        buffer.write("\ufeff")  # BOM để Excel đọc đúng tiếng Việt
+                        writer.writeheader()
+                    async for rows in result.mappings().partitions():
+                        writer.writerows(self._record(row) for row in rows)
+                        yield buffer.getvalue().encode("utf-8")
+                        buffer.seek(0)
+                        buffer.truncate()
+                    if buffer.tell():
+                        yield buffer.getvalue().encode("utf-8")
+                else:
+                    async for rows in result.mappings().partitions():
+                        yield "".join(
+                            json.dumps(self._record(row), ensure_ascii=False) + "\n" for row in rows
+                        ).encode("utf-8")
+        finally:
+            release()
+
+
+history_exporter = HistoryExporter()
@@ -1,15 +1,24 @@
-import json
 import uuid
-from sqlalchemy.orm import Session  # Import thêm Session để type hint
-from sqlalchemy import func, insert, select, desc, delete, update
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession  # [NÂNG CẤP] Async Session để type hint
+from sqlalchemy import func, insert, select, desc, text, update, true
+from app.core.config import settings
+from app.core.pagination import keyset_paginate
+from app.db.fulltext import HEADLINE_OPTIONS, build_search_sql
 from app.db.schemas import chat_history,chat_sessions
+from app.services.recent_turns_cache import recent_turns_cache
+from app.services.source_refs import resolve_sources
+
+# Cột trả về cho client (bỏ search_vector - chỉ dùng nội bộ cho tìm kiếm)
+HISTORY_COLUMNS = [col for col in chat_history.c if col.name != "search_vector"]
 
 class HistoryService:
-    def __init__(self, db_session: Session): 
+    def __init__(self, db_session: AsyncSession): 
         self.db_session = db_session  # Lưu vào biến self.db_session
 
     # --- QUẢN LÝ SESSION ---
-    def create_session(self, user_id: int, first_question: str):
+    async def create_session(self, user_id: int, first_question: str):
         """Tạo cuộc hội thoại mới"""
         session_id = str(uuid.uuid4())
         # Lấy 50 ký tự đầu của câu hỏi làm tiêu đề
@@ -20,107 +29,108 @@ class HistoryService:
             user_id=user_id,
             title=title
         )
-        self.db_session.execute(stmt)
-        self.db_session.commit()
+        await self.db_session.execute(stmt)
+        await self.db_session.commit()
         return session_id
-    def get_user_sessions(self, user_id: int, limit: int = 20, offset: int = 0):
-        """Lấy danh sách các cuộc hội thoại (cho Sidebar)"""
-        query = (
-            select(chat_sessions)
-            .where(chat_sessions.c.user_id == user_id)
-            .order_by(desc(chat_sessions.c.updated_at)) # Mới nhất lên đầu
-            .limit(limit)
-            .offset(offset)
+    async def get_user_sessions(self, user_id: int, limit: int = 20, cursor: Optional[str] = None):
+        """Lấy danh sách các cuộc hội thoại (cho Sidebar) - phân trang keyset (updated_at, id)"""
+        query = select(chat_sessions).where(chat_sessions.c.user_id == user_id)
+        # Mới nhất lên đầu
+        return await keyset_paginate(
+            self.db_session, query, chat_sessions.c.updated_at, chat_sessions.c.id, limit, cursor
         )
-        return self.db_session.execute(query).mappings().all()
     
-    def get_session_messages(self, session_id: str, user_id: int):
+    async def get_session_messages(self, session_id: str, user_id: int):
         """Lấy chi tiết tin nhắn trong 1 hội thoại"""
         # Cần verify user_id để không xem trộm chat người khác
         # 1. Verify session owner
-        check = self.db_session.execute(
+        check = (await self.db_session.execute(
             select(chat_sessions).where(chat_sessions.c.id == session_id, chat_sessions.c.user_id == user_id)
-        ).fetchone()
+        )).fetchone()
         if not check:
             return None
 
         # 2. Get messages
         query = (
-            select(chat_history)
+            select(*HISTORY_COLUMNS)
             .where(chat_history.c.session_id == session_id)
             .order_by(chat_history.c.created_at.asc()) # Cũ trước, mới sau (để render từ trên xuống)
         )
-        rows = self.db_session.execute(query).mappings().all()
+        rows = (await self.db_session.execute(query)).mappings().all()
         
+        # [MỚI] Giải tham chiếu nguồn của cả hội thoại bằng 1 query vào bảng documents
+        sources = await resolve_sources(self.db_session, [row.sources for row in rows])
+
         # Convert sang format User/Assistant để frontend dễ render
         messages = []
-        for row in rows:
+        for row, row_sources in zip(rows, sources):
             messages.append({"role": "user", "content": row.question, "created_at": row.created_at})
-            messages.append({"role": "assistant", "content": row.answer, "created_at": row.created_at})
+            messages.append({"role": "assistant", "content": row.answer, "sources": row_sources, "created_at": row.created_at})
             
         return messages
 
-    def update_session_time(self, session_id: str):
-        """Cập nhật thời gian updated_at để session này nhảy lên đầu list"""
-        stmt = update(chat_sessions).where(chat_sessions.c.id == session_id).values(updated_at=func.now())
-        self.db_session.execute(stmt)
-        self.db_session.commit()
-        
-    async def save_interaction(self, user_id: int, session_id: str, question: str, answer: str, sources: list):
-        try:
-            sources_json = json.dumps(sources, ensure_ascii=False)
-            stmt = insert(chat_history).values(
-                user_id=user_id,
-                session_id=session_id, # [MỚI]
-                question=question,
-                answer=answer,
-                sources=sources_json
-            )
-            self.db_session.execute(stmt)
-            
-            # Update thời gian session
-            self.update_session_time(session_id)
-            
-            self.db_session.commit()
-        except Exception as e:
-            self.db_session.rollback()
-            print(f"❌ Save History Error: {e}")
-        finally:
-            self.db_session.close()
+    async def get_recent_turns(self, session_id: str, user_id: int, limit: int = None):
+        """
+        [MỚI] Lấy N cặp hỏi đáp gần nhất làm ngữ cảnh (cũ trước, mới sau).
+        Đọc ring buffer Redis trước, miss thì query DB rồi nạp lại buffer.
+        Trả về None nếu session không tồn tại hoặc không thuộc về user.
+        """
+        limit = limit or settings.CHAT_CONTEXT_TURNS
+        cached = await recent_turns_cache.get(user_id, session_id)
+        if cached is not None:
+            return cached[-limit:]
 
-    def get_user_history(self, user_id: int, limit: int = 20, offset: int = 0):
-        """Lấy lịch sử chat"""
-        query = (
-            select(chat_history)
-            .where(chat_history.c.user_id == user_id)
+        turns = await self._fetch_recent_turns(session_id, user_id, limit)
+        if turns:
+            await recent_turns_cache.populate(user_id, session_id, turns)
+        return turns
+
+    async def _fetch_recent_turns(self, session_id: str, user_id: int, limit: int):
+        """Verify owner + lấy đuôi hội thoại trong 1 round trip (LEFT JOIN LATERAL ... LIMIT n)"""
+        recent = (
+            select(chat_history.c.question, chat_history.c.answer, chat_history.c.created_at)
+            .where(chat_history.c.session_id == chat_sessions.c.id)
             .order_by(desc(chat_history.c.created_at))
             .limit(limit)
-            .offset(offset)
+            .lateral("recent")
+        )
+        query = (
+            select(chat_sessions.c.id, recent.c.question, recent.c.answer)
+            .select_from(chat_sessions.outerjoin(recent, true()))
+            .where(chat_sessions.c.id == session_id, chat_sessions.c.user_id == user_id)
+            .order_by(recent.c.created_at.asc())
         )
-        # Dùng self.db_session
-        result = self.db_session.execute(query).mappings().all()
-        return result
+        rows = (await self.db_session.execute(query)).mappings().all()
+        if not rows:
+            return None
+        # Session chưa có tin nhắn -> LEFT JOIN trả về 1 dòng với question = NULL
+        return [{"question": row.question, "answer": row.answer} for row in rows if row.question is not None]
 
-    def clear_user_history(self, user_id: int):
-        """Xóa TOÀN BỘ lịch sử chat (Sessions + Messages)"""
-        try:
-            # 1. Xóa tất cả tin nhắn thuộc về user này
-            # (Dùng subquery để tìm tin nhắn của các session do user này tạo)
-            stmt_messages = delete(chat_history).where(
-                chat_history.c.session_id.in_(
-                    select(chat_sessions.c.id).where(chat_sessions.c.user_id == user_id)
-                )
-            )
-            self.db_session.execute(stmt_messages)
+    async def update_session_time(self, session_id: str):
+        """Cập nhật thời gian updated_at để session này nhảy lên đầu list"""
+        stmt = update(chat_sessions).where(chat_sessions.c.id == session_id).values(updated_at=func.now())
+        await self.db_session.execute(stmt)
+        await self.db_session.commit()
+        
+    async def get_user_history(self, user_id: int, limit: int = 20, cursor: Optional[str] = None):
+        """Lấy lịch sử chat - phân trang keyset (created_at, id)"""
+        query = select(*HISTORY_COLUMNS).where(chat_history.c.user_id == user_id)
+        return await keyset_paginate(
+            self.db_session, query, chat_history.c.created_at, chat_history.c.id, limit, cursor
+        )
 
-            # 2. Xóa tất cả sessions của user này
-            stmt_sessions = delete(chat_sessions).where(chat_sessions.c.user_id == user_id)
-            result = self.db_session.execute(stmt_sessions)
-            
-            self.db_session.commit()
-            return result.rowcount # Trả về số session đã xóa
-            
-        except Exception as e:
-            self.db_session.rollback()
-            print(f"❌ Clear History Error: {e}")
-            return 0
\ No newline at end of file
+    async def search_history(self, user_id: int, q: str, limit: int = 20,
+                             since: Optional[datetime] = None, until: Optional[datetime] = None):
+        """
+        [MỚI] Tìm kiếm toàn văn trong lịch sử của user (không phân biệt dấu).
+        Cú pháp kiểu Google: "whey protein" (cụm từ), whey -casein (loại trừ), whey or bcaa.
+        since/until giới hạn thời gian -> Postgres chỉ quét các partition tháng liên quan.
+        """
+        params = {"user_id": user_id, "q": q, "limit": limit, "headline_opts": HEADLINE_OPTIONS}
+        if since is not None:
+            params["since"] = since
+        if until is not None:
+            params["until"] = until
+        sql = build_search_sql(since=since is not None, until=until is not None)
+        rows = (await self.db_session.execute(text(sql), params)).mappings().all()
+        return [{**row, "rank": round(row["rank"], 4)} for row in rows]
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import redis.asyncio as redis
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.api.deps import SessionLocal
+from app.core.config import settings
+from app.core.redis import redis_pool
+from app.db.schemas import chat_history, chat_sessions, documents
+from app.services.recent_turns_cache import recent_turns_cache
+
+
+class HistoryWriter:
+    """
+    Pipeline ghi lịch sử chat (thay cho BackgroundTasks + 2 commit mỗi tin nhắn):
+    - enqueue(): request chỉ đẩy vào asyncio.Queue (+ ring buffer ngữ cảnh) rồi trả về ngay.
+    - 1 task nền gom lô (tối đa BATCH_SIZE dòng hoặc FLUSH_INTERVAL giây) -> 1 INSERT nhiều dòng,
+      1 UPDATE updated_at cho tất cả session trong lô, 1 COMMIT.
+    - Lô lỗi -> ghi lại từng dòng để 1 dòng hỏng (session đã bị xóa...) không kéo theo cả lô.
+    - HISTORY_WRITER_PERSIST: mỗi tin nhắn được lưu tạm trong Redis hash history:pending cho tới khi commit,
+      worker khởi động lại sẽ nhận các tin nhắn "mồ côi" (cũ hơn RECOVERY_AGE giây) để ghi tiếp.
+      Bảo đảm at-least-once: crash đúng giữa COMMIT và HDEL có thể ghi trùng 1 lô.
+    """
+    PENDING_KEY = "history:pending"
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.HISTORY_WRITER_QUEUE_MAXSIZE)
+        self.batch_size = settings.HISTORY_WRITER_BATCH_SIZE
+        self.flush_interval = settings.HISTORY_WRITER_FLUSH_INTERVAL
+        self.persist = settings.HISTORY_WRITER_PERSIST
+        self.recovery_age = settings.HISTORY_WRITER_RECOVERY_AGE
+        self.client = redis.Redis(connection_pool=redis_pool)
+        self._task: Optional[asyncio.Task] = None
+        self._recovered: List[dict] = []  # Tin nhắn nhận lúc start(), task ghi flush trước khi đọc hàng đợi
+        self.stats = {"enqueued": 0, "batches": 0, "rows_written": 0, "fallback_rows": 0, "dropped_rows": 0, "recovered": 0, "restarts": 0}
+
+    # ==========================================
+    # API CHO ENDPOINT
+    # ==========================================
+    async def enqueue(self, user_id: int, session_id: str, question: str, answer: str, sources: list, documents: Optional[dict] = None):
+        """sources: tham chiếu nguồn (xem source_refs.py), documents: {hash: content} ghi vào bảng documents"""
+        item = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "session_id": session_id,
+            "question": question,
+            "answer": answer,
+            "sources": json.dumps(sources, ensure_ascii=False, separators=(",", ":")),
+            "documents": documents or {},
+            # Gán thời gian lúc nhận, không dùng DEFAULT now() (cả lô sẽ trùng thời điểm transaction).
+            # Có múi giờ (UTC): Postgres quy đổi về TimeZone của session giống hệt cách nó lưu now()
+            # -> cùng 1 đồng hồ với các dòng dùng DEFAULT, không phụ thuộc múi giờ của máy chạy app
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self._enqueue_item(item)
+        self.stats["enqueued"] += 1
+        # Lượt mới có mặt trong ngữ cảnh ngay, không phải chờ flush
+        await recent_turns_cache.append(user_id, session_id, question, answer)
+
+    async def _enqueue_item(self, item: dict):
+        await self._persist(item)
+        await self.queue.put(item)
+
+    async def _persist(self, item: dict):
+        if self.persist:
+            try:
+                await self.client.hset(self.PENDING_KEY, item["id"], json.dumps({**item, "enqueued_at": time.time()}, ensure_ascii=False))
+            except Exception as e:
+                print(f"⚠️ [History Writer] Không lưu được hàng đợi vào Redis: {e}")
+
+    # ==========================================
+    # VÒNG ĐỜI (GỌI TỪ LIFESPAN)
+    # ==========================================
+    async def start(self):
+        if self._task is None:
+            self._recovered = await self.recover()
+            self._task = asyncio.create_task(self._supervise())
+            print("✅ [History Writer] Started.")
+
+    async def stop(self):
+        """Flush toàn bộ hàng đợi rồi dừng (gọi khi shutdown)"""
+        if self._task is None:
+            return
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+        print(f"🛑 [History Writer] Stopped. Stats: {self.stats}")
+
+    async def recover(self) -> List[dict]:
+        """
+        Nhận các tin nhắn chưa kịp ghi của worker đã chết (HDEL trả về 1 = worker này giành được).
+        Trả về danh sách để task ghi flush trực tiếp: KHÔNG đẩy vào self.queue - recover() chạy trong chính
+        task tiêu thụ hàng đợi, put() vào hàng đợi đầy sẽ chờ mãi (deadlock).
+        """
+        if not self.persist:
+            return []
+        try:
+            pending = await self.client.hgetall(self.PENDING_KEY)
+        except Exception as e:
+            print(f"⚠️ [History Writer] Không đọc được hàng đợi Redis: {e}")
+            return []
+
+        claimed = []
+
+        now = time.time()
+        for item_id, raw in pending.items():
+            try:
+                item = json.loads(raw)
+                if now - item.pop("enqueued_at", 0) < self.recovery_age:
+                    continue # Có thể đang nằm trong hàng đợi của 1 worker còn sống
+                if await self.client.hdel(self.PENDING_KEY, item_id):
+                    await self._persist(item)  # Giữ lại trong Redis tới khi ghi xong
+                    claimed.append(item)
+                    self.stats["recovered"] += 1
+            except Exception as e:
+                # Redis chập chờn / dữ liệu hỏng: bỏ qua, lần recover sau thử lại
+                print(f"⚠️ [History Writer] Recover {item_id!r} failed: {e}")
+        if claimed:
+            print(f"♻️ [History Writer] Recovered {len(claimed)} pending messages.")
+        return claimed
+
+    # ==========================================
+    # VÒNG LẶP GOM LÔ
+    # ==========================================
+    async def _supervise(self):
+        """
+        Chỉ có 1 task ghi: nếu nó chết, hàng đợi đầy và enqueue() chặn mọi request chat.
+        -> Lỗi bất ngờ thì khởi động lại vòng lặp (lô đang gom dở vẫn còn trong Redis, recover() sẽ ghi lại).
+        """
+        while True:
+            try:
+                await self._run()
+                return  # Dừng bình thường (stop())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["restarts"] += 1
+                print(f"❌ [History Writer] Loop crashed ({e}). Restarting in 1s...")
+                await asyncio.sleep(1)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_recover = loop.time()
+        stopping = False
+        recovered, self._recovered = self._recovered, []
+        await self._flush_all(recovered)
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+            if loop.time() - last_recover > self.recovery_age:
+                last_recover = loop.time()
+                try:
+                    await self._flush_all(await self.recover())
+                except Exception as e:
+                    print(f"⚠️ [History Writer] Periodic recover failed: {e}")
+
+        # Shutdown: ghi nốt phần còn lại trong hàng đợi
+        remaining = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        await self._flush_all(remaining)
+
+    async def _flush_all(self, items: List[dict]):
+        for i in range(0, len(items), self.batch_size):
+            await self._flush(items[i:i + self.batch_size])
+
+    @staticmethod
+    def _row(item: dict) -> dict:
+        return {
+            "user_id": item["user_id"],
+            "session_id": item["session_id"],
+            "question": item["question"],
+            "answer": item["answer"],
+            "sources": item["sources"],
+            "created_at": datetime.fromisoformat(item["created_at"]),
+        }
+
+    @staticmethod
+    async def _insert_documents(db, batch: List[dict]):
+        """Ghi văn bản nguồn chưa có (ON CONFLICT DO NOTHING), sắp theo hash để các worker không deadlock nhau"""
+        docs = {}
+        for item in batch:
+            docs.update(item.get("documents") or {})
+        if docs:
+            rows = [{"hash": h, "content": docs[h]} for h in sorted(docs)]
+            await db.execute(pg_insert(documents).values(rows).on_conflict_do_nothing(index_elements=["hash"]))
+
+    async def _flush(self, batch: List[dict]):
+        session_ids = {item["session_id"] for item in batch}
+        try:
+            async with SessionLocal() as db:
+                await self._insert_documents(db, batch)
+                await db.execute(insert(chat_history).values([self._row(item) for item in batch]))
+                # Gộp các lần bump updated_at: mỗi session 1 lần cho cả lô
+                await db.execute(
+                    update(chat_sessions).where(chat_sessions.c.id.in_(session_ids)).values(updated_at=func.now())
+                )
+                await db.commit()
+            self.stats["batches"] += 1
+            self.stats["rows_written"] += len(batch)
+            await self._ack(batch)
+        except Exception as e:
+            print(f"⚠️ [History Writer] Batch of {len(batch)} failed ({e}). Falling back to row-by-row.")
+            await self._flush_rows(batch)
+
+    async def _flush_rows(self, batch: List[dict]):
+        done = []
+        for item in batch:
+            try:
+                async with SessionLocal() as db:
+                    await self._insert_documents(db, [item])
+                    await db.execute(insert(chat_history).values(self._row(item)))
+                    await db.execute(
+                        update(chat_sessions).where(chat_sessions.c.id == item["session_id"]).values(updated_at=func.now())
+                    )
+                    await db.commit()
+                self.stats["fallback_rows"] += 1
+                done.append(item)
+            except (IntegrityError, DataError) as e:
+                # Dòng hỏng vĩnh viễn (VD: session đã bị xóa) -> bỏ qua, không thử lại
+                print(f"❌ [History Writer] Dropped message {item['id']}: {e}")
+                self.stats["dropped_rows"] += 1
+                done.append(item)
+            except Exception as e:
+                # Lỗi tạm thời (DB mất kết nối...) -> giữ trong Redis để recover() ghi lại sau
+                print(f"❌ Save History Error: {e}")
+        await self._ack(done)
+
+    async def _ack(self, items: List[dict]):
+        if not (self.persist and items):
+            return
+        try:
+            await self.client.hdel(self.PENDING_KEY, *[item["id"] for item in items])
+        except Exception as e:
+            print(f"⚠️ [History Writer] Không xóa được hàng đợi Redis: {e}")
+
+
+history_writer = HistoryWriter()
@@ -1,8 +1,9 @@
 import os
-from openai import OpenAI
 import requests
-import google.generativeai as genai
+# [NÂNG CẤP] openai / google.generativeai import khi dựng service (SDK nặng, không cần lúc khởi động)
+from app.core.clients import clients
 from app.core.config import settings
+from app.core.metrics import LLM_REQUEST_SECONDS, record_llm_usage
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,11 +19,12 @@ class LLMService:
         
         # 2. Cấu hình Gemini (Luôn load để dùng cho Embedding cũ hoặc backup)
         try:
+            import google.generativeai as genai
             # Dùng settings hoặc os.getenv đều được, ưu tiên os.getenv cho linh hoạt Docker
             api_key = os.getenv("GOOGLE_API_KEY") or settings.GOOGLE_API_KEY
             if api_key:
                 genai.configure(api_key=api_key)
-                self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+                self.gemini_model = genai.GenerativeModel(settings.GEMINI_MODEL)
                 self.embedding_model = 'models/text-embedding-004'
         except Exception as e:
             print(f"⚠️ [LLM Service] Cảnh báo cấu hình Gemini: {e}")
@@ -39,6 +41,7 @@ class LLMService:
         if self.backend == "openai":
             api_key = os.getenv("OPENAI_API_KEY") or settings.OPENAI_API_KEY
             if api_key:
+                from openai import OpenAI
                 self.openai_client = OpenAI(api_key=api_key)
                 self.openai_model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
                 print(f"🤖 [LLM Service] Backend: OPENAI ({self.openai_model})")
@@ -50,12 +53,13 @@ class LLMService:
         Hàm đơn giản nhận vào 1 prompt lớn (đã bao gồm context) và trả về text.
         Dùng cho API V2.
         """
-        if self.backend == "ollama":
-            return self._call_ollama(prompt)
-        elif self.backend == "openai":
-            return self._call_openai(prompt)
-        else:
-            return self._call_gemini(prompt)
+        with LLM_REQUEST_SECONDS.labels(backend=self.backend).time():
+            if self.backend == "ollama":
+                return self._call_ollama(prompt)
+            elif self.backend == "openai":
+                return self._call_openai(prompt)
+            else:
+                return self._call_gemini(prompt)
 
     # --- METHOD 2: DÀNH CHO API V1 (LEGACY) ---
     def generate_response(self, system_prompt: str, user_question: str, context: str) -> str:
@@ -78,6 +82,7 @@ class LLMService:
     # --- METHOD 3: EMBEDDING CŨ (LEGACY) ---
     def get_embedding(self, text: str) -> list:
         try:
+            import google.generativeai as genai
             clean_text = text.replace("\n", " ")
             result = genai.embed_content(
                 model=self.embedding_model,
@@ -97,6 +102,9 @@ class LLMService:
                 raise ValueError("Chưa cấu hình API Key cho Gemini.")
             
             response = self.gemini_model.generate_content(prompt)
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                record_llm_usage("gemini", usage.prompt_token_count, usage.candidates_token_count)
             
             # Kiểm tra nếu response bị chặn (safety filter)
             if not response.text:
@@ -122,6 +130,8 @@ class LLMService:
                 ],
                 temperature=0.5 # Giảm nhiệt độ xuống để AI bớt sáng tạo linh tinh
             )
+            if response.usage:
+                record_llm_usage("openai", response.usage.prompt_tokens, response.usage.completion_tokens)
             return response.choices[0].message.content
         except Exception as e:
             return f"Lỗi OpenAI API: {str(e)}"
@@ -139,21 +149,30 @@ class LLMService:
             response = requests.post(f"{self.ollama_url}/api/generate", json=payload, timeout=60)
             
             if response.status_code == 200:
-                return response.json().get("response", "")
+                data = response.json()
+                record_llm_usage("ollama", data.get("prompt_eval_count"), data.get("eval_count"))
+                return data.get("response", "")
             else:
                 raise Exception(f"Ollama Error ({response.status_code}): {response.text}")
         except Exception as e:
             print(f"❌ Ollama Error: {e}")
             raise e # Ném lỗi ra ngoài
 
+    # --- [MỚI] HEALTH PROBE: kiểm tra Backend còn phản hồi, không tốn token ---
+    def ping(self, timeout: float = 5.0) -> None:
+        if self.backend == "ollama":
+            response = requests.get(f"{self.ollama_url}/api/tags", timeout=timeout)
+            response.raise_for_status()
+        elif self.backend == "openai":
+            self.openai_client.with_options(timeout=timeout).models.retrieve(self.openai_model)
+        else:
+            import google.generativeai as genai
+            genai.get_model(f"models/{settings.GEMINI_MODEL}", request_options={"timeout": timeout})
+
 # --- SINGLETON ACCESSOR ---
-_llm_instance = None
+# [NÂNG CẤP] Nằm trong slot Hot Reload: đổi Backend / Model / API Key -> dựng LLMService mới, không restart
+LLM_KEYS = {"LLM_BACKEND", "GOOGLE_API_KEY", "GEMINI_MODEL", "OLLAMA_BASE_URL", "OLLAMA_MODEL", "OPENAI_API_KEY", "OPENAI_MODEL"}
+llm_slot = clients.register("llm", LLMService, LLM_KEYS)
 
 def get_llm_service():
-    global _llm_instance
-    if _llm_instance is None:
-        _llm_instance = LLMService()
-    return _llm_instance
-
-# Legacy instance export
-llm_service = get_llm_service()
\ No newline at end of file
+    return llm_slot.get()
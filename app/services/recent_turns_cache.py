@@ -0,0 +1,74 @@
+import json
+from typing import List, Optional
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.redis import redis_pool
+
+
+class RecentTurnsCache:
+    """
+    Ring buffer N lượt hỏi đáp gần nhất của mỗi hội thoại trong Redis (history:recent:{user_id}:{session_id}).
+    - Chỉ được nạp sau khi DB đã xác thực quyền sở hữu -> có key nghĩa là user sở hữu session.
+    - Khi lưu lượt mới: RPUSHX (chỉ ghi nếu buffer đã tồn tại) + LTRIM giữ N phần tử cuối.
+    Cache chỉ là lớp tăng tốc: lỗi Redis thì quay về đọc DB.
+    """
+    def __init__(self):
+        self.client = redis.Redis(connection_pool=redis_pool)
+        self.max_turns = settings.CHAT_CONTEXT_TURNS
+        self.ttl = settings.HISTORY_RECENT_TTL
+
+    @staticmethod
+    def _key(user_id: int, session_id: str) -> str:
+        return f"history:recent:{user_id}:{session_id}"
+
+    async def get(self, user_id: int, session_id: str) -> Optional[List[dict]]:
+        """Trả về danh sách lượt (cũ -> mới) hoặc None nếu chưa có trong cache"""
+        try:
+            items = await self.client.lrange(self._key(user_id, session_id), 0, -1)
+        except Exception as e:
+            print(f"⚠️ [Recent Turns Cache Read Error] {e}")
+            return None
+        if not items:
+            return None
+        return [json.loads(item) for item in items]
+
+    async def populate(self, user_id: int, session_id: str, turns: List[dict]) -> None:
+        """Nạp lại buffer từ kết quả DB (cache miss)"""
+        if not turns:
+            return
+        key = self._key(user_id, session_id)
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.rpush(key, *[json.dumps(t, ensure_ascii=False) for t in turns[-self.max_turns:]])
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [Recent Turns Cache Write Error] {e}")
+
+    async def append(self, user_id: int, session_id: str, question: str, answer: str) -> None:
+        """Đẩy lượt mới vào cuối buffer (bỏ qua nếu buffer chưa được nạp)"""
+        key = self._key(user_id, session_id)
+        data = json.dumps({"question": question, "answer": answer}, ensure_ascii=False)
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.rpushx(key, data)
+            pipe.ltrim(key, -self.max_turns, -1)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [Recent Turns Cache Write Error] {e}")
+
+    async def invalidate_user(self, user_id: int) -> None:
+        """Xóa toàn bộ buffer của 1 user (khi xóa lịch sử)"""
+        try:
+            keys = [key async for key in self.client.scan_iter(match=f"history:recent:{user_id}:*", count=500)]
+            if keys:
+                await self.client.delete(*keys)
+        except Exception as e:
+            print(f"⚠️ [Recent Turns Cache Delete Error] {e}")
+
+
+recent_turns_cache = RecentTurnsCache()
@@ -0,0 +1,78 @@
+# app/services/source_refs.py
+"""
+[MỚI] Lưu nguồn tham khảo của câu trả lời dạng THAM CHIẾU thay vì chép nguyên văn.
+- chat_history.sources: JSON [{"id": <point id Qdrant>, "score": 0.83, "hash": "<sha256>"}, ...]
+  (nhãn ngắn như "Cache Hit" vẫn lưu dạng chuỗi)
+- Bảng documents (hash -> content): mỗi đoạn văn bản khác nhau chỉ lưu 1 lần.
+- Bản ghi cũ (mảng chuỗi nguyên văn) vẫn đọc được, migration sẽ chuyển dần sang dạng tham chiếu.
+"""
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.schemas import documents
+
+
+# Nhãn ngắn (không phải văn bản nguồn): lưu nguyên dạng chuỗi, migration dedupe_history_sources bỏ qua
+CACHE_HIT_LABEL = "Cache Hit"
+AGENT_V3_LABEL = "Agent V3 (LangGraph)"
+SOURCE_LABELS = (CACHE_HIT_LABEL, AGENT_V3_LABEL)
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def build_source_refs(points) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Kết quả Qdrant -> (refs lưu vào chat_history, {hash: content} cần ghi vào bảng documents).
+    HISTORY_STORE_SOURCE_TEXT=False -> chỉ lưu id + score, không lưu văn bản.
+    """
+    refs, docs = [], {}
+    for point in points:
+        ref = {"id": point.id, "score": round(float(point.score), 4) if point.score is not None else None}
+        content = (point.payload or {}).get("content")
+        if settings.HISTORY_STORE_SOURCE_TEXT and content:
+            ref["hash"] = content_hash(content)
+            docs[ref["hash"]] = content
+        refs.append(ref)
+    return refs, docs
+
+
+def parse_sources(raw: Optional[str]) -> list:
+    if not raw:
+        return []
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        return []
+    return value if isinstance(value, list) else []
+
+
+async def resolve_sources(db: AsyncSession, raw_sources: List[Optional[str]]) -> List[List[dict]]:
+    """
+    Giải tham chiếu cho nhiều dòng chat_history cùng lúc: gom mọi hash -> 1 query duy nhất vào documents.
+    Mỗi nguồn trả về dạng {"id", "score", "content"} (bản ghi cũ / nhãn: id, score = None).
+    """
+    parsed = [parse_sources(raw) for raw in raw_sources]
+    hashes = {ref["hash"] for refs in parsed for ref in refs if isinstance(ref, dict) and ref.get("hash")}
+
+    contents = {}
+    if hashes:
+        rows = await db.execute(select(documents.c.hash, documents.c.content).where(documents.c.hash.in_(hashes)))
+        contents = {row.hash: row.content for row in rows}
+
+    resolved = []
+    for refs in parsed:
+        items = []
+        for ref in refs:
+            if isinstance(ref, dict):
+                items.append({"id": ref.get("id"), "score": ref.get("score"), "content": contents.get(ref.get("hash"))})
+            else:
+                items.append({"id": None, "score": None, "content": str(ref)})
+        resolved.append(items)
+    return resolved
@@ -0,0 +1,7 @@
+def get_agent_v3():
+    """
+    Truy cập Agent V3 mà không import langchain / langgraph / Gemini SDK lúc khởi động:
+    module agent chỉ được import ở request V3 đầu tiên (hoặc lúc warm-up).
+    """
+    from app.services.v3.agent import get_agent_v3 as _get_agent
+    return _get_agent()
@@ -1,12 +1,19 @@
 import os
+import threading
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk, ToolMessage, RemoveMessage
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import tools_condition
 from app.core.v3.langgraph_redis import AsyncRedisSaver
 from app.services.v3.state import AgentState
-from app.services.v3.tools import agent_tools
+from app.services.v3.tools import agent_tools, batch_handlers
+from app.services.v3.tool_executor import ParallelToolExecutor
+from app.services.v3.memory import (
+    SUMMARY_PROMPT, compact_stale_tool_results, estimate_tokens, render_transcript, split_recent_turns
+)
+from app.core.clients import clients
 from app.core.config import settings
+from app.core.metrics import LLM_REQUEST_SECONDS, record_llm_usage, timed_node
 from app.api.v2.chat_v2 import HARDCORE_SYSTEM_PROMPT 
 
 # [QUAN TRỌNG] Import Checkpointer Redis vừa tạo
@@ -19,23 +26,26 @@ class GymAgentV3:
         self.checkpointer = AsyncRedisSaver()
 
         # 2. Setup LLM
-        self.llm = ChatGoogleGenerativeAI(
-            model=settings.GEMINI_MODEL,
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=0.3,
-            convert_system_message_to_human=True
-        )
-        self.llm_with_tools = self.llm.bind_tools(tools=agent_tools)
+        # [NÂNG CẤP] Slot Hot Reload: đổi GEMINI_MODEL / GOOGLE_API_KEY -> dựng lại LLM, Graph giữ nguyên
+        self.llm_slot = clients.register("agent_llm", self._build_llm, {"GEMINI_MODEL", "GOOGLE_API_KEY"})
+
+        # [MỚI] Thống kê quản lý lịch sử (tóm tắt / rút gọn tool output)
+        self.history_stats = {"summarizations": 0, "tool_results_compacted": 0, "tokens_saved": 0}
 
         # 3. Xây dựng Graph
         workflow = StateGraph(AgentState)
         
         # Nodes
-        workflow.add_node("agent", self.call_model)
-        workflow.add_node("tools", ToolNode(agent_tools))
+        # [MỚI] timed_node: thời gian mỗi node -> agent_node_seconds (GET /metrics)
+        workflow.add_node("manage_history", timed_node("manage_history", self.manage_history))
+        workflow.add_node("agent", timed_node("agent", self.call_model))
+        # [MỚI] Chạy song song + gom lô các tool call trong cùng 1 lượt
+        workflow.add_node("tools", timed_node("tools", ParallelToolExecutor(agent_tools, batch_handlers).run))
 
         # Edges
-        workflow.set_entry_point("agent")
+        # Mỗi câu hỏi mới đi qua bước quản lý lịch sử trước khi tới LLM
+        workflow.set_entry_point("manage_history")
+        workflow.add_edge("manage_history", "agent")
         workflow.add_conditional_edges(
             "agent",
             tools_condition, # Tự động sang 'tools' nếu LLM muốn gọi hàm
@@ -45,41 +55,179 @@ class GymAgentV3:
         # [QUAN TRỌNG] Compile với Redis Checkpointer
         self.app = workflow.compile(checkpointer=self.checkpointer)
 
-    def call_model(self, state: AgentState):
+    @staticmethod
+    def _build_llm():
+        llm = ChatGoogleGenerativeAI(
+            model=settings.GEMINI_MODEL,
+            google_api_key=settings.GOOGLE_API_KEY,
+            temperature=0.3,
+            convert_system_message_to_human=True
+        )
+        return llm, llm.bind_tools(tools=agent_tools)
+
+    async def call_model(self, state: AgentState):
         messages = state["messages"]
         
         # Inject System Prompt nếu chưa có (Chỉ làm 1 lần đầu tiên của session)
         # Kiểm tra xem message đầu tiên có phải SystemMessage không
         if not messages or not isinstance(messages[0], SystemMessage):
-            system_msg = SystemMessage(content=HARDCORE_SYSTEM_PROMPT)
+            system_prompt = HARDCORE_SYSTEM_PROMPT
+            # Gộp bản tóm tắt hội thoại cũ (nếu có) vào System Prompt
+            if state.get("summary"):
+                system_prompt += f"\n\n# 📝 TÓM TẮT HỘI THOẠI TRƯỚC ĐÓ\n{state['summary']}"
+            system_msg = SystemMessage(content=system_prompt)
             # Chèn vào đầu list gửi đi (không sửa state gốc để tránh duplicate)
             messages = [system_msg] + messages
         
-        response = self.llm_with_tools.invoke(messages)
+        # [MỚI] Dùng ainvoke để không chặn Event Loop trong lúc chờ Gemini
+        with LLM_REQUEST_SECONDS.labels(backend="gemini").time(), self.llm_slot.lease() as (_, llm_with_tools):
+            response = await llm_with_tools.ainvoke(messages)
+        _record_usage(response)
         return {"messages": [response]}
 
+    async def manage_history(self, state: AgentState):
+        """
+        [MỚI] Giữ prompt gửi Gemini trong ngân sách token (V3_HISTORY_TOKEN_BUDGET):
+        1. Rút gọn kết quả tool của các lượt cũ (LLM đã dùng xong).
+        2. Nếu vẫn vượt: tóm tắt các lượt cũ thành 'summary' và xóa chúng khỏi state.
+        """
+        messages = state["messages"]
+        summary = state.get("summary", "")
+        budget = settings.V3_HISTORY_TOKEN_BUDGET
+        before = estimate_tokens(messages, summary)
+        if before <= budget:
+            return {}
+
+        # 1. Rút gọn tool output cũ
+        compacted = compact_stale_tool_results(messages, settings.V3_TOOL_RESULT_MAX_CHARS)
+        replaced = {m.id: m for m in compacted}
+        working = [replaced.get(m.id, m) for m in messages]
+        update = {"messages": compacted}
+        after = estimate_tokens(working, summary)
+
+        # 2. Tóm tắt các lượt cũ
+        if after > budget:
+            old, recent = split_recent_turns(working, settings.V3_HISTORY_KEEP_TURNS)
+            if old:
+                try:
+                    previous = f"Tóm tắt trước đó:\n{summary}\n\n" if summary else ""
+                    with self.llm_slot.lease() as (llm, _):
+                        result = await llm.ainvoke([
+                            SystemMessage(content=SUMMARY_PROMPT),
+                            HumanMessage(content=previous + "Hội thoại cần tóm tắt:\n" + render_transcript(old)),
+                        ])
+                    _record_usage(result)
+                    summary = _content_text(result.content)
+                    old_ids = {m.id for m in old}
+                    update = {
+                        "messages": [m for m in compacted if m.id not in old_ids] + [RemoveMessage(id=m.id) for m in old],
+                        "summary": summary,
+                    }
+                    after = estimate_tokens(recent, summary)
+                    self.history_stats["summarizations"] += 1
+                except Exception as e:
+                    # Tóm tắt lỗi thì vẫn giữ kết quả rút gọn tool, không chặn câu hỏi của user
+                    print(f"⚠️ [Agent V3] Tóm tắt lịch sử thất bại: {e}")
+
+        self.history_stats["tool_results_compacted"] += len(compacted)
+        self.history_stats["tokens_saved"] += max(before - after, 0)
+        print(f"🧹 [Agent V3] Lịch sử: ~{before} -> ~{after} tokens (ngân sách {budget})")
+        return update
+
     async def process_question(self, session_id: str, question: str,db_session=None):
         """
         Hàm chạy chính.
         """
+        # Gom các sự kiện stream lại, chỉ lấy câu trả lời cuối cùng
+        answer = None
+        async for event in self.stream_question(session_id, question):
+            if event["type"] == "done":
+                answer = event["answer"]
+
+        if answer is None:
+            return "Xin lỗi, hệ thống đang bận."
+        return answer
+
+    async def stream_question(self, session_id: str, question: str):
+        """
+        [MỚI] Chạy Graph và phát sự kiện theo thời gian thực:
+        - token:      Từng mảnh text do LLM sinh ra (chỉ của node 'agent')
+        - tool_start: Agent quyết định gọi tool (kèm tham số)
+        - tool_end:   Tool chạy xong (kèm kết quả)
+        - done:       Câu trả lời cuối cùng
+        Câu trả lời cuối lấy trực tiếp từ luồng 'updates' nên không cần gọi aget_state
+        (tiết kiệm 1 round trip tới Redis mỗi request).
+        """
         # Config thread_id là Session ID để Redis biết đang nói chuyện với ai
         config = {"configurable": {"thread_id": session_id}}
         
         input_message = HumanMessage(content=question)
-        
+        final_answer = None
+
         # Chạy Graph (Toàn bộ trạng thái sẽ được tự động Load/Save từ Redis)
-        async for event in self.app.astream({"messages": [input_message]}, config=config):
-            pass 
-            
-        # Lấy kết quả cuối cùng từ State hiện tại
-        snapshot = await self.app.aget_state(config)
-        if not snapshot.values:
-             return "Xin lỗi, hệ thống đang bận."
-
-        final_msg = snapshot.values["messages"][-1]
-        
-        # Trả về nội dung text
-        return final_msg.content
+        async for mode, chunk in self.app.astream(
+            {"messages": [input_message]},
+            config=config,
+            stream_mode=["messages", "updates"],
+        ):
+            if mode == "messages":
+                message, metadata = chunk
+                if metadata.get("langgraph_node") != "agent" or not isinstance(message, AIMessageChunk):
+                    continue
+                text = _content_text(message.content)
+                if text:
+                    yield {"type": "token", "content": text}
+
+            elif mode == "updates":
+                for node_name, update in chunk.items():
+                    if not update or not update.get("messages"):
+                        continue
+                    if node_name == "agent":
+                        last = update["messages"][-1]
+                        if getattr(last, "tool_calls", None):
+                            for call in last.tool_calls:
+                                yield {"type": "tool_start", "id": call["id"], "name": call["name"], "args": call["args"]}
+                        else:
+                            final_answer = _content_text(last.content)
+                    elif node_name == "tools":
+                        for msg in update["messages"]:
+                            if isinstance(msg, ToolMessage):
+                                cached = (msg.artifact or {}).get("cached") if isinstance(msg.artifact, dict) else None
+                                yield {
+                                    "type": "tool_end", "id": msg.tool_call_id, "name": msg.name,
+                                    "output": _content_text(msg.content), "cached": cached or False,
+                                }
+
+        if final_answer is None:
+            final_answer = "Xin lỗi, hệ thống đang bận."
+        yield {"type": "done", "answer": final_answer}
+
+
+def _record_usage(message) -> None:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        record_llm_usage("gemini", usage.get("input_tokens"), usage.get("output_tokens"))
+
+def _content_text(content) -> str:
+    """Gemini có thể trả content dạng list các 'part' -> gộp lại thành text thuần"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, (str, dict))
+        )
+    return str(content or "")
+
+# Singleton Instance (Lazy: dựng Graph ở lần dùng đầu tiên, không phải lúc import)
+_agent_instance = None
+_agent_lock = threading.Lock()
 
-# Singleton Instance
-agent_service_v3 = GymAgentV3()
\ No newline at end of file
+def get_agent_v3() -> GymAgentV3:
+    global _agent_instance
+    if _agent_instance is None:
+        with _agent_lock:  # Warm-up (thread) và request đầu tiên có thể gọi cùng lúc
+            if _agent_instance is None:
+                _agent_instance = GymAgentV3()
+    return _agent_instance
\ No newline at end of file
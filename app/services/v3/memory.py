@@ -0,0 +1,83 @@
+from typing import List, Tuple
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage
+
+# Ước lượng nhanh: tiếng Việt có dấu trung bình ~3 ký tự / token,
+# cộng thêm chi phí cố định cho mỗi tin nhắn (role, phân tách...)
+_CHARS_PER_TOKEN = 3
+_TOKENS_PER_MESSAGE = 4
+COMPACTED_SUFFIX = " …[đã rút gọn]"
+
+SUMMARY_PROMPT = """Bạn là bộ nhớ của GymCoach AI.
+Hãy tóm tắt ngắn gọn (tối đa 10 gạch đầu dòng) đoạn hội thoại dưới đây, GIỮ LẠI:
+- Thông tin cá nhân của người dùng (chiều cao, cân nặng, tuổi, mục tiêu Cutting/Bulking, dị ứng, sở thích).
+- Các món ăn đã tra cứu kèm số liệu kcal/protein quan trọng.
+- Các kết luận/lời khuyên đã đưa ra.
+Bỏ qua lời chào hỏi và chi tiết thừa. Chỉ trả về nội dung tóm tắt."""
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return "".join(p if isinstance(p, str) else str(p.get("text", "")) for p in content)
+    return str(content or "")
+
+
+def estimate_tokens(messages: List[BaseMessage], summary: str = "") -> int:
+    """Ước lượng số token của lịch sử (không gọi API đếm token để giữ hot path nhanh)"""
+    total = len(summary) // _CHARS_PER_TOKEN
+    for m in messages:
+        total += _TOKENS_PER_MESSAGE + len(_text(m)) // _CHARS_PER_TOKEN
+        for call in getattr(m, "tool_calls", None) or []:
+            total += len(str(call.get("args", ""))) // _CHARS_PER_TOKEN
+    return total
+
+
+def split_recent_turns(messages: List[BaseMessage], keep_turns: int) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """
+    Cắt lịch sử tại ranh giới HumanMessage: giữ lại `keep_turns` lượt hỏi gần nhất.
+    Cắt đúng ranh giới giúp không tách rời AIMessage(tool_calls) khỏi các ToolMessage của nó.
+    """
+    human_idx = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if len(human_idx) <= keep_turns:
+        return [], messages
+    cut = human_idx[-keep_turns]
+    return messages[:cut], messages[cut:]
+
+
+def compact_stale_tool_results(messages: List[BaseMessage], max_chars: int) -> List[ToolMessage]:
+    """
+    Kết quả tool của các lượt TRƯỚC lượt hỏi hiện tại đã được LLM dùng xong -> rút gọn.
+    Trả về ToolMessage cùng id để add_messages ghi đè bản cũ trong state.
+    Kết quả đã rút gọn ở lượt trước (có COMPACTED_SUFFIX) được bỏ qua -> không rút gọn / đếm lại.
+    """
+    human_idx = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if not human_idx:
+        return []
+    last_turn_start = human_idx[-1]
+
+    compacted = []
+    for m in messages[:last_turn_start]:
+        if not isinstance(m, ToolMessage):
+            continue
+        text = _text(m)
+        if len(text) > max_chars and not text.endswith(COMPACTED_SUFFIX):
+            compacted.append(ToolMessage(
+                id=m.id,
+                name=m.name,
+                tool_call_id=m.tool_call_id,
+                content=text[:max_chars] + COMPACTED_SUFFIX,
+            ))
+    return compacted
+
+
+def render_transcript(messages: List[BaseMessage]) -> str:
+    """Chuyển các tin nhắn cũ thành văn bản để đưa vào prompt tóm tắt"""
+    lines = []
+    for m in messages:
+        if isinstance(m, HumanMessage):
+            lines.append(f"User: {_text(m)}")
+        elif isinstance(m, ToolMessage):
+            lines.append(f"Tool ({m.name}): {_text(m)}")
+        elif isinstance(m, AIMessage) and _text(m):
+            lines.append(f"AI Coach: {_text(m)}")
+    return "\n".join(lines)
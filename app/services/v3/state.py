@@ -3,4 +3,6 @@ from langgraph.graph.message import add_messages
 
 # State của Agent: Đơn giản là một danh sách tin nhắn được cộng dồn
 class AgentState(TypedDict):
-    messages: Annotated[List, add_messages]
\ No newline at end of file
+    messages: Annotated[List, add_messages]
+    # [MỚI] Bản tóm tắt các lượt hội thoại cũ đã bị cắt khỏi 'messages'
+    summary: str
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Any, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+from app.core.redis import redis_pool
+
+
+class ToolResultCache:
+    """
+    Ghi nhớ kết quả tool của Agent V3 trong Redis, 2 tầng:
+    - Theo thread (checkpoint_toolcache:{thread_id}): nằm cạnh checkpoint, cùng TTL.
+      Câu hỏi nối tiếp trong cùng hội thoại ("ức gà" lần 2) trả về ngay.
+    - Toàn cục (toolcache:global:{tool}:{hash}): TTL ngắn cho các truy vấn phổ biến giữa nhiều user.
+    Cache chỉ là lớp tăng tốc: lỗi Redis không được làm hỏng câu trả lời.
+    """
+    def __init__(self):
+        self.client = redis.Redis(connection_pool=redis_pool)
+        self.thread_ttl = settings.CHECKPOINT_TTL_SECONDS
+        self.global_ttl = settings.V3_TOOL_CACHE_GLOBAL_TTL
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Chuẩn hóa để các truy vấn gần giống nhau dùng chung 1 khóa ("Ức gà?" == "ức  gà")"""
+        text = unicodedata.normalize("NFC", query).lower()
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    @staticmethod
+    def _thread_key(thread_id: str) -> str:
+        return f"checkpoint_toolcache:{thread_id}"
+
+    @staticmethod
+    def _global_key(tool_name: str, normalized: str) -> str:
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+        return f"toolcache:global:{tool_name}:{digest}"
+
+    async def get(self, tool_name: str, query: str, thread_id: Optional[str]) -> Tuple[Optional[Any], Optional[str]]:
+        """Trả về (kết quả, phạm vi cache: 'thread' | 'global') hoặc (None, None)"""
+        normalized = self.normalize(query)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            if thread_id:
+                pipe.hget(self._thread_key(thread_id), f"{tool_name}:{normalized}")
+            pipe.get(self._global_key(tool_name, normalized))
+            results = await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [Tool Cache Read Error] {e}")
+            return None, None
+
+        thread_hit = results[0] if thread_id else None
+        global_hit = results[-1]
+        if thread_hit is not None:
+            return json.loads(thread_hit), "thread"
+        if global_hit is not None:
+            value = json.loads(global_hit)
+            if thread_id:
+                # Ghi xuống tầng thread để các lượt sau trong hội thoại không phụ thuộc TTL ngắn
+                await self._set_thread(thread_id, tool_name, normalized, global_hit)
+            return value, "global"
+        return None, None
+
+    async def set(self, tool_name: str, query: str, thread_id: Optional[str], value: Any) -> None:
+        normalized = self.normalize(query)
+        data = json.dumps(value, ensure_ascii=False)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            if thread_id:
+                pipe.hset(self._thread_key(thread_id), f"{tool_name}:{normalized}", data)
+                pipe.expire(self._thread_key(thread_id), self.thread_ttl)
+            pipe.set(self._global_key(tool_name, normalized), data, ex=self.global_ttl)
+            await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [Tool Cache Write Error] {e}")
+
+    async def _set_thread(self, thread_id: str, tool_name: str, normalized: str, data: str) -> None:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(self._thread_key(thread_id), f"{tool_name}:{normalized}", data)
+            pipe.expire(self._thread_key(thread_id), self.thread_ttl)
+            await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ [Tool Cache Write Error] {e}")
+
+
+# Singleton Instance
+tool_cache = ToolResultCache()
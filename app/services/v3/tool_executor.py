@@ -0,0 +1,77 @@
+import asyncio
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+from app.core.config import settings
+from app.core.metrics import observe_tool
+
+
+class ParallelToolExecutor:
+    """
+    Node 'tools' thay cho ToolNode mặc định:
+    - Mọi tool call trong cùng 1 lượt của LLM được chạy đồng thời (giới hạn bởi V3_TOOL_MAX_CONCURRENCY).
+    - Các call của tool có batch handler (search_gym_food) được gom thành 1 lô:
+      1 lần encode + 1 request Qdrant cho cả lô.
+    - Mỗi tác vụ có timeout riêng (V3_TOOL_TIMEOUT); quá hạn thì trả lỗi cho đúng call đó.
+    """
+    def __init__(self, tools: list, batch_handlers: Dict[str, Callable] = None):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.batch_handlers = batch_handlers or {}
+
+    async def run(self, state, config: RunnableConfig):
+        calls = state["messages"][-1].tool_calls
+        thread_id = config.get("configurable", {}).get("thread_id")
+        semaphore = asyncio.Semaphore(max(1, settings.V3_TOOL_MAX_CONCURRENCY))
+        timeout = settings.V3_TOOL_TIMEOUT
+
+        # Gom call theo tool có hỗ trợ lô; còn lại chạy từng call
+        batched: Dict[str, List[dict]] = defaultdict(list)
+        singles: List[dict] = []
+        for call in calls:
+            if call["name"] in self.batch_handlers:
+                batched[call["name"]].append(call)
+            else:
+                singles.append(call)
+
+        async def limited(name, coro):
+            async with semaphore:
+                with observe_tool(name):  # agent_tool_seconds: không tính thời gian chờ semaphore
+                    return await asyncio.wait_for(coro, timeout=timeout)
+
+        tasks, owners = [], []
+        for name, group in batched.items():
+            tasks.append(limited(name, self.batch_handlers[name]([c["args"] for c in group], thread_id)))
+            owners.append(group)
+        for call in singles:
+            tasks.append(limited(call["name"], self._run_single(call, config)))
+            owners.append([call])
+
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+
+        messages_by_id = {}
+        for group, outcome in zip(owners, outcomes):
+            if isinstance(outcome, BaseException):
+                reason = "Quá thời gian chờ" if isinstance(outcome, asyncio.TimeoutError) else str(outcome)
+                for call in group:
+                    messages_by_id[call["id"]] = ToolMessage(
+                        content=f"Lỗi khi chạy tool: {reason}",
+                        name=call["name"], tool_call_id=call["id"], status="error",
+                    )
+                continue
+            for call, (content, artifact) in zip(group, outcome):
+                messages_by_id[call["id"]] = ToolMessage(
+                    content=content, artifact=artifact, name=call["name"], tool_call_id=call["id"],
+                )
+
+        # Giữ đúng thứ tự tool call của LLM
+        return {"messages": [messages_by_id[call["id"]] for call in calls]}
+
+    async def _run_single(self, call: dict, config: RunnableConfig):
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return [(f"Lỗi: Không có tool '{call['name']}'.", None)]
+        message = await tool.ainvoke({**call, "type": "tool_call"}, config=config)
+        return [(message.content, getattr(message, "artifact", None))]
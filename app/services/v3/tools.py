@@ -1,53 +1,103 @@
+import asyncio
+from typing import List, Optional, Tuple
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
 import os
 
 # Import service cũ
+from app.core.clients import async_qdrant_slot
+from app.core.config import settings
+from app.core.metrics import observe_dependency
 from app.services.embedding_bge_service import get_bge_service
-
-# Config
-QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
-QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
-COLLECTION_NAME = os.getenv("COLLECTION_NAME", "gym_food_hybrid_v1")
+from app.services.v3.tool_cache import tool_cache
 
 # Singleton Clients
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-embedder = get_bge_service()
+# [MỚI] Dùng AsyncQdrantClient để truy vấn không chặn Event Loop
+# [NÂNG CẤP] Client nằm trong slot Hot Reload, tên collection đọc từ settings mỗi lần gọi.
+# Embedder lấy qua get_bge_service() khi cần (không load model lúc import)
+
+EMPTY_RESULT = "Không tìm thấy dữ liệu món ăn này."
+
+
+async def search_gym_food_batch(queries: List[str], thread_id: Optional[str] = None) -> List[Tuple[str, dict]]:
+    """
+    [MỚI] Tìm nhiều món cùng lúc (VD: "so sánh phở bò, bún chả và cơm tấm"):
+    - Tra cache song song cho từng truy vấn.
+    - Các truy vấn chưa có trong cache: encode chung 1 lần + gửi 1 request query_batch_points tới Qdrant.
+    Trả về list (content, artifact) đúng thứ tự `queries`.
+    """
+    results: List[Optional[Tuple[str, dict]]] = [None] * len(queries)
+
+    # 0. Kết quả đã có trong cache (theo hội thoại hoặc toàn cục) -> trả về ngay
+    cache_hits = await asyncio.gather(*(tool_cache.get("search_gym_food", q, thread_id) for q in queries))
+    misses = []
+    for i, (cached, scope) in enumerate(cache_hits):
+        if cached is not None:
+            print(f"⚡ [Agent V3] Cache hit ({scope}): {queries[i]}")
+            results[i] = (cached, {"cached": scope})
+        else:
+            misses.append(i)
 
-@tool
-def search_gym_food(query: str):
+    if misses:
+        miss_queries = [queries[i] for i in misses]
+        print(f"🕵️ [Agent V3] Đang tìm kiếm ({len(miss_queries)} truy vấn): {miss_queries}")
+        try:
+            # 1. Tạo Vector (Hybrid) cho tất cả truy vấn trong 1 lần encode (worker pool)
+            dense_list, sparse_list = await get_bge_service().aembed_hybrid_batch(miss_queries)
+
+            # 2. Search Qdrant: 1 round trip cho cả lô
+            with async_qdrant_slot.lease() as client, observe_dependency("qdrant", "query_batch_points"):
+                responses = await client.query_batch_points(
+                    collection_name=settings.COLLECTION_NAME,
+                    requests=[
+                        models.QueryRequest(
+                            prefetch=[
+                                models.Prefetch(query=dense, using="dense", limit=20),
+                                models.Prefetch(query=sparse.as_object(), using="sparse", limit=20),
+                            ],
+                            query=models.FusionQuery(fusion=models.Fusion.RRF),
+                            limit=5,
+                            with_payload=True,
+                        )
+                        for dense, sparse in zip(dense_list, sparse_list)
+                    ],
+                )
+
+            # 3. Trả về text context cho LLM
+            for i, query, response in zip(misses, miss_queries, responses):
+                if not response.points:
+                    context = EMPTY_RESULT
+                else:
+                    context = "\n".join([f"- {hit.payload['content']}" for hit in response.points])
+                results[i] = (context, {"cached": False})
+                await tool_cache.set("search_gym_food", query, thread_id, context)
+
+        except Exception as e:
+            # Không cache lỗi
+            for i in misses:
+                results[i] = (f"Lỗi khi tìm kiếm: {str(e)}", {"cached": False})
+
+    return results
+
+
+@tool(response_format="content_and_artifact")
+async def search_gym_food(query: str, config: RunnableConfig):
     """
     Công cụ tìm kiếm thông tin dinh dưỡng món ăn.
     Luôn sử dụng công cụ này khi người dùng hỏi về calo, protein, thực đơn, món ăn.
     """
-    print(f"🕵️ [Agent V3] Đang tìm kiếm: {query}")
-    
-    try:
-        # 1. Tạo Vector (Hybrid)
-        dense = embedder.embed_dense(query)
-        sparse = embedder.embed_sparse(query)
-        
-        # 2. Search Qdrant
-        results = client.query_points(
-            collection_name=COLLECTION_NAME,
-            prefetch=[
-                models.Prefetch(query=dense, using="dense", limit=20),
-                models.Prefetch(query=sparse.as_object(), using="sparse", limit=20),
-            ],
-            query=models.FusionQuery(fusion=models.Fusion.RRF),
-            limit=5 
-        )
-        
-        if not results.points:
-            return "Không tìm thấy dữ liệu món ăn này."
-            
-        # 3. Trả về text context cho LLM
-        context = "\n".join([f"- {hit.payload['content']}" for hit in results.points])
-        return context
-
-    except Exception as e:
-        return f"Lỗi khi tìm kiếm: {str(e)}"
+    # thread_id = session_id của hội thoại (được LangGraph truyền qua config)
+    thread_id = config.get("configurable", {}).get("thread_id")
+    (content, artifact), = await search_gym_food_batch([query], thread_id)
+    return content, artifact
 
 # Xuất danh sách tool
-agent_tools = [search_gym_food]
\ No newline at end of file
+agent_tools = [search_gym_food]
+
+# Tool hỗ trợ chạy theo lô: tên tool -> hàm nhận list tham số, trả về list (content, artifact)
+batch_handlers = {
+    "search_gym_food": lambda args_list, thread_id: search_gym_food_batch(
+        [args.get("query", "") for args in args_list], thread_id
+    ),
+}
@@ -0,0 +1,125 @@
+"""
+Benchmark: So sánh checkpointer cũ (pickle toàn bộ state vào 1 key) với AsyncRedisSaver mới.
+
+Đo trên Redis thật (REDIS_HOST/REDIS_PORT trong .env):
+- Write amplification: số byte client gửi lên Redis cho mỗi lượt hỏi (INFO stats -> total_net_input_bytes)
+- Độ trễ mỗi bước Graph (put + get checkpoint)
+
+Chạy:  python -m benchmarks.bench_checkpointer --turns 40
+"""
+import argparse
+import asyncio
+import pickle
+import statistics
+import time
+import uuid
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+from langgraph.graph import StateGraph
+from langgraph.graph.message import add_messages
+from redis.asyncio import Redis
+
+from app.core.config import settings
+from app.core.v3.langgraph_redis import AsyncRedisSaver
+
+# Giả lập output của search_gym_food (~5 món ăn)
+FAKE_TOOL_OUTPUT = "\n".join(
+    f"- Món ăn: Ức gà luộc {i}. Dinh dưỡng: 165 kcal, Protein 31g, Fat 3.6g, Carb 0g. Giàu protein, tốt cho tăng cơ."
+    for i in range(5)
+)
+FAKE_ANSWER = "Ức gà luộc là lựa chọn tuyệt vời cho Cutting: 165 kcal | Protein 31g. " * 6
+
+
+class LegacyPickleSaver(BaseCheckpointSaver):
+    """Bản sao checkpointer cũ: pickle toàn bộ checkpoint vào checkpoint:{thread_id}"""
+    def __init__(self):
+        super().__init__()
+        self.client = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0, decode_responses=False)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        pass
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        data = pickle.dumps({"checkpoint": checkpoint, "metadata": metadata, "versions": new_versions})
+        await self.client.set(f"legacy_checkpoint:{thread_id}", data, ex=604800)
+        return config
+
+    async def aget_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        data = await self.client.get(f"legacy_checkpoint:{thread_id}")
+        if not data:
+            return None
+        saved = pickle.loads(data)
+        return CheckpointTuple(config, saved["checkpoint"], saved["metadata"], None, [])
+
+
+class BenchState(TypedDict):
+    messages: Annotated[List, add_messages]
+
+
+def build_graph(saver):
+    """agent -> tools -> agent: mô phỏng 1 lượt hỏi có gọi tool của GymAgentV3"""
+    async def agent(state):
+        last = state["messages"][-1]
+        if isinstance(last, HumanMessage):
+            call_id = str(uuid.uuid4())
+            return {"messages": [AIMessage(content="", tool_calls=[{"id": call_id, "name": "search_gym_food", "args": {"query": last.content}}])]}
+        return {"messages": [AIMessage(content=FAKE_ANSWER)]}
+
+    async def tools(state):
+        call = state["messages"][-1].tool_calls[0]
+        return {"messages": [ToolMessage(content=FAKE_TOOL_OUTPUT, tool_call_id=call["id"], name=call["name"])]}
+
+    def route(state):
+        return "tools" if getattr(state["messages"][-1], "tool_calls", None) else "__end__"
+
+    workflow = StateGraph(BenchState)
+    workflow.add_node("agent", agent)
+    workflow.add_node("tools", tools)
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", route)
+    workflow.add_edge("tools", "agent")
+    return workflow.compile(checkpointer=saver)
+
+
+async def net_input_bytes(client) -> int:
+    info = await client.info("stats")
+    return int(info["total_net_input_bytes"])
+
+
+async def run(saver, name: str, turns: int):
+    app = build_graph(saver)
+    config = {"configurable": {"thread_id": f"bench-{name}-{uuid.uuid4()}"}}
+    per_turn_bytes, per_turn_ms = [], []
+
+    for i in range(turns):
+        before = await net_input_bytes(saver.client)
+        start = time.perf_counter()
+        await app.ainvoke({"messages": [HumanMessage(content=f"Câu hỏi số {i}: ức gà bao nhiêu calo?")]}, config=config)
+        per_turn_ms.append((time.perf_counter() - start) * 1000)
+        per_turn_bytes.append(await net_input_bytes(saver.client) - before)
+
+    # Mỗi lượt có 4 bước ghi checkpoint (input, agent, tools, agent)
+    steps = 4
+    print(f"\n=== {name} ({turns} lượt) ===")
+    print(f"Bytes gửi lên Redis / lượt : đầu={per_turn_bytes[0]:,}  cuối={per_turn_bytes[-1]:,}  tổng={sum(per_turn_bytes):,}")
+    print(f"Độ trễ / bước (ms)        : p50={statistics.median(per_turn_ms) / steps:.2f}  "
+          f"cuối={per_turn_ms[-1] / steps:.2f}")
+    return sum(per_turn_bytes)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    args = parser.parse_args()
+
+    legacy_total = await run(LegacyPickleSaver(), "legacy-pickle", args.turns)
+    new_total = await run(AsyncRedisSaver(), "incremental", args.turns)
+    print(f"\n➡️  Write amplification giảm {legacy_total / max(new_total, 1):.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
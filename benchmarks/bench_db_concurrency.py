@@ -0,0 +1,115 @@
+"""
+Benchmark: So sánh truy cập DB đồng bộ (Session sync gọi trong hàm async) với Async Engine (psycopg 3 async).
+
+Mô phỏng N request đồng thời, mỗi request giữ connection trong `--query-ms` (pg_sleep) rồi đọc 1 dòng,
+song song với 1 coroutine "heartbeat" đo độ trễ của Event Loop (tick mỗi 10ms).
+
+Đo trên Postgres thật (POSTGRES_* trong .env):
+- Tổng thời gian xử lý N request
+- p50/p95/p99 độ trễ mỗi request
+- Độ trễ lớn nhất của Event Loop (sync sẽ chặn toàn bộ loop, async thì không)
+
+Chạy:  python -m benchmarks.bench_db_concurrency --requests 200 --query-ms 20
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import settings
+
+QUERY = text("SELECT pg_sleep(:s), 1")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    """Đo Event Loop bị chặn bao lâu: tick mong đợi 10ms, phần dư là độ trễ"""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append((time.perf_counter() - t0 - 0.01) * 1000)
+
+
+async def run_sync(n: int, query_s: float, pool_size: int):
+    # Giống code cũ: Session sync được gọi thẳng trong endpoint `async def`
+    engine = create_engine(settings.DATABASE_URL, pool_size=pool_size, max_overflow=0)
+    with engine.connect() as conn:  # Warm-up pool
+        conn.execute(text("SELECT 1"))
+
+    async def one_request():
+        t0 = time.perf_counter()
+        with engine.connect() as conn:
+            conn.execute(QUERY, {"s": query_s}).fetchone()
+        return (time.perf_counter() - t0) * 1000
+
+    result = await _drive(one_request, n)
+    engine.dispose()
+    return result
+
+
+async def run_async(n: int, query_s: float, pool_size: int):
+    engine = create_async_engine(settings.DATABASE_URL, pool_size=pool_size, max_overflow=0)
+    async with engine.connect() as conn:  # Warm-up pool
+        await conn.execute(text("SELECT 1"))
+
+    async def one_request():
+        t0 = time.perf_counter()
+        async with engine.connect() as conn:
+            (await conn.execute(QUERY, {"s": query_s})).fetchone()
+        return (time.perf_counter() - t0) * 1000
+
+    result = await _drive(one_request, n)
+    await engine.dispose()
+    return result
+
+
+async def _drive(one_request, n: int):
+    stop = asyncio.Event()
+    lags = []
+    hb = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(0.05)
+
+    t0 = time.perf_counter()
+    latencies = await asyncio.gather(*(one_request() for _ in range(n)))
+    wall = time.perf_counter() - t0
+
+    stop.set()
+    await hb
+    return wall, latencies, lags
+
+
+def report(name: str, wall: float, latencies: list, lags: list, n: int):
+    print(f"\n📊 {name}")
+    print(f"   Tổng thời gian      : {wall:.2f}s  ({n / wall:.1f} req/s)")
+    print(f"   Latency p50/p95/p99 : {percentile(latencies, 50):.1f} / {percentile(latencies, 95):.1f} / {percentile(latencies, 99):.1f} ms")
+    print(f"   Event Loop lag max  : {max(lags, default=0):.1f} ms (mean {statistics.mean(lags) if lags else 0:.1f} ms)")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--query-ms", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=settings.DB_POOL_SIZE)
+    args = parser.parse_args()
+    query_s = args.query_ms / 1000
+
+    print(f"🚀 {args.requests} request đồng thời, mỗi truy vấn {args.query_ms}ms, pool_size={args.pool_size}")
+    report("SYNC Session (cũ)", *(await run_sync(args.requests, query_s, args.pool_size)), args.requests)
+    report("ASYNC Engine (mới)", *(await run_async(args.requests, query_s, args.pool_size)), args.requests)
+
+
+if __name__ == "__main__":
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Benchmark: Độ trễ p99 của chat khi có bão đăng nhập (login storm).
+
+Mô phỏng trong 1 Event Loop:
+- Luồng "chat": request nhẹ liên tục (await I/O 5ms), đo latency từng request.
+- Bão login: `--logins` lần verify bcrypt đồng thời (cost = BCRYPT_ROUNDS trong .env).
+So sánh 2 cách:
+  1. verify_password đồng bộ ngay trong handler async (code cũ) -> chặn Event Loop.
+  2. averify_password chạy trong thread pool giới hạn BCRYPT_WORKERS (code mới).
+
+Chạy:  python -m benchmarks.bench_login_storm --logins 50 --chat-rps 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.core.config import settings
+from app.core.security import averify_password, get_password_hash, verify_password
+
+PASSWORD = "benchmark-password"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+async def chat_traffic(stop: asyncio.Event, rps: int, latencies: list):
+    """
+    Bắn request chat theo lịch cố định, mỗi request = 5ms chờ I/O (LLM/DB giả lập).
+    Latency tính từ thời điểm request LẼ RA được gửi (tránh coordinated omission:
+    khi Event Loop bị chặn, các request dồn lại phải chịu cả thời gian chờ đó).
+    """
+    async def one_chat(scheduled: float):
+        await asyncio.sleep(0.005)
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+
+    tasks = []
+    start = time.perf_counter()
+    i = 0
+    while not stop.is_set():
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one_chat(scheduled)))
+        i += 1
+    await asyncio.gather(*tasks)
+
+
+async def login_sync(hashed: str):
+    # Code cũ: bcrypt chạy thẳng trên Event Loop
+    return verify_password(PASSWORD, hashed)
+
+
+async def login_async(hashed: str):
+    return await averify_password(PASSWORD, hashed)
+
+
+async def run(mode: str, login_fn, hashed: str, logins: int, rps: int):
+    stop = asyncio.Event()
+    latencies = []
+    chat = asyncio.create_task(chat_traffic(stop, rps, latencies))
+    await asyncio.sleep(0.2)  # Chat chạy ổn định trước khi bão login tới
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(login_fn(hashed) for _ in range(logins)))
+    login_wall = time.perf_counter() - t0
+
+    await asyncio.sleep(0.2)
+    stop.set()
+    await chat
+
+    print(f"\n📊 {mode}")
+    print(f"   {logins} logins xong trong : {login_wall:.2f}s")
+    print(f"   Chat requests            : {len(latencies)}")
+    print(f"   Chat latency p50/p99/max : {percentile(latencies, 50):.1f} / {percentile(latencies, 99):.1f} / {max(latencies):.1f} ms"
+          f" (mean {statistics.mean(latencies):.1f} ms)")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--chat-rps", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"🚀 bcrypt rounds={settings.BCRYPT_ROUNDS}, workers={settings.BCRYPT_WORKERS}, "
+          f"{args.logins} logins đồng thời, chat {args.chat_rps} req/s")
+    hashed = get_password_hash(PASSWORD)
+
+    await run("SYNC bcrypt trên Event Loop (cũ)", login_sync, hashed, args.logins, args.chat_rps)
+    await run("bcrypt trong thread pool giới hạn (mới)", login_async, hashed, args.logins, args.chat_rps)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,2 +1,2 @@
 .\myenv\Scripts\Activate.ps1
-uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
+python start.py
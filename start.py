@@ -1,9 +1,20 @@
+import asyncio
+import sys
+
 import uvicorn
 
 if __name__ == "__main__":
+    reload = True
+    if sys.platform == "win32":
+        # [MỚI] psycopg 3 async không chạy được trên ProactorEventLoop (mặc định của Windows)
+        # -> Dùng SelectorEventLoop. Chế độ --reload của uvicorn luôn ép Proactor cho tiến trình con,
+        #    nên trên Windows phải tắt reload.
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        reload = False
+
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=reload
     )
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Chạy `pytest` từ bất kỳ đâu: đưa thư mục gốc của project vào sys.path để import được `app`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
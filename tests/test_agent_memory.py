@@ -0,0 +1,58 @@
+import asyncio
+
+import fakeredis
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import StateGraph
+
+from app.core.config import settings
+from app.core.v3.langgraph_redis import AsyncRedisSaver
+from app.services.v3.agent import GymAgentV3
+from app.services.v3.memory import COMPACTED_SUFFIX
+from app.services.v3.state import AgentState
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    monkeypatch.setattr(settings, "V3_HISTORY_TOKEN_BUDGET", 10)
+    monkeypatch.setattr(settings, "V3_TOOL_RESULT_MAX_CHARS", 40)
+    monkeypatch.setattr(settings, "V3_HISTORY_KEEP_TURNS", 100)  # Không tóm tắt -> không cần gọi LLM
+
+
+def make_graph(server, agent):
+    saver = AsyncRedisSaver()
+    saver.client = fakeredis.aioredis.FakeRedis(server=server)
+    workflow = StateGraph(AgentState)
+    workflow.add_node("manage_history", agent.manage_history)
+    workflow.set_entry_point("manage_history")
+    workflow.set_finish_point("manage_history")
+    return workflow.compile(checkpointer=saver)
+
+
+def test_compacted_tool_result_stays_compacted(small_budget):
+    # Chỉ dùng manage_history: không dựng LLM / Redis thật
+    agent = GymAgentV3.__new__(GymAgentV3)
+    agent.history_stats = {"summarizations": 0, "tool_results_compacted": 0, "tokens_saved": 0}
+    server = fakeredis.FakeServer()
+    config = {"configurable": {"thread_id": "t-compact"}}
+    first_turn = [
+        HumanMessage(id="h1", content="Ức gà bao nhiêu calo?"),
+        AIMessage(id="a1", content="", tool_calls=[{"id": "call-1", "name": "search_gym_food", "args": {"query": "ức gà"}}]),
+        ToolMessage(id="t1", tool_call_id="call-1", name="search_gym_food", content="Ức gà: 165 kcal, 31g protein. " * 20),
+        AIMessage(id="a2", content="Ức gà có 165 kcal."),
+        HumanMessage(id="h2", content="Còn thịt bò?"),
+    ]
+
+    async def scenario():
+        await make_graph(server, agent).ainvoke({"messages": first_turn}, config)
+        # Lượt sau, checkpointer mới (đọc lại từ Redis)
+        state = await make_graph(server, agent).ainvoke(
+            {"messages": [HumanMessage(id="h3", content="Còn cá hồi?")]}, config
+        )
+        return state["messages"]
+
+    messages = asyncio.run(scenario())
+    tool_result = next(m for m in messages if m.id == "t1")
+    assert tool_result.content.endswith(COMPACTED_SUFFIX)
+    assert len(tool_result.content) == 40 + len(COMPACTED_SUFFIX)
+    assert agent.history_stats["tool_results_compacted"] == 1  # Không bị đếm lại ở lượt 2
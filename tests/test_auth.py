@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.api import deps
+from app.core.security import create_access_token, create_refresh_token
+
+
+def authenticate(token: str):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return asyncio.run(deps.get_current_user(credentials, db=None))
+
+
+def test_refresh_token_is_not_a_bearer_token():
+    token = create_refresh_token(data={"sub": "alice", "jti": "session-1"})
+    with pytest.raises(HTTPException) as exc:
+        authenticate(token)
+    assert exc.value.status_code == 401
+
+
+def test_revoked_session_rejects_access_token(monkeypatch):
+    async def is_revoked(jti):
+        return jti == "session-1"
+
+    monkeypatch.setattr(deps.token_store, "is_revoked", is_revoked)
+    token = create_access_token(data={"sub": "alice", "role": "user", "sid": "session-1"})
+    with pytest.raises(HTTPException) as exc:
+        authenticate(token)
+    assert exc.value.status_code == 401
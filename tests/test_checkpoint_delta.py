@@ -0,0 +1,74 @@
+import asyncio
+
+import fakeredis
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import StateGraph
+
+from app.core.v3.langgraph_redis import AsyncRedisSaver
+from app.services.v3.state import AgentState
+
+
+def make_saver(server) -> AsyncRedisSaver:
+    saver = AsyncRedisSaver()
+    saver.client = fakeredis.aioredis.FakeRedis(server=server)
+    return saver
+
+
+def build_graph(saver):
+    async def replace_tool_result(state):
+        # Giống rút gọn kết quả tool (user-029): cùng id, nội dung mới
+        old = next(m for m in state["messages"] if isinstance(m, ToolMessage))
+        return {"messages": [ToolMessage(id=old.id, tool_call_id=old.tool_call_id, name=old.name, content="rút gọn")]}
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("replace", replace_tool_result)
+    workflow.set_entry_point("replace")
+    workflow.set_finish_point("replace")
+    return workflow.compile(checkpointer=saver)
+
+
+def test_same_id_replacement_is_persisted():
+    server = fakeredis.FakeServer()
+    config = {"configurable": {"thread_id": "t-replace"}}
+    messages = [
+        HumanMessage(id="h1", content="Ức gà bao nhiêu calo?"),
+        AIMessage(id="a1", content="", tool_calls=[{"id": "call-1", "name": "search_gym_food", "args": {"query": "ức gà"}}]),
+        ToolMessage(id="t1", tool_call_id="call-1", name="search_gym_food", content="kết quả rất dài " * 50),
+    ]
+
+    async def scenario():
+        # Cùng 1 saver: checkpoint sau node 'replace' đi theo nhánh delta (các id không đổi)
+        await build_graph(make_saver(server)).ainvoke({"messages": messages}, config)
+        # Saver mới (không có _heads trong RAM) = worker khác / sau khi restart
+        reloaded = await make_saver(server).aget_tuple(config)
+        return reloaded.checkpoint["channel_values"]["messages"]
+
+    stored = asyncio.run(scenario())
+    assert [m.id for m in stored] == ["h1", "a1", "t1"]
+    assert stored[-1].content == "rút gọn"
+
+
+def test_append_only_still_uses_delta():
+    server = fakeredis.FakeServer()
+    saver = make_saver(server)
+    config = {"configurable": {"thread_id": "t-append"}}
+
+    async def append(state):
+        return {"messages": [AIMessage(id=f"a{len(state['messages'])}", content="ok")]}
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("append", append)
+    workflow.set_entry_point("append")
+    workflow.set_finish_point("append")
+    graph = workflow.compile(checkpointer=saver)
+
+    async def scenario():
+        await graph.ainvoke({"messages": [HumanMessage(id="h1", content="xin chào")]}, config)
+        blob_keys = [k async for k in saver.client.scan_iter(match="checkpoint_blob:t-append:*:messages:*")]
+        blobs = [await saver.client.get(k) for k in blob_keys]
+        reloaded = await make_saver(server).aget_tuple(config)
+        return blobs, reloaded.checkpoint["channel_values"]["messages"]
+
+    blobs, stored = asyncio.run(scenario())
+    assert any(blob[:1] == b"d" for blob in blobs)  # Có ít nhất 1 blob delta
+    assert [m.id for m in stored] == ["h1", "a1"]
@@ -0,0 +1,45 @@
+import asyncio
+
+from app.core import clients as clients_module
+from app.core.clients import ClientSlot
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_swap_waits_for_leases_on_the_old_client(monkeypatch):
+    monkeypatch.setattr(clients_module.settings, "CLIENT_DRAIN_TIMEOUT", 5)
+    slot = ClientSlot("fake", FakeClient, [])
+
+    async def scenario():
+        with slot.lease() as old_client:
+            swap = asyncio.create_task(slot.swap())
+            await asyncio.sleep(0.2)
+            assert not old_client.closed  # Lease chưa trả -> chưa được đóng
+            assert slot.get() is not old_client
+        await swap
+        return old_client
+
+    old_client = asyncio.run(scenario())
+    assert old_client.closed
+    assert slot._inflight == {}
+
+
+def test_lease_outliving_drain_timeout_releases_cleanly(monkeypatch):
+    monkeypatch.setattr(clients_module.settings, "CLIENT_DRAIN_TIMEOUT", 0.1)
+    slot = ClientSlot("fake", FakeClient, [])
+
+    async def scenario():
+        with slot.lease() as old_client:
+            await slot.swap()  # Hết thời gian drain khi lease vẫn đang giữ client cũ
+            assert old_client.closed
+        with slot.lease() as new_client:
+            assert new_client is slot.get()
+
+    asyncio.run(scenario())  # Thoát lease sau drain timeout không được ném KeyError
+    assert slot._inflight == {}
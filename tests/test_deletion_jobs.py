@@ -0,0 +1,51 @@
+import asyncio
+
+import fakeredis
+
+from app.services.deletion_jobs import DeletionJobs
+
+
+def make_jobs(monkeypatch, delete_batch):
+    jobs = DeletionJobs()
+    jobs.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(jobs, "_delete_batch", delete_batch)
+    return jobs
+
+
+def test_user_deletion_is_not_merged_into_running_history_job(monkeypatch):
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def slow_batch(sql, user_id):
+            await gate.wait()
+            raise RuntimeError("stop here")
+
+        jobs = make_jobs(monkeypatch, slow_batch)
+        history_job = await jobs.submit(7, "history")
+        user_job = await jobs.submit(7, "user")
+        again = await jobs.submit(7, "user")
+        gate.set()
+        await jobs.stop()
+        return history_job, user_job, again
+
+    history_job, user_job, again = asyncio.run(scenario())
+    assert user_job != history_job
+    assert again == user_job
+
+
+def test_failed_user_job_stays_queued(monkeypatch):
+    async def failing_batch(sql, user_id):
+        raise ConnectionError("db down")
+
+    async def scenario():
+        jobs = make_jobs(monkeypatch, failing_batch)
+        user_job = await jobs.submit(7, "user")
+        history_job = await jobs.submit(8, "history")
+        await asyncio.gather(*jobs._tasks)
+        queued = await jobs.client.smembers(jobs.QUEUE_KEY)
+        return user_job, history_job, queued, await jobs.get(user_job)
+
+    user_job, history_job, queued, job = asyncio.run(scenario())
+    assert job["status"] == "failed"
+    assert user_job in queued
+    assert history_job not in queued
@@ -0,0 +1,50 @@
+import asyncio
+import gc
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import history_export
+from app.services.history_export import HistoryExporter
+
+
+class BrokenEngine:
+    def connect(self):
+        raise ConnectionError("db down")
+
+
+def make_exporter(monkeypatch, limit: int) -> HistoryExporter:
+    monkeypatch.setattr(history_export, "engine", BrokenEngine())
+    exporter = HistoryExporter()
+    exporter.max_concurrent = limit
+    return exporter
+
+
+def test_slot_is_reserved_before_the_body_is_iterated(monkeypatch):
+    exporter = make_exporter(monkeypatch, limit=1)
+    first = exporter.stream(1)
+    with pytest.raises(HTTPException) as exc:
+        exporter.stream(2)
+    assert exc.value.status_code == 429
+    assert exporter.active == 1
+
+    del first  # Client ngắt trước khi body được lặp
+    gc.collect()
+    assert exporter.active == 0
+
+
+def test_slot_is_released_once_after_a_failed_stream(monkeypatch):
+    exporter = make_exporter(monkeypatch, limit=1)
+    stream = exporter.stream(1)
+
+    async def consume():
+        async for _ in stream:
+            pass
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(consume())
+    assert exporter.active == 0
+    del stream
+    gc.collect()
+    assert exporter.active == 0
+    exporter.stream(2)  # Chỗ đã được trả -> không bị 429
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, insert
+
+from app.db.fulltext import build_search_sql
+from app.db.schemas import chat_history, chat_sessions, users
+
+# Chạy trên Postgres thật (extension unaccent/btree_gin, trigger): TEST_DATABASE_URL=postgresql+psycopg://...
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+def test_search_sql_binds_only_given_bounds():
+    assert ":since" not in build_search_sql(since=False, until=False)
+    assert ":until" not in build_search_sql(since=False, until=False)
+    sql = build_search_sql(since=True, until=False)
+    assert "h.created_at >= :since" in sql and ":until" not in sql
+    sql = build_search_sql(since=False, until=True)
+    assert "h.created_at < :until" in sql and ":since" not in sql
+
+
+def test_search_sql_escapes_markup_before_headline():
+    sql = build_search_sql(since=False, until=False)
+    assert "replace(r.question, '&', '&amp;')" in sql
+    assert "replace(r.answer, '&', '&amp;')" in sql
+    assert "'<', '&lt;'" in sql
+
+
+@pytest.fixture
+def migrated_db():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app.db.migrations import run_db_migrations
+
+    sync_engine = create_engine(TEST_DATABASE_URL)
+    asyncio.run(run_db_migrations(sync_engine, concurrent_indexes=False))
+
+    username = f"search-{uuid.uuid4().hex[:8]}"
+    session_id = str(uuid.uuid4())
+    with sync_engine.begin() as conn:
+        user_id = conn.execute(insert(users).values(
+            username=username, email=f"{username}@example.com", password_hash="x"
+        ).returning(users.c.id)).scalar_one()
+        conn.execute(insert(chat_sessions).values(id=session_id, user_id=user_id, title="whey"))
+        conn.execute(insert(chat_history).values(
+            user_id=user_id, session_id=session_id,
+            question="Nên uống đạm whey lúc nào?",
+            answer="Uống đạm whey sau tập <script>alert(1)</script>",
+        ))
+    async_engine = create_async_engine(TEST_DATABASE_URL)
+    yield user_id, async_engine
+    asyncio.run(async_engine.dispose())
+    with sync_engine.begin() as conn:
+        conn.execute(chat_history.delete().where(chat_history.c.user_id == user_id))
+        conn.execute(chat_sessions.delete().where(chat_sessions.c.user_id == user_id))
+        conn.execute(users.delete().where(users.c.id == user_id))
+    sync_engine.dispose()
+
+
+def test_unaccented_query_matches_and_highlight_is_escaped(migrated_db):
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.services.history_service import HistoryService
+
+    user_id, engine = migrated_db
+
+    async def scenario():
+        async with AsyncSession(engine) as db:
+            service = HistoryService(db)
+            hits = await service.search_history(user_id, "dam whey")
+            bounded = await service.search_history(
+                user_id, "dam whey", since=datetime.now() - timedelta(days=1), until=datetime.now() + timedelta(days=1)
+            )
+            history = await service.get_user_history(user_id)
+        return hits, bounded, history
+
+    hits, bounded, history = asyncio.run(scenario())
+    assert len(hits) == 1 and len(bounded) == 1
+    assert "<mark>" in hits[0]["question_highlight"]
+    assert "<script>" not in hits[0]["answer_highlight"]
+    assert "&lt;script&gt;" in hits[0]["answer_highlight"]
+    assert history["items"] and "search_vector" not in history["items"][0]
@@ -0,0 +1,81 @@
+import asyncio
+import json
+from datetime import datetime
+
+import fakeredis
+
+from app.services.history_writer import HistoryWriter
+
+
+class FlakyRedis(fakeredis.aioredis.FakeRedis):
+    """hdel lỗi như khi Redis chập chờn"""
+    async def hdel(self, *args):
+        raise ConnectionError("redis hiccup")
+
+
+def test_writer_survives_redis_errors_during_recover(monkeypatch):
+    async def scenario():
+        writer = HistoryWriter()
+        writer.client = FlakyRedis()
+        writer.persist = True
+        writer.recovery_age = 0   # recover() chạy sau mỗi lô
+        writer.flush_interval = 0.01
+        flushed = []
+
+        async def fake_flush(batch):
+            flushed.extend(batch)
+
+        monkeypatch.setattr(writer, "_flush", fake_flush)
+        monkeypatch.setattr("app.services.history_writer.recent_turns_cache.append", _noop)
+        await writer.client.hset(writer.PENDING_KEY, "orphan", '{"id": "orphan", "enqueued_at": 0}')
+
+        await writer.start()
+        for i in range(3):
+            await writer.enqueue(1, "s1", f"q{i}", "a", [])
+            await asyncio.sleep(0.05)
+        assert not writer._task.done()
+        await writer.stop()
+        return flushed
+
+    flushed = asyncio.run(scenario())
+    assert [item["question"] for item in flushed] == ["q0", "q1", "q2"]
+    assert datetime.fromisoformat(flushed[0]["created_at"]).utcoffset().total_seconds() == 0
+
+
+async def _noop(*args, **kwargs):
+    return None
+
+
+def test_periodic_recover_does_not_deadlock_on_a_full_queue(monkeypatch):
+    async def scenario():
+        writer = HistoryWriter()
+        writer.client = fakeredis.aioredis.FakeRedis()
+        writer.persist = True
+        writer.queue = asyncio.Queue(maxsize=2)
+        writer.batch_size = 2
+        writer.flush_interval = 0.01
+        flushed = []
+
+        async def fake_flush(batch):
+            flushed.extend(batch)
+            await writer._ack(batch)
+
+        monkeypatch.setattr(writer, "_flush", fake_flush)
+        monkeypatch.setattr("app.services.history_writer.recent_turns_cache.append", _noop)
+        await writer.start()
+
+        # 5 tin nhắn mồ côi (nhiều hơn sức chứa hàng đợi) xuất hiện khi worker đang chạy
+        for i in range(5):
+            await writer.client.hset(writer.PENDING_KEY, f"orphan{i}", json.dumps(
+                {"id": f"orphan{i}", "question": f"o{i}", "enqueued_at": 0}
+            ))
+        writer.recovery_age = 0
+        await writer.enqueue(1, "s1", "q0", "a", [])
+        await asyncio.wait_for(writer.enqueue(1, "s1", "q1", "a", []), 1)
+        await asyncio.sleep(0.1)
+        await asyncio.wait_for(writer.stop(), 1)
+        return flushed, await writer.client.hlen(writer.PENDING_KEY)
+
+    flushed, pending = asyncio.run(scenario())
+    assert sorted(item["question"] for item in flushed) == ["o0", "o1", "o2", "o3", "o4", "q0", "q1"]
+    assert pending == 0
@@ -0,0 +1,18 @@
+from datetime import date
+
+from app.db.partitions import DEFAULT_PARTITION, create_default_partition_sql, create_partition_sql
+
+
+def test_partitions_can_target_the_shadow_table():
+    # Chuyển đổi bảng cũ: partition được gắn vào bảng tạm, giữ tên cuối cùng (đổi tên bảng cha lúc tráo)
+    stmts = create_partition_sql(date(2024, 5, 1), "chat_history_new")
+    assert stmts[0].startswith("CREATE TABLE IF NOT EXISTS chat_history_p202405 (LIKE chat_history_new")
+    assert "ALTER TABLE chat_history_new ATTACH PARTITION chat_history_p202405" in stmts[2]
+    assert create_default_partition_sql("chat_history_new") == (
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF chat_history_new DEFAULT"
+    )
+
+
+def test_partitions_default_to_the_live_table():
+    assert "ATTACH PARTITION chat_history_p202405" in create_partition_sql(date(2024, 5, 1))[2]
+    assert create_default_partition_sql().endswith("PARTITION OF chat_history DEFAULT")
@@ -0,0 +1,48 @@
+import asyncio
+
+import fakeredis
+
+from app.core import principal_cache as principal_cache_module
+from app.core.principal_cache import SET_IF_GENERATION_LUA, Principal, PrincipalCache
+
+
+def make_cache(monkeypatch) -> PrincipalCache:
+    async def publish(channel, payload):
+        return None
+
+    monkeypatch.setattr(principal_cache_module.event_bus, "publish", publish)
+    cache = PrincipalCache()
+    cache.client = fakeredis.aioredis.FakeRedis()
+    cache._set_script = cache.client.register_script(SET_IF_GENERATION_LUA)
+    return cache
+
+
+def alice(role="admin", is_active=True) -> Principal:
+    return Principal(id=1, username="alice", role=role, is_active=is_active)
+
+
+def test_invalidate_during_db_read_skips_the_stale_write(monkeypatch):
+    cache = make_cache(monkeypatch)
+
+    async def scenario():
+        snapshot = await cache.snapshot("alice")  # get_current_user: trước khi đọc DB
+        stale = alice()                            # Dòng DB đọc được trước khi admin bị hạ quyền
+        await cache.invalidate("alice")            # Hạ quyền + invalidate chen giữa
+        await cache.set(stale, snapshot)
+        return await cache.get("alice")
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_set_without_invalidate_is_cached_for_all_workers(monkeypatch):
+    cache = make_cache(monkeypatch)
+
+    async def scenario():
+        await cache.invalidate("alice")  # Generation đã có từ trước
+        snapshot = await cache.snapshot("alice")
+        await cache.set(alice(role="user"), snapshot)
+        cache._local.clear()              # Worker khác: chỉ còn tầng Redis
+        return await cache.get("alice")
+
+    principal = asyncio.run(scenario())
+    assert principal is not None and principal["role"] == "user"
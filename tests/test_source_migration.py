@@ -0,0 +1,45 @@
+import asyncio
+import json
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+
+from app.db.migrations import DEDUPE_SOURCES_MIGRATION, dedupe_history_sources, run_db_migrations
+from app.db.schemas import chat_history, chat_sessions, users
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+def test_dedupe_sources_runs_once_and_keeps_labels():
+    engine = create_engine(TEST_DATABASE_URL)
+    asyncio.run(run_db_migrations(engine, concurrent_indexes=False))
+    username = f"sources-{uuid.uuid4().hex[:8]}"
+    session_id = str(uuid.uuid4())
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM data_migrations WHERE name = :name"), {"name": DEDUPE_SOURCES_MIGRATION})
+        user_id = conn.execute(insert(users).values(
+            username=username, email=f"{username}@example.com", password_hash="x"
+        ).returning(users.c.id)).scalar_one()
+        conn.execute(insert(chat_sessions).values(id=session_id, user_id=user_id))
+        for sources in (["Cache Hit"], ["Agent V3 (LangGraph)"], ["Ức gà 100g: 31g protein"]):
+            conn.execute(insert(chat_history).values(
+                user_id=user_id, session_id=session_id, question="q", answer="a", sources=json.dumps(sources)
+            ))
+    try:
+        assert asyncio.run(dedupe_history_sources(engine)) >= 1
+        with engine.connect() as conn:
+            rows = [json.loads(raw) for raw in conn.execute(
+                select(chat_history.c.sources).where(chat_history.c.user_id == user_id).order_by(chat_history.c.id)
+            ).scalars()]
+        assert rows[0] == ["Cache Hit"] and rows[1] == ["Agent V3 (LangGraph)"]
+        assert rows[2][0]["hash"]
+        assert asyncio.run(dedupe_history_sources(engine)) == 0  # Đã ghi vào data_migrations
+    finally:
+        with engine.begin() as conn:
+            conn.execute(chat_history.delete().where(chat_history.c.user_id == user_id))
+            conn.execute(chat_sessions.delete().where(chat_sessions.c.user_id == user_id))
+            conn.execute(users.delete().where(users.c.id == user_id))
+        engine.dispose()
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+from app.core.config import settings
+from app.core.startup_profiler import PROJECT_ROOT, profile_imports
+
+# SDK nặng phải được import khi dùng, không phải lúc khởi động
+HEAVY_MODULES = ["torch", "sentence_transformers", "fastembed", "langgraph", "google.generativeai", "openai", "qdrant_client"]
+
+
+def test_import_app_main_within_budget():
+    wall, modules = profile_imports("app.main")
+    assert modules
+    assert wall <= settings.STARTUP_IMPORT_BUDGET, f"import app.main took {wall:.2f}s"
+
+
+def test_import_app_main_skips_heavy_modules():
+    # Process sạch: process pytest có thể đã import langgraph từ các test khác
+    code = (
+        "import sys, app.main; "
+        f"print('LOADED:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    loaded = proc.stdout.strip().splitlines()[-1]  # import app.main in cấu hình ra stdout trước đó
+    assert loaded == "LOADED:", loaded